@@ -19,20 +19,24 @@
 
 
 import os
+from typing import TYPE_CHECKING
 
-from qgis.gui import QgisInterface
-
-from .qgis_plugin_tools.infrastructure.debugging import setup_pydevd
+# The package is imported by the worker processes of MeshLoader that must not
+# import qgis, so nothing of qgis is imported here at module level
+if TYPE_CHECKING:
+    from qgis.gui import QgisInterface
 
 if os.environ.get("QGIS_PLUGIN_USE_DEBUGGER") == "pydevd":
     if (
         os.environ.get("IN_TESTS", "0") != "1"
         and os.environ.get("QGIS_PLUGIN_IN_CI", "0") != "1"
     ):
+        from .qgis_plugin_tools.infrastructure.debugging import setup_pydevd
+
         setup_pydevd()
 
 
-def classFactory(iface: QgisInterface):  # noqa N802
+def classFactory(iface: "QgisInterface"):  # noqa N802
     from .plugin import Plugin
 
     return Plugin()
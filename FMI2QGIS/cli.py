@@ -0,0 +1,152 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Command line interface for downloading FMI open data without the QGIS GUI.
+
+Run from the directory containing the plugin directory, e.g.
+python -m FMI2QGIS.cli fmi::forecast::enfuser::airquality::helsinki-metropolitan::grid
+-p starttime=2020-11-02T15:00:00Z -p endtime=2020-11-03T10:00:00Z
+-p bbox=24.97,60.2,24.99,60.21 -p param=AQIndex -o /data/fmi
+
+or with a JSON job file and four parallel jobs:
+python -m FMI2QGIS.cli --job-file nightly.json --jobs 4 -o /data/fmi
+
+Vector jobs are combined into GetFeature requests of multiple stored queries
+with --batch.
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from qgis.core import QgsApplication
+
+from .core.exceptions.loader_exceptions import InvalidParameterException
+from .core.headless import HeadlessRunner, Job, LoaderType, read_job_file
+from .definitions.configurable_settings import Settings
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="fmi2qgis", description="Download FMI open data with stored queries"
+    )
+    parser.add_argument("stored_query_id", nargs="?", help="id of the stored query")
+    parser.add_argument(
+        "-p",
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="value of a query parameter, can be given multiple times",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        default=Path.cwd(),
+        help="download directory, defaults to the working directory",
+    )
+    parser.add_argument(
+        "--loader",
+        choices=[loader_type.value for loader_type in LoaderType],
+        help="loader to use, defaults to the type of the stored query",
+    )
+    parser.add_argument("--max-features", type=int, help="maximum number of features")
+    parser.add_argument(
+        "--job-file",
+        action="append",
+        type=Path,
+        default=[],
+        help="JSON file with a list of jobs, can be given multiple times",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of jobs run in parallel"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="combine the stored queries of vector jobs into fewer requests",
+    )
+    parser.add_argument("--wfs-url", default=Settings.FMI_WFS_URL.get())
+    parser.add_argument("--wfs-version", default=Settings.FMI_WFS_VERSION.get())
+    parser.add_argument("--download-url", default=Settings.FMI_DOWNLOAD_URL.get())
+    args = parser.parse_args(argv)
+    if args.stored_query_id is None and not args.job_file:
+        parser.error("stored_query_id or --job-file is required")
+    return args
+
+
+def jobs_from_args(args: argparse.Namespace) -> List[Job]:
+    jobs: List[Job] = []
+    for job_file in args.job_file:
+        jobs += read_job_file(job_file, args.output_dir)
+    if args.stored_query_id is not None:
+        parameters: Dict[str, Any] = {}
+        for param in args.param:
+            name, separator, value = param.partition("=")
+            if not separator:
+                raise InvalidParameterException(
+                    f"Parameter {param} is not in form NAME=VALUE"
+                )
+            parameters[name.strip()] = value.strip()
+        jobs.append(
+            Job(
+                args.stored_query_id,
+                parameters,
+                args.output_dir,
+                LoaderType(args.loader) if args.loader else None,
+                args.max_features,
+            )
+        )
+    return jobs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs the jobs and prints a JSON line of the result of each job
+    :return: exit code, 1 if any of the jobs failed
+    """
+    qgs: Optional[QgsApplication] = None
+    if QgsApplication.instance() is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        qgs = QgsApplication([], False)
+        qgs.initQgis()
+    try:
+        args = parse_args(argv)
+        try:
+            jobs = jobs_from_args(args)
+        except (InvalidParameterException, OSError, ValueError) as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        runner = HeadlessRunner(args.wfs_url, args.wfs_version, args.download_url)
+        results = runner.run_all(jobs, args.jobs, args.batch)
+        for result in results:
+            print(json.dumps(result.to_dict()))
+        return 0 if all(result.success for result in results) else 1
+    finally:
+        if qgs is not None:
+            qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,519 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import base64
+import functools
+import shutil
+import socket
+from email.message import Message
+from email.parser import Parser
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import SplitResult, unquote, urljoin, urlsplit, urlunsplit
+
+from ..definitions.configurable_settings import Settings
+from ..qgis_plugin_tools.tools.custom_logging import bar_msg
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ..qgis_plugin_tools.tools.i18n import tr
+from .downloads import (
+    CHUNK_SIZE,
+    DEFAULT_TIMEOUT,
+    PARTIAL_SUFFIX,
+    ProgressCallback,
+    default_file_name,
+    proxy_url,
+    ssl_context,
+)
+from .exceptions.loader_exceptions import DownloadCanceledException
+
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+USER_AGENT = "FMI2QGIS"
+NETWORK_ERRORS = (OSError, EOFError, asyncio.TimeoutError, ValueError)
+
+# Called with the name of the file, the number of downloaded bytes and the total
+NamedProgressCallback = Callable[[str, int, Optional[int]], None]
+
+T = TypeVar("T")
+
+
+class Response:
+    """
+    Status and headers of a HTTP response whose body is not read yet
+    """
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        reason: str,
+        headers: Message,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        timeout: float,
+    ) -> None:
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+
+    @property
+    def is_chunked(self) -> bool:
+        return "chunked" in self.headers.get("Transfer-Encoding", "").lower()
+
+    @property
+    def content_length(self) -> Optional[int]:
+        content_length = self.headers.get("Content-Length")
+        if self.is_chunked or not content_length:
+            return None
+        return int(content_length)
+
+    def close(self) -> None:
+        self._writer.close()
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks(CHUNK_SIZE)])
+
+    async def iter_chunks(self, chunk_size: int) -> AsyncIterator[bytes]:
+        """
+        Reads the body in chunks of at most chunk_size bytes
+        """
+        try:
+            if self.is_chunked:
+                while True:
+                    size_line = await self._wait(self._reader.readline())
+                    size = int(size_line.split(b";")[0].strip(), 16)
+                    if size == 0:
+                        # Trailer headers end with an empty line
+                        while (await self._wait(self._reader.readline())).strip():
+                            pass
+                        return
+                    while size > 0:
+                        chunk = await self._wait(
+                            self._reader.readexactly(min(size, chunk_size))
+                        )
+                        size -= len(chunk)
+                        yield chunk
+                    await self._wait(self._reader.readline())
+            elif self.content_length is not None:
+                remaining = self.content_length
+                while remaining > 0:
+                    chunk = await self._wait(
+                        self._reader.readexactly(min(remaining, chunk_size))
+                    )
+                    remaining -= len(chunk)
+                    yield chunk
+            else:
+                while True:
+                    chunk = await self._wait(self._reader.read(chunk_size))
+                    if not chunk:
+                        return
+                    yield chunk
+        except NETWORK_ERRORS as e:
+            raise QgsPluginNetworkException(tr("Request failed"), bar_msg=bar_msg(e))
+
+    async def _wait(self, awaitable: Awaitable[T]) -> T:
+        return await asyncio.wait_for(awaitable, self._timeout)
+
+
+class AsyncDownloader:
+    """
+    Makes many HTTP requests concurrently on a single asyncio event loop
+    without Qt networking. The number of simultaneously open connections is
+    limited, so hundreds of small requests need neither hundreds of threads
+    nor hundreds of connections.
+
+    The synchronous wrappers run an event loop of their own in the calling
+    thread, e.g. in the thread of a QgsTask. An instance runs one event loop
+    at a time.
+
+    The requests go through the HTTP proxy resolved by downloads.proxy_url:
+    plain HTTP requests are sent to the proxy with the absolute url and HTTPS
+    requests are tunneled with CONNECT. Other proxy types fail the request
+    instead of connecting directly. HTTPS connections trust the CAs of the
+    QGIS authentication manager.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        """
+        :param max_connections: maximum number of simultaneously open
+            connections, defaults to the setting MAX_CONCURRENT_REQUESTS
+        :param timeout: timeout of the connection and each read in seconds
+        :param chunk_size: size of the chunks written to the files in bytes
+        """
+        self.max_connections = (
+            max_connections or Settings.MAX_CONCURRENT_REQUESTS.get(int)
+        )
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self._ssl_context = ssl_context()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """
+        Runs the coroutine to completion in a new event loop
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            self._semaphore = None
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            self._semaphore = None
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def fetch_all(self, urls: Sequence[str]) -> List[bytes]:
+        """
+        :return: bodies of the responses in the order of the urls
+        :raises QgsPluginNetworkException: if any of the requests fails
+        """
+        return self.run(gather_or_cancel(*(self.fetch(url) for url in urls)))
+
+    def download_all(
+        self,
+        uris: Dict[str, str],
+        output_dir: Path,
+        progress: Optional[NamedProgressCallback] = None,
+        is_canceled: Optional[Callable[[], bool]] = None,
+    ) -> Dict[str, Path]:
+        """
+        Streams the files concurrently to the disk. If one of the downloads
+        fails, the others are canceled and the downloaded files are removed.
+
+        :param uris: urls by the names of the output files
+        :param output_dir: directory of the output files
+        :param progress: called after every chunk of every file
+        :param is_canceled: polled after every chunk
+        :return: paths of the downloaded files by the names of the output files
+        """
+        return self.run(self._download_all(uris, output_dir, progress, is_canceled))
+
+    async def fetch(
+        self, url: str, data: Optional[bytes] = None, content_type: str = "text/xml"
+    ) -> bytes:
+        """
+        :param data: body of a POST request, GET is used if None
+        :return: body of the response
+        """
+        async with self._limit:
+            response = await self.open(url, data, content_type)
+            try:
+                return await response.read()
+            finally:
+                response.close()
+
+    async def download(
+        self,
+        url: str,
+        output_dir: Path,
+        output_name: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        is_canceled: Optional[Callable[[], bool]] = None,
+    ) -> Path:
+        """
+        Streams the response to a partial file that is renamed when the
+        download is complete, like downloads.stream_to_file
+        :return: path to the downloaded file
+        :raises DownloadCanceledException: if the download was canceled
+        """
+        async with self._limit:
+            response = await self.open(url)
+            try:
+                output = Path(
+                    output_dir,
+                    output_name or default_file_name(response.url, response.headers),
+                )
+                partial = output.with_name(output.name + PARTIAL_SUFFIX)
+                num_of_bytes = 0
+                try:
+                    with open(partial, "wb") as f:
+                        async for chunk in response.iter_chunks(self.chunk_size):
+                            if is_canceled is not None and is_canceled():
+                                raise DownloadCanceledException(
+                                    tr("Download was canceled")
+                                )
+                            f.write(chunk)
+                            num_of_bytes += len(chunk)
+                            if progress is not None:
+                                progress(num_of_bytes, response.content_length)
+                except BaseException:
+                    if partial.exists():
+                        partial.unlink()
+                    raise
+            finally:
+                response.close()
+        shutil.move(str(partial), str(output))
+        return output
+
+    async def open(
+        self, url: str, data: Optional[bytes] = None, content_type: str = "text/xml"
+    ) -> Response:
+        """
+        Sends the request and reads the status and headers of the response.
+        Redirects are followed.
+        :raises QgsPluginNetworkException: if the request fails
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._request(url, data, content_type)
+            location = response.headers.get("Location")
+            if response.status in REDIRECT_CODES and location:
+                response.close()
+                url = urljoin(url, location)
+                if response.status in (301, 302, 303):
+                    data = None
+                continue
+            if response.status >= 400:
+                try:
+                    body = (await response.read()).decode("utf-8", "replace")
+                finally:
+                    response.close()
+                details = f"{response.status} {response.reason}: {body}"
+                raise QgsPluginNetworkException(
+                    tr("Request failed with status code {}", response.status),
+                    bar_msg=bar_msg(details),
+                )
+            return response
+        raise QgsPluginNetworkException(tr("Too many redirects"), bar_msg=bar_msg(url))
+
+    @property
+    def _limit(self) -> asyncio.Semaphore:
+        # Created lazily, since the semaphore is bound to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._semaphore
+
+    async def _request(
+        self, url: str, data: Optional[bytes], content_type: str
+    ) -> Response:
+        parts = urlsplit(url)
+        is_https = parts.scheme == "https"
+        host = parts.netloc.rpartition("@")[2]
+        proxy = proxy_url(url)
+        proxy_parts = urlsplit(proxy) if proxy else None
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        proxy_headers: List[str] = []
+        if proxy_parts is not None and not is_https:
+            # The proxy forwards plain HTTP requests with the absolute url
+            target = urlunsplit(
+                (parts.scheme, host, parts.path or "/", parts.query, "")
+            )
+            proxy_headers = _proxy_headers(proxy_parts)
+        lines = [
+            f"{'GET' if data is None else 'POST'} {target} HTTP/1.1",
+            f"Host: {host}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept-Encoding: identity",
+            "Connection: close",
+            *proxy_headers,
+        ]
+        if data is not None:
+            lines += [f"Content-Type: {content_type}", f"Content-Length: {len(data)}"]
+
+        writer: Optional[asyncio.StreamWriter] = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                self._connect(parts, proxy_parts), self.timeout
+            )
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            if data is not None:
+                writer.write(data)
+            await asyncio.wait_for(writer.drain(), self.timeout)
+
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            _, status, *reason = status_line.decode("latin-1").split(" ", 2)
+            header_lines: List[str] = []
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not line.strip():
+                    break
+                header_lines.append(line.decode("latin-1"))
+            headers = Parser().parsestr("".join(header_lines), headersonly=True)
+            return Response(
+                url,
+                int(status),
+                reason[0].strip() if reason else "",
+                headers,
+                reader,
+                writer,
+                self.timeout,
+            )
+        except NETWORK_ERRORS as e:
+            if writer is not None:
+                writer.close()
+            raise QgsPluginNetworkException(tr("Request failed"), bar_msg=bar_msg(e))
+
+    async def _connect(
+        self, parts: SplitResult, proxy_parts: Optional[SplitResult]
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Opens a connection to the host of the url directly or through the proxy
+        """
+        is_https = parts.scheme == "https"
+        port = parts.port or (443 if is_https else 80)
+        context = self._ssl_context if is_https else None
+        if proxy_parts is None:
+            return await asyncio.open_connection(parts.hostname, port, ssl=context)
+        proxy_address = (proxy_parts.hostname, proxy_parts.port or 80)
+        if not is_https:
+            return await asyncio.open_connection(*proxy_address)
+        sock = await _tunnel(
+            proxy_address, f"{parts.hostname}:{port}", _proxy_headers(proxy_parts)
+        )
+        return await asyncio.open_connection(
+            sock=sock, ssl=context, server_hostname=parts.hostname
+        )
+
+    async def _download_all(
+        self,
+        uris: Dict[str, str],
+        output_dir: Path,
+        progress: Optional[NamedProgressCallback],
+        is_canceled: Optional[Callable[[], bool]],
+    ) -> Dict[str, Path]:
+        names = list(uris)
+        try:
+            paths = await gather_or_cancel(
+                *(
+                    self.download(
+                        uris[name],
+                        output_dir,
+                        name,
+                        functools.partial(progress, name) if progress else None,
+                        is_canceled,
+                    )
+                    for name in names
+                )
+            )
+        except BaseException:
+            for name in names:
+                path = Path(output_dir, name)
+                if path.exists():
+                    path.unlink()
+            raise
+        return dict(zip(names, paths))
+
+
+def _proxy_headers(proxy_parts: Optional[SplitResult]) -> List[str]:
+    """
+    :return: Proxy-Authorization header of the credentials of the proxy url
+    """
+    if proxy_parts is None or not proxy_parts.username:
+        return []
+    credentials = (
+        f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+    )
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return [f"Proxy-Authorization: Basic {token}"]
+
+
+async def _tunnel(
+    proxy_address: Tuple[str, int], authority: str, headers: List[str]
+) -> socket.socket:
+    """
+    Opens a tunnel through the proxy with CONNECT. The proxy sends nothing
+    after its response before the TLS handshake, so the response can be read
+    from the socket before handing it over to the TLS connection.
+
+    :param proxy_address: host and port of the proxy
+    :param authority: host:port of the tunneled connection
+    :param headers: additional headers of the CONNECT request
+    :return: connected non-blocking socket
+    """
+    loop = asyncio.get_event_loop()
+    infos = await loop.getaddrinfo(*proxy_address, type=socket.SOCK_STREAM)
+    error: Optional[OSError] = None
+    for family, sock_type, proto, _, address in infos:
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+        except OSError as e:
+            sock.close()
+            error = e
+            continue
+        try:
+            await _connect_tunnel(loop, sock, authority, headers)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    raise error or OSError(f"Could not resolve {proxy_address[0]}")
+
+
+async def _connect_tunnel(
+    loop: asyncio.AbstractEventLoop,
+    sock: socket.socket,
+    authority: str,
+    headers: List[str],
+) -> None:
+    """
+    Sends the CONNECT request and reads the response of the proxy
+    :raises QgsPluginNetworkException: if the proxy refuses the tunnel
+    """
+    lines = [f"CONNECT {authority} HTTP/1.1", f"Host: {authority}", *headers]
+    await loop.sock_sendall(sock, ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    response = b""
+    while b"\r\n\r\n" not in response:
+        chunk = await loop.sock_recv(sock, 1024)
+        if not chunk:
+            raise EOFError("The proxy closed the connection")
+        response += chunk
+    status_line = response.split(b"\r\n", 1)[0].decode("latin-1")
+    status = status_line.split(" ", 2)
+    if len(status) < 2 or status[1] != "200":
+        raise QgsPluginNetworkException(
+            tr("Proxy tunnel to {} failed", authority), bar_msg=bar_msg(status_line)
+        )
+
+
+async def gather_or_cancel(*coroutines: Awaitable[Any]) -> List[Any]:
+    """
+    Like asyncio.gather, but the other coroutines are canceled as soon as one
+    of them fails, so the first exception is the cause of the failure
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -38,3 +38,7 @@ class WfsException(QgsPluginException):
 
 class WMSException(QgsPluginException):
     pass
+
+
+class DownloadCanceledException(QgsPluginException):
+    pass
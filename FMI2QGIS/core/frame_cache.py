@@ -0,0 +1,232 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from qgis.core import (
+    QgsDateTimeRange,
+    QgsMapLayer,
+    QgsMapRendererParallelJob,
+    QgsMapSettings,
+    QgsRasterLayer,
+)
+from qgis.PyQt.QtCore import QObject
+from qgis.PyQt.QtGui import QImage
+
+from ..qgis_plugin_tools.tools.raster_layers import set_band_based_on_range
+from .grid.time_index import TimeBandIndex, set_raster_band
+
+FrameKey = Tuple[Hashable, ...]
+
+
+class LayerRevisions:
+    """
+    Revision counters of layers, increased whenever the data, the data source
+    or the renderer of a layer changes, e.g. when a refresh updates the data
+    of the layer in place
+    """
+
+    def __init__(self) -> None:
+        self._revisions: Dict[str, int] = {}
+
+    def revision(self, layer: QgsMapLayer) -> int:
+        layer_id = layer.id()
+        if layer_id not in self._revisions:
+            self._revisions[layer_id] = 0
+            for signal in (
+                layer.dataChanged,
+                layer.dataSourceChanged,
+                layer.rendererChanged,
+                layer.styleChanged,
+            ):
+                # noinspection PyUnresolvedReferences
+                signal.connect(lambda layer_id=layer_id: self._increase(layer_id))
+        return self._revisions[layer_id]
+
+    def _increase(self, layer_id: str) -> None:
+        self._revisions[layer_id] += 1
+
+
+class FrameCache:
+    """
+    Least recently used cache of rendered map frames with a memory budget
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.num_of_bytes = 0
+        self.revisions = LayerRevisions()
+        self._images: "OrderedDict[FrameKey, QImage]" = OrderedDict()
+
+    def __contains__(self, key: FrameKey) -> bool:
+        return key in self._images
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get(self, key: FrameKey) -> Optional[QImage]:
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+        return image
+
+    def put(self, key: FrameKey, image: QImage) -> None:
+        size = self._size_of(image)
+        if size > self.max_bytes:
+            return
+        if key in self._images:
+            self.num_of_bytes -= self._size_of(self._images.pop(key))
+        self._images[key] = image
+        self.num_of_bytes += size
+        while self.num_of_bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self.num_of_bytes -= self._size_of(evicted)
+
+    def clear(self) -> None:
+        self._images.clear()
+        self.num_of_bytes = 0
+
+    @staticmethod
+    def _size_of(image: QImage) -> int:
+        try:
+            return image.sizeInBytes()
+        except AttributeError:  # Qt < 5.10
+            return image.byteCount()
+
+
+def frame_key(
+    settings: QgsMapSettings, t_range: QgsDateTimeRange, revisions: LayerRevisions
+) -> FrameKey:
+    """
+    :return: Key identifying the frame rendered with the settings in the time range
+        with the current styles and data of the layers
+    """
+    size = settings.outputSize()
+    return (
+        settings.visibleExtent().toString(),
+        settings.destinationCrs().authid(),
+        size.width(),
+        size.height(),
+        tuple(
+            (
+                layer.id(),
+                layer.styleManager().currentStyle(),
+                revisions.revision(layer),
+            )
+            for layer in settings.layers()
+        ),
+        t_range.begin().toString("yyyy-MM-ddTHH:mm:ss"),
+        t_range.end().toString("yyyy-MM-ddTHH:mm:ss"),
+    )
+
+
+class FramePrerenderer(QObject):
+    """
+    Renders upcoming temporal frames in background threads into a FrameCache
+    """
+
+    def __init__(self, cache: FrameCache, max_jobs: int = 2) -> None:
+        super().__init__()
+        self.cache = cache
+        self.max_jobs = max_jobs
+        # Jobs and the cloned layers they render, the clones have to stay alive
+        self.jobs: Dict[FrameKey, Tuple[QgsMapRendererParallelJob, List]] = {}
+
+    def prerender(
+        self,
+        settings: QgsMapSettings,
+        t_ranges: List[QgsDateTimeRange],
+        manually_temporal_layers: Dict[str, Optional[TimeBandIndex]],
+    ) -> None:
+        """
+        Starts rendering the frames of the time ranges that are not cached yet
+        :param settings: map settings of the canvas
+        :param t_ranges: time ranges of the upcoming frames
+        :param manually_temporal_layers: time band indices of the layers whose
+            band is switched by the plugin
+        """
+        for t_range in t_ranges:
+            if len(self.jobs) >= self.max_jobs:
+                break
+            key = frame_key(settings, t_range, self.cache.revisions)
+            if key in self.cache or key in self.jobs:
+                continue
+
+            frame_settings = QgsMapSettings(settings)
+            frame_settings.setIsTemporal(True)
+            frame_settings.setTemporalRange(t_range)
+            layers = self._frame_layers(
+                settings.layers(), t_range, manually_temporal_layers
+            )
+            frame_settings.setLayers(layers)
+
+            job = QgsMapRendererParallelJob(frame_settings)
+            # noinspection PyUnresolvedReferences
+            job.finished.connect(lambda key=key: self._job_finished(key))
+            self.jobs[key] = (job, layers)
+            job.start()
+
+    def cancel(self) -> None:
+        for job, _ in self.jobs.values():
+            job.cancelWithoutBlocking()
+        self.jobs.clear()
+
+    def _job_finished(self, key: FrameKey) -> None:
+        job_and_layers = self.jobs.pop(key, None)
+        if job_and_layers is None:
+            # Cancelled
+            return
+        job, _ = job_and_layers
+        if not job.errors():
+            self.cache.put(key, job.renderedImage())
+
+    @staticmethod
+    def _frame_layers(
+        layers: List[QgsMapLayer],
+        t_range: QgsDateTimeRange,
+        manually_temporal_layers: Dict[str, Optional[TimeBandIndex]],
+    ) -> List[QgsMapLayer]:
+        """
+        :return: layers of the frame where manually temporal layers are replaced
+            with clones showing the band of the time range
+        """
+        begin = t_range.begin().toPyDateTime()
+        end = t_range.end().toPyDateTime()
+        frame_layers = []
+        for layer in layers:
+            if layer.id() not in manually_temporal_layers or not isinstance(
+                layer, QgsRasterLayer
+            ):
+                frame_layers.append(layer)
+                continue
+            index = manually_temporal_layers[layer.id()]
+            if index is None:
+                clone = layer.clone()
+                set_band_based_on_range(clone, t_range)
+                frame_layers.append(clone)
+                continue
+            band = index.band_for_range(begin, end)
+            if band is not None:
+                clone = layer.clone()
+                set_raster_band(clone, band)
+                frame_layers.append(clone)
+            else:
+                frame_layers.append(layer)
+        return frame_layers
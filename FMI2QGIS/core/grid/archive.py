@@ -0,0 +1,211 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+from .cache import GridCache, GridCacheEntry
+from .time_index import times_from_values
+
+ARCHIVE_INDEX_NAME = "archive_catalog.json"
+ARCHIVE_CREATION_OPTIONS = ["FORMAT=NC4"]
+COMPRESSION_OPTIONS = ["COMPRESS=DEFLATE", "ZLEVEL=4"]
+SPATIAL_CHUNK_SIZE = 32
+MAX_TIME_CHUNK_SIZE = 256
+
+
+class GridArchive(GridCache):
+    """
+    Catalog of forecast runs stored as chunked and compressed NetCDF4 files.
+    The chunks span the whole time dimension of a small spatial window, so
+    time series and small windows are read from a few chunks only.
+    """
+
+    INDEX_NAME = ARCHIVE_INDEX_NAME
+
+    def __init__(self, archive_dir: Path) -> None:
+        if not archive_dir.exists():
+            archive_dir.mkdir(parents=True)
+        super().__init__(archive_dir)
+
+    def archive(self, entry: GridCacheEntry) -> GridCacheEntry:
+        """
+        Rechunks the grid of the entry into the archive and adds it to the catalog
+        :return: catalog entry of the archived grid
+        """
+        assert entry.path is not None
+        output = Path(self.cache_dir, f"{entry.producer}_{entry.key}.nc")
+        rechunk(entry.path, output)
+        archived = GridCacheEntry.from_dict(entry.to_dict())
+        archived.path = output
+        self.add(archived)
+        return archived
+
+    def archived(self, entry: GridCacheEntry) -> Optional[GridCacheEntry]:
+        """
+        :param entry: downloaded grid
+        :return: archived copy of the grid or None if it is not archived
+        """
+        key = entry.key
+        for archived in self.entries:
+            if (
+                archived.key == key
+                and archived.path is not None
+                and archived.path.is_file()
+            ):
+                return archived
+        return None
+
+    def runs(self, producer: str) -> List[GridCacheEntry]:
+        """
+        :return: archived runs of the producer ordered by origin and start time
+        """
+        return sorted(
+            (entry for entry in self.entries if entry.producer == producer),
+            key=lambda e: (e.origin_time or "", e.start_time),
+        )
+
+
+def rechunk(src: Path, dst: Path) -> None:
+    """
+    Copies the NetCDF file into compressed NetCDF4 with time-friendly chunks
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(src), gdal.OF_MULTIDIM_RASTER)
+        result = gdal.MultiDimTranslate(
+            str(dst),
+            ds,
+            format="netCDF",
+            creationOptions=creation_options(ds.GetRootGroup()),
+        )
+        if result is None:
+            raise RuntimeError(f"Could not archive {src}")
+        result = None  # noqa: F841
+    finally:
+        ds = None
+
+
+def creation_options(
+    root: gdal.Group, time_chunk_size: Optional[int] = None
+) -> List[str]:
+    """
+    :param root: root group of the source
+    :param time_chunk_size: size of the chunks along the time dimension,
+        defaults to the whole dimension up to MAX_TIME_CHUNK_SIZE
+    :return: NetCDF creation options of compressed NetCDF4 with time-friendly
+        chunks
+    """
+    options = list(ARCHIVE_CREATION_OPTIONS)
+    for name in root.GetMDArrayNames():
+        array: gdal.MDArray = root.OpenMDArray(name)
+        prefix = f"ARRAY:IF(NAME={name}):"
+        options += [prefix + option for option in COMPRESSION_OPTIONS]
+        block_size = _block_size(array, time_chunk_size)
+        if block_size is not None:
+            options.append(prefix + "BLOCKSIZE=" + ",".join(map(str, block_size)))
+    return options
+
+
+def read_point_series(
+    entry: GridCacheEntry, param: str, x: float, y: float
+) -> Tuple[List[datetime.datetime], np.ndarray]:
+    """
+    Reads the time series of the grid cell nearest to the point. Only the
+    chunks containing the cell are read.
+
+    :param entry: archived grid
+    :param param: FMI parameter name of the variable
+    :param x: longitude of the point
+    :param y: latitude of the point
+    :return: times and float64 values of the series, NaN for nodata
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(entry.path), gdal.OF_MULTIDIM_RASTER)
+        root: gdal.Group = ds.GetRootGroup()
+        array: gdal.MDArray = root.OpenMDArray(entry.variables.get(param, param))
+        start = []
+        count = []
+        times: List[datetime.datetime] = []
+        for dim in array.GetDimensions():
+            indexing_variable = dim.GetIndexingVariable()
+            dim_type = dim.GetType()
+            name = dim.GetName().lower()
+            if dim_type == "HORIZONTAL_X" or name in ("lon", "longitude", "x"):
+                start.append(_nearest_index(indexing_variable, x))
+                count.append(1)
+            elif dim_type == "HORIZONTAL_Y" or name in ("lat", "latitude", "y"):
+                start.append(_nearest_index(indexing_variable, y))
+                count.append(1)
+            else:
+                if dim_type == "TEMPORAL" or name.startswith("time"):
+                    times = times_from_values(
+                        indexing_variable.ReadAsArray(), indexing_variable.GetUnit()
+                    )
+                start.append(0)
+                count.append(dim.GetSize())
+        values = array.ReadAsArray(array_start_idx=start, count=count)
+        values = values.reshape(-1).astype(np.float64)
+        nodata = array.GetNoDataValueAsDouble()
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        scale = array.GetScale()
+        offset = array.GetOffset()
+        if scale is not None:
+            values *= scale
+        if offset is not None:
+            values += offset
+        return times, values
+    finally:
+        ds = None
+
+
+def _block_size(
+    array: gdal.MDArray, time_chunk_size: Optional[int] = None
+) -> Optional[List[int]]:
+    """
+    :return: Chunk spanning the time dimension and a small spatial window, or
+        None for coordinate variables
+    """
+    dims = array.GetDimensions()
+    if len(dims) < 3:
+        return None
+    block_size = []
+    for i, dim in enumerate(dims):
+        size = dim.GetSize()
+        if i >= len(dims) - 2:
+            block_size.append(min(size, SPATIAL_CHUNK_SIZE))
+        elif dim.GetType() == "TEMPORAL" or dim.GetName().lower().startswith("time"):
+            block_size.append(
+                time_chunk_size
+                if time_chunk_size is not None
+                else min(size, MAX_TIME_CHUNK_SIZE)
+            )
+        else:
+            block_size.append(1)
+    return block_size
+
+
+def _nearest_index(indexing_variable: gdal.MDArray, value: float) -> int:
+    return int(np.abs(indexing_variable.ReadAsArray() - value).argmin())
@@ -0,0 +1,80 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+DEFAULT_BLOCK_SIZE = 32 * 1024 ** 2  # bytes
+
+
+def block_rows(
+    ds: gdal.Dataset, num_of_bands: int, max_bytes: int = DEFAULT_BLOCK_SIZE
+) -> int:
+    """
+    :return: number of full width rows of all bands that fit into max_bytes
+        as the float64 arrays of read_block
+    """
+    item_size = np.dtype(np.float64).itemsize
+    return max(1, max_bytes // max(num_of_bands * ds.RasterXSize * item_size, 1))
+
+
+def iter_blocks(
+    ds: gdal.Dataset,
+    bands: Optional[Sequence[int]] = None,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Reads the dataset in full width row blocks containing all the bands
+    :param ds: GDAL dataset
+    :param bands: bands to read, defaults to all
+    :param max_bytes: maximum size of a block
+    :return: iterator of row offsets and float64 arrays shaped (bands, rows, cols)
+        with nodata values replaced by NaN
+    """
+    bands = list(range(1, ds.RasterCount + 1)) if bands is None else list(bands)
+    rows = block_rows(ds, len(bands), max_bytes)
+    for y_off in range(0, ds.RasterYSize, rows):
+        yield y_off, read_block(ds, y_off, min(rows, ds.RasterYSize - y_off), bands)
+
+
+def read_block(
+    ds: gdal.Dataset, y_off: int, y_size: int, bands: Optional[Sequence[int]] = None
+) -> np.ndarray:
+    """
+    Reads full width rows of the bands
+    :return: float64 array shaped (bands, rows, cols) with nodata values
+        replaced by NaN and the scale and offset of the bands applied
+    """
+    bands = list(range(1, ds.RasterCount + 1)) if bands is None else list(bands)
+    data = np.empty((len(bands), y_size, ds.RasterXSize), dtype=np.float64)
+    for i, b in enumerate(bands):
+        band: gdal.Band = ds.GetRasterBand(b)
+        data[i] = band.ReadAsArray(0, y_off, ds.RasterXSize, y_size)
+        nodata = band.GetNoDataValue()
+        if nodata is not None:
+            data[i][data[i] == nodata] = np.nan
+        scale = band.GetScale()
+        offset = band.GetOffset()
+        if scale is not None:
+            data[i] *= scale
+        if offset is not None:
+            data[i] += offset
+    return data
@@ -0,0 +1,350 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+from ..wfs import Parameter, StoredQuery
+from .time_index import times_from_values, values_from_times
+
+CACHE_INDEX_NAME = "grid_cache.json"
+GEOGRAPHIC_PROJECTIONS = (None, "EPSG:4326")
+# Parameters that define the coverage instead of the content of the grid
+COVERAGE_PARAMETERS = ("bbox", "starttime", "endtime", "origintime")
+X_DIMENSION_NAMES = ("lon", "longitude", "x")
+Y_DIMENSION_NAMES = ("lat", "latitude", "y")
+TIME_DIMENSION_NAMES = ("time", "time_h")
+ORIGIN_TIME_STANDARD_NAME = "forecast_reference_time"
+
+BBox = Tuple[float, float, float, float]
+
+_index_lock = threading.Lock()
+
+
+class GridCacheEntry:
+    """
+    Coverage of a downloaded grid, or of a requested grid
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        producer: str,
+        params: Sequence[str],
+        bbox: BBox,
+        start_time: datetime.datetime,
+        end_time: datetime.datetime,
+        origin_time: Optional[str],
+        parameters: Dict[str, str],
+        variables: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        :param path: path to the NetCDF file, None for requests
+        :param producer: FMI producer
+        :param params: FMI parameter names of the variables
+        :param bbox: xmin, ymin, xmax, ymax
+        :param origin_time: origin time of the forecast run, None for requests
+            of the latest run and for grids whose run is not known
+        :param parameters: other query parameters, such as timestep or levels
+        :param variables: NetCDF variable names of the FMI parameters
+        """
+        self.path = path
+        self.producer = producer
+        self.params = list(params)
+        self.bbox = bbox
+        self.start_time = start_time
+        self.end_time = end_time
+        self.origin_time = origin_time
+        self.parameters = parameters
+        self.variables = variables if variables is not None else {}
+
+    def covers(self, request: "GridCacheEntry") -> bool:
+        """
+        :return: Whether the request can be answered by a subset of this grid
+        """
+        return (
+            # A newer run may have been published after the grid was cached,
+            # so requests of the latest run are looked up only after the run
+            # has been resolved
+            request.origin_time is not None
+            and self.producer == request.producer
+            and self.origin_time == request.origin_time
+            and self.parameters == request.parameters
+            and set(request.params).issubset(self.params)
+            and (
+                not self.variables
+                or all(param in self.variables for param in request.params)
+            )
+            and self.bbox[0] <= request.bbox[0]
+            and self.bbox[1] <= request.bbox[1]
+            and self.bbox[2] >= request.bbox[2]
+            and self.bbox[3] >= request.bbox[3]
+            and self.start_time <= request.start_time
+            and self.end_time >= request.end_time
+        )
+
+    @property
+    def key(self) -> str:
+        """
+        :return: Stable hash of the coverage
+        """
+        request = self.to_dict()
+        request.pop("path")
+        request.pop("variables")
+        return hashlib.md5(
+            json.dumps(request, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path) if self.path is not None else None,
+            "producer": self.producer,
+            "params": self.params,
+            "bbox": list(self.bbox),
+            "start_time": self.start_time.strftime(Parameter.TIME_FORMAT),
+            "end_time": self.end_time.strftime(Parameter.TIME_FORMAT),
+            "origin_time": self.origin_time,
+            "parameters": self.parameters,
+            "variables": self.variables,
+        }
+
+    @staticmethod
+    def from_dict(entry: Dict[str, Any]) -> "GridCacheEntry":
+        return GridCacheEntry(
+            Path(entry["path"]) if entry["path"] is not None else None,
+            entry["producer"],
+            entry["params"],
+            tuple(entry["bbox"]),  # type: ignore
+            datetime.datetime.strptime(entry["start_time"], Parameter.TIME_FORMAT),
+            datetime.datetime.strptime(entry["end_time"], Parameter.TIME_FORMAT),
+            entry["origin_time"],
+            entry["parameters"],
+            entry["variables"],
+        )
+
+    @staticmethod
+    def from_stored_query(
+        sq: StoredQuery, path: Optional[Path] = None
+    ) -> Optional["GridCacheEntry"]:
+        """
+        :return: Coverage of the grid requested with the stored query or None if
+            the query does not define a geographic bbox and a time range
+        """
+        values = {
+            name: str(param.value)
+            for name, param in sq.parameters.items()
+            if param.value is not None
+        }
+        if values.get("projection") not in GEOGRAPHIC_PROJECTIONS:
+            return None
+        try:
+            bbox: BBox = tuple(  # type: ignore
+                float(value) for value in values["bbox"].split(",")[:4]
+            )
+            start_time = datetime.datetime.strptime(
+                values["starttime"], Parameter.TIME_FORMAT
+            )
+            end_time = datetime.datetime.strptime(
+                values["endtime"], Parameter.TIME_FORMAT
+            )
+        except (KeyError, ValueError):
+            return None
+        if len(bbox) != 4:
+            return None
+
+        # RasterLoader uses the start time as origin time for level queries
+        origin_time = values.get(
+            "origintime", values["starttime"] if "levels" in values else None
+        )
+        variable_params = [
+            name for name, param in sq.parameters.items() if param.has_variables()
+        ]
+        params = (
+            values.get(variable_params[0], "").split(",") if variable_params else []
+        )
+        parameters = {
+            name: value
+            for name, value in values.items()
+            if name not in COVERAGE_PARAMETERS and name not in variable_params
+        }
+        parameters.setdefault("format", sq.format)
+        return GridCacheEntry(
+            path,
+            sq.producer,
+            [param for param in params if param],
+            bbox,
+            start_time,
+            end_time,
+            origin_time,
+            parameters,
+        )
+
+
+class GridCache:
+    """
+    Index of the downloaded grids stored in a JSON file next to the grids
+    """
+
+    INDEX_NAME = CACHE_INDEX_NAME
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.index_file = Path(cache_dir, self.INDEX_NAME)
+
+    @property
+    def entries(self) -> List[GridCacheEntry]:
+        with _index_lock:
+            return self._read_entries()
+
+    def add(self, entry: GridCacheEntry) -> None:
+        with _index_lock:
+            entries = [e for e in self._read_entries() if e.path != entry.path]
+            entries.append(entry)
+            self._write_entries(entries)
+
+    def find(self, request: GridCacheEntry) -> Optional[GridCacheEntry]:
+        """
+        :return: Entry covering the request or None
+        """
+        for entry in self.entries:
+            if (
+                entry.path is not None
+                and entry.path.is_file()
+                and entry.covers(request)
+            ):
+                return entry
+        return None
+
+    def subset(self, entry: GridCacheEntry, request: GridCacheEntry) -> Path:
+        """
+        Writes the subset of the cached grid covering the request
+        :return: Path to the subset NetCDF file
+        """
+        output = Path(self.cache_dir, f"{entry.path.stem}_{request.key}.nc")
+        if not output.exists():
+            subset_grid(entry, request, output)
+        return output
+
+    def _read_entries(self) -> List[GridCacheEntry]:
+        if not self.index_file.exists():
+            return []
+        try:
+            with open(self.index_file) as f:
+                return [GridCacheEntry.from_dict(e) for e in json.load(f)]
+        except (ValueError, KeyError):
+            # Corrupted index, start over
+            return []
+
+    def _write_entries(self, entries: List[GridCacheEntry]) -> None:
+        tmp_file = self.index_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump([e.to_dict() for e in entries], f, indent=2)
+        tmp_file.replace(self.index_file)
+
+
+def read_origin_time(path: Path) -> Optional[str]:
+    """
+    Reads the origin time of the forecast run from the CF forecast reference
+    time variable of the NetCDF file
+    :return: origin time formatted like the origintime parameter or None
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(path), gdal.OF_MULTIDIM_RASTER)
+        if ds is None:
+            return None
+        root: gdal.Group = ds.GetRootGroup()
+        for name in root.GetMDArrayNames():
+            array: gdal.MDArray = root.OpenMDArray(name)
+            attributes = {a.GetName(): a.Read() for a in array.GetAttributes()}
+            if attributes.get("standard_name") != ORIGIN_TIME_STANDARD_NAME:
+                continue
+            values = np.asarray(array.ReadAsArray(), dtype=float).ravel()[:1]
+            units = str(attributes.get("units", ""))
+            if len(values) and " since " in units:
+                return times_from_values(values, units)[0].strftime(
+                    Parameter.TIME_FORMAT
+                )
+    except (RuntimeError, KeyError, ValueError):
+        return None
+    finally:
+        ds = None
+    return None
+
+
+def subset_grid(entry: GridCacheEntry, request: GridCacheEntry, output: Path) -> None:
+    """
+    Subsets the variables, bbox and time range of the request from the cached grid
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(entry.path), gdal.OF_MULTIDIM_RASTER)
+        root: gdal.Group = ds.GetRootGroup()
+        array_names = (
+            [entry.variables[param] for param in request.params]
+            if entry.variables
+            else None
+        )
+        first_array_name = (
+            array_names[0]
+            if array_names
+            else max(root.GetMDArrayNames(), key=lambda n: _num_of_dims(root, n))
+        )
+        subset_specs = _subset_specs(root.OpenMDArray(first_array_name), request)
+        result = gdal.MultiDimTranslate(
+            str(output),
+            ds,
+            format="netCDF",
+            arraySpecs=array_names,
+            subsetSpecs=subset_specs,
+        )
+        if result is None:
+            raise RuntimeError(f"Could not subset {entry.path}")
+        result = None  # noqa: F841
+    finally:
+        ds = None
+
+
+def _subset_specs(array: gdal.MDArray, request: GridCacheEntry) -> List[str]:
+    specs = []
+    for dim in array.GetDimensions():
+        name = dim.GetName()
+        dim_type = dim.GetType()
+        if dim_type == "HORIZONTAL_X" or name.lower() in X_DIMENSION_NAMES:
+            specs.append(f"{name}({request.bbox[0]},{request.bbox[2]})")
+        elif dim_type == "HORIZONTAL_Y" or name.lower() in Y_DIMENSION_NAMES:
+            specs.append(f"{name}({request.bbox[1]},{request.bbox[3]})")
+        elif dim_type == "TEMPORAL" or name.lower() in TIME_DIMENSION_NAMES:
+            units = dim.GetIndexingVariable().GetUnit()
+            start, end = values_from_times(
+                [request.start_time, request.end_time], units
+            )
+            specs.append(f"{name}({start},{end})")
+    return specs
+
+
+def _num_of_dims(root: gdal.Group, array_name: str) -> int:
+    return root.OpenMDArray(array_name).GetDimensionCount()
@@ -0,0 +1,317 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+from .blocks import DEFAULT_BLOCK_SIZE
+from .time_index import times_from_values
+
+KELVIN_OFFSET = 273.15
+
+
+class InputSpec:
+    """
+    Matches a source variable by its CF standard name and units
+    """
+
+    def __init__(self, standard_names: Sequence[str], units: Optional[str] = None):
+        self.standard_names = tuple(standard_names)
+        self.units = units
+
+    def matches(self, standard_name: str, units: str) -> bool:
+        return standard_name in self.standard_names and (
+            self.units is None or units == self.units
+        )
+
+
+class DerivedVariable:
+    """
+    Variable computed from one or more source variables with NumPy
+    """
+
+    def __init__(
+        self,
+        name: str,
+        long_name: str,
+        units: str,
+        inputs: Sequence[InputSpec],
+        function: Callable[..., np.ndarray],
+        along_time: bool = False,
+    ) -> None:
+        """
+        :param name: name of the new variable
+        :param long_name: long name of the new variable, used as layer name
+        :param units: units of the new variable
+        :param inputs: source variables in the order of the function arguments
+        :param function: computes the variable from the input arrays
+        :param along_time: whether the function takes the time axis as keyword
+            argument "axis" and whether the first time is the origin time of
+            the forecast as keyword argument "starts_at_origin"
+        """
+        self.name = name
+        self.long_name = long_name
+        self.units = units
+        self.inputs = list(inputs)
+        self.function = function
+        self.along_time = along_time
+
+
+def wind_speed(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    return np.hypot(u, v)
+
+
+def wind_direction(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    :return: meteorological direction the wind blows from in degrees
+    """
+    return np.mod(180.0 + np.degrees(np.arctan2(u, v)), 360.0)
+
+
+def kelvin_to_celsius(temperature: np.ndarray) -> np.ndarray:
+    return temperature - KELVIN_OFFSET
+
+
+def accumulation_difference(
+    accumulation: np.ndarray, axis: int, starts_at_origin: bool = False
+) -> np.ndarray:
+    """
+    :param starts_at_origin: whether the first time is the origin time, when
+        the accumulation starts from zero
+    :return: amount accumulated during each time step, NaN for the first step
+        if the accumulation before it is unknown
+    """
+    difference = np.diff(accumulation, axis=axis, prepend=0).astype(np.float64)
+    if not starts_at_origin:
+        first_step = [slice(None)] * difference.ndim
+        first_step[axis] = 0
+        difference[tuple(first_step)] = np.nan
+    return difference
+
+
+U_WIND = InputSpec(("eastward_wind", "x_wind"))
+V_WIND = InputSpec(("northward_wind", "y_wind"))
+
+DERIVED_VARIABLES: List[DerivedVariable] = [
+    DerivedVariable(
+        "wind_speed", "Wind speed", "m s-1", [U_WIND, V_WIND], wind_speed
+    ),
+    DerivedVariable(
+        "wind_from_direction",
+        "Wind direction",
+        "degree",
+        [U_WIND, V_WIND],
+        wind_direction,
+    ),
+    DerivedVariable(
+        "air_temperature_celsius",
+        "Air temperature (°C)",
+        "degC",
+        [InputSpec(("air_temperature",), "K")],
+        kelvin_to_celsius,
+    ),
+    DerivedVariable(
+        "precipitation_amount_per_step",
+        "Precipitation amount per time step",
+        "kg m-2",
+        [InputSpec(("precipitation_amount",))],
+        accumulation_difference,
+        along_time=True,
+    ),
+]
+
+DERIVED_VARIABLE_NAMES = {variable.name for variable in DERIVED_VARIABLES}
+
+
+def add_derived_variables(
+    path: Path,
+    catalog: Sequence[DerivedVariable] = DERIVED_VARIABLES,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+    origin_time: Optional[datetime.datetime] = None,
+) -> Dict[str, str]:
+    """
+    Computes the derived variables whose inputs exist in the NetCDF file and
+    writes them to the same file as new variables. The variables sharing a
+    grid are computed in one blockwise pass over the rows, reading each input
+    once per block.
+
+    :param path: NetCDF file opened in update mode
+    :param catalog: derived variables to compute
+    :param origin_time: origin time of the forecast if known. Accumulations
+        are differenced from zero only if the first time is the origin time.
+    :return: long names of the new variables by their names
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(path), gdal.OF_MULTIDIM_RASTER | gdal.OF_UPDATE)
+        if ds is None:
+            raise RuntimeError(f"Could not open {path} for update")
+        root: gdal.Group = ds.GetRootGroup()
+        plan = _plan(root, catalog)
+        grids: Dict[Tuple[str, ...], List[Tuple[DerivedVariable, List[str]]]] = {}
+        for variable, names, dims in plan:
+            grids.setdefault(dims, []).append((variable, names))
+        for grid_plan in grids.values():
+            _compute(root, grid_plan, max_bytes, origin_time)
+        return {variable.name: variable.long_name for variable, _, _ in plan}
+    finally:
+        ds = None
+
+
+def _compute(
+    root: gdal.Group,
+    plan: List[Tuple[DerivedVariable, List[str]]],
+    max_bytes: int,
+    origin_time: Optional[datetime.datetime] = None,
+) -> None:
+    """
+    Computes the derived variables of a single grid in row blocks
+    """
+    source_names = sorted({name for _, names in plan for name in names})
+    sources = {name: root.OpenMDArray(name) for name in source_names}
+    dims = sources[source_names[0]].GetDimensions()
+    targets = {
+        variable.name: _create_array(root, variable, dims) for variable, _ in plan
+    }
+
+    shape = [dim.GetSize() for dim in dims]
+    time_axis = _time_axis(dims)
+    starts_at_origin = origin_time is not None and (
+        _first_time(dims[time_axis]) == origin_time
+    )
+    y_axis = len(dims) - 2
+    row_bytes = 8 * int(np.prod(shape)) // max(shape[y_axis], 1)
+    num_of_rows = max(1, max_bytes // max(row_bytes * len(source_names), 1))
+    for y_off in range(0, shape[y_axis], num_of_rows):
+        start = [0] * len(dims)
+        count = list(shape)
+        start[y_axis] = y_off
+        count[y_axis] = min(num_of_rows, shape[y_axis] - y_off)
+        data = {name: _read(array, start, count) for name, array in sources.items()}
+        for variable, names in plan:
+            kwargs = (
+                {"axis": time_axis, "starts_at_origin": starts_at_origin}
+                if variable.along_time
+                else {}
+            )
+            result = variable.function(*(data[name] for name in names), **kwargs)
+            targets[variable.name].Write(
+                result.astype(np.float32), array_start_idx=start, count=count
+            )
+
+
+def _plan(
+    root: gdal.Group, catalog: Sequence[DerivedVariable]
+) -> List[Tuple[DerivedVariable, List[str], Tuple[str, ...]]]:
+    """
+    :return: derived variables that can be computed with the names and
+        the dimensions of their inputs
+    """
+    existing = set(root.GetMDArrayNames())
+    # name, standard name, units and dimensions of the gridded variables
+    variables: List[Tuple[str, str, str, Tuple[str, ...]]] = []
+    for name in sorted(existing):
+        array: gdal.MDArray = root.OpenMDArray(name)
+        if array.GetDimensionCount() < 2:
+            continue
+        attributes = {a.GetName(): a.Read() for a in array.GetAttributes()}
+        variables.append(
+            (
+                name,
+                str(attributes.get("standard_name", "")),
+                str(attributes.get("units", "")),
+                tuple(dim.GetName() for dim in array.GetDimensions()),
+            )
+        )
+
+    plan = []
+    for variable in catalog:
+        if variable.name in existing:
+            continue
+        inputs = []
+        for spec in variable.inputs:
+            matches = [v for v in variables if spec.matches(v[1], v[2])]
+            if not matches:
+                break
+            inputs.append(matches[0])
+        else:
+            # Inputs have to share the grid
+            grids = {dims for _, _, _, dims in inputs}
+            if len(grids) == 1:
+                plan.append(
+                    (variable, [name for name, _, _, _ in inputs], grids.pop())
+                )
+    return plan
+
+
+def _create_array(
+    root: gdal.Group, variable: DerivedVariable, dims: List[gdal.Dimension]
+) -> gdal.MDArray:
+    array: gdal.MDArray = root.CreateMDArray(
+        variable.name, dims, gdal.ExtendedDataType.Create(gdal.GDT_Float32)
+    )
+    array.SetNoDataValueDouble(float("nan"))
+    for key, value in (("long_name", variable.long_name), ("units", variable.units)):
+        attribute = array.CreateAttribute(key, [], gdal.ExtendedDataType.CreateString())
+        attribute.Write(value)
+    return array
+
+
+def _read(array: gdal.MDArray, start: List[int], count: List[int]) -> np.ndarray:
+    data = array.ReadAsArray(array_start_idx=start, count=count).astype(np.float64)
+    nodata = array.GetNoDataValueAsDouble()
+    if nodata is not None:
+        data[data == nodata] = np.nan
+    scale = array.GetScale()
+    offset = array.GetOffset()
+    if scale is not None:
+        data *= scale
+    if offset is not None:
+        data += offset
+    return data
+
+
+def _time_axis(dims: List[gdal.Dimension]) -> int:
+    for i, dim in enumerate(dims):
+        if dim.GetType() == "TEMPORAL" or dim.GetName().lower().startswith("time"):
+            return i
+    return 0
+
+
+def _first_time(dim: gdal.Dimension) -> Optional[datetime.datetime]:
+    """
+    :return: first time of the time dimension or None if it has no CF time
+        coordinate
+    """
+    time: Optional[gdal.MDArray] = dim.GetIndexingVariable()
+    if time is None or dim.GetSize() == 0:
+        return None
+    attributes = {a.GetName(): a.Read() for a in time.GetAttributes()}
+    units = str(attributes.get("units", ""))
+    if " since " not in units:
+        return None
+    values = np.asarray(time.ReadAsArray(array_start_idx=[0], count=[1]), float)
+    try:
+        return times_from_values(values, units)[0]
+    except (KeyError, ValueError):
+        return None
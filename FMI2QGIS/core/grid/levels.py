@@ -0,0 +1,220 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from osgeo import gdal
+
+from .blocks import DEFAULT_BLOCK_SIZE
+from .run_comparison import GTIFF_CREATION_OPTIONS
+from .sampling import bilinear_sample
+from .time_index import (
+    NETCDF_DIM_EXTRA,
+    TIME_DIMENSION_PATTERN,
+    TimeBandIndex,
+    parse_list,
+)
+
+CROSS_SECTION_LEVELS = "LEVELS"
+
+
+class LevelBands:
+    """
+    Bands of each vertical level of a NetCDF variable with levels and time
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        level_dimension: str,
+        bands: Dict[float, List[int]],
+        time_indices: Dict[float, TimeBandIndex],
+    ) -> None:
+        """
+        :param uri: GDAL uri of the variable
+        :param level_dimension: name of the level dimension
+        :param bands: bands of each level in time order
+        :param time_indices: time band index of each level
+        """
+        self.uri = uri
+        self.level_dimension = level_dimension
+        self.bands = bands
+        self.time_indices = time_indices
+
+    @property
+    def levels(self) -> List[float]:
+        return list(self.bands.keys())
+
+    @staticmethod
+    def from_gdal_dataset(ds: gdal.Dataset, uri: str) -> Optional["LevelBands"]:
+        """
+        :return: LevelBands or None if the dataset has no level dimension
+        """
+        extra_dims = parse_list(ds.GetMetadataItem(NETCDF_DIM_EXTRA) or "")
+        level_dims = [
+            dim for dim in extra_dims if not TIME_DIMENSION_PATTERN.fullmatch(dim)
+        ]
+        if not level_dims:
+            return None
+        level_dim = level_dims[0]
+
+        bands: Dict[float, List[int]] = {}
+        for b in range(1, ds.RasterCount + 1):
+            value = ds.GetRasterBand(b).GetMetadataItem(f"NETCDF_DIM_{level_dim}")
+            if value is None:
+                return None
+            bands.setdefault(float(value), []).append(b)
+        bands = dict(sorted(bands.items()))
+
+        time_indices: Dict[float, TimeBandIndex] = {}
+        if len(extra_dims) > 1:
+            for level, level_bands in bands.items():
+                index = TimeBandIndex.from_gdal_dataset(ds, level_bands)
+                if index is not None:
+                    time_indices[level] = index
+        return LevelBands(uri, level_dim, bands, time_indices)
+
+
+def create_level_vrt(uri: str, bands: List[int], output_dir: Path, name: str) -> Path:
+    """
+    Creates a virtual raster containing only the bands of a single level.
+    The file name contains a hash of the source and the bands so that levels
+    of different downloads sharing the directory never reuse each other's VRT.
+    :param uri: GDAL uri of the variable
+    :param bands: bands of the level
+    :param output_dir: directory for the VRT
+    :param name: prefix of the file name
+    :return: path to the VRT file
+    """
+    digest = hashlib.sha1(
+        f"{uri}|{','.join(map(str, bands))}".encode("utf-8")
+    ).hexdigest()[:10]
+    output = Path(output_dir, f"{name}_{digest}.vrt")
+    if not output.exists():
+        ds = gdal.Translate(str(output), uri, format="VRT", bandList=bands)
+        if ds is None:
+            raise RuntimeError(f"Could not create {output}")
+        ds = None  # noqa: F841
+    return output
+
+
+def find_level_variable(path: Path, variable: str = "") -> Optional[LevelBands]:
+    """
+    :param path: NetCDF file
+    :param variable: name of the variable, defaults to the first variable
+        with vertical levels
+    :return: LevelBands of the variable or None if there is no such variable
+    """
+    ds = gdal.Open(str(path))
+    if ds is None:
+        return None
+    uris = [uri for uri, _ in ds.GetSubDatasets()] or [str(path)]
+    ds = None
+    for uri in uris:
+        if variable and uri.split(":")[-1] != variable:
+            continue
+        ds = gdal.Open(uri)
+        if ds is None:
+            continue
+        level_bands = LevelBands.from_gdal_dataset(ds, uri)
+        ds = None
+        if level_bands is not None:
+            return level_bands
+    return None
+
+
+def sample_levels(
+    ds: gdal.Dataset,
+    level_bands: LevelBands,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Interpolates the values of every level and time at the coordinates.
+    All the bands are sampled in a single pass over the raster.
+
+    :param ds: GDAL dataset of the variable
+    :param level_bands: bands of the levels in the dataset
+    :param xs: x coordinates in the CRS of the raster
+    :param ys: y coordinates in the CRS of the raster
+    :return: float64 array shaped (times, levels, points), NaN where a level
+        has fewer times than the others
+    """
+    levels = level_bands.levels
+    bands = [b for level in levels for b in level_bands.bands[level]]
+    values = bilinear_sample(ds, xs, ys, bands, max_bytes)
+
+    num_of_times = max(len(level_bands.bands[level]) for level in levels)
+    profiles = np.full((num_of_times, len(levels), len(xs)), np.nan)
+    start = 0
+    for i, level in enumerate(levels):
+        num_of_bands = len(level_bands.bands[level])
+        profiles[:num_of_bands, i, :] = values[:, start : start + num_of_bands].T
+        start += num_of_bands
+    return profiles
+
+
+def write_cross_section(
+    profiles: np.ndarray,
+    levels: List[float],
+    times: List[datetime.datetime],
+    spacing: float,
+    output: Path,
+) -> Path:
+    """
+    Writes vertical cross-section into a GeoTIFF. Columns are the points
+    along the line, rows are the levels in ascending order and bands are
+    the times. The x coordinate of the raster is the distance along the line.
+
+    :param profiles: array shaped (times, levels, points)
+    :param levels: level of each row
+    :param times: time of each band
+    :param spacing: distance between the points
+    :param output: output GeoTIFF
+    :return: path to the output
+    """
+    num_of_times, num_of_levels, num_of_points = profiles.shape
+    out_ds: Optional[gdal.Dataset] = None
+    try:
+        out_ds = gdal.GetDriverByName("GTiff").Create(
+            str(output),
+            num_of_points,
+            num_of_levels,
+            num_of_times,
+            gdal.GDT_Float32,
+            GTIFF_CREATION_OPTIONS,
+        )
+        out_ds.SetGeoTransform((0.0, spacing, 0.0, float(num_of_levels), 0.0, -1.0))
+        out_ds.SetMetadataItem(
+            CROSS_SECTION_LEVELS, ",".join(f"{level:g}" for level in levels)
+        )
+        for i in range(num_of_times):
+            band: gdal.Band = out_ds.GetRasterBand(i + 1)
+            band.SetNoDataValue(float("nan"))
+            if i < len(times):
+                band.SetDescription(times[i].isoformat())
+            band.WriteArray(profiles[i])
+    finally:
+        out_ds = None  # noqa: F841
+    return output
@@ -0,0 +1,118 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Union
+
+from osgeo import gdal
+
+FILL_VALUE_ATTRIBUTE = "_FillValue"
+
+
+def merge_variables(sources: Sequence[Path], output: Path) -> Path:
+    """
+    Merges the variables of NetCDF files into one NetCDF file. Arrays with
+    the same name, such as the coordinates, are copied from the first file
+    only and the shared dimensions have to be the same size in every file.
+    The arrays are copied one slice of their first dimension at a time.
+
+    :param sources: NetCDF files
+    :param output: merged NetCDF file
+    :return: path to the output
+    """
+    out_ds: Optional[gdal.Dataset] = None
+    src_ds: Optional[gdal.Dataset] = None
+    try:
+        out_ds = gdal.GetDriverByName("netCDF").CreateMultiDimensional(str(output))
+        out_root: gdal.Group = out_ds.GetRootGroup()
+        dims: Dict[str, gdal.Dimension] = {}
+        copied = set()
+        for i, source in enumerate(sources):
+            src_ds = gdal.OpenEx(str(source), gdal.OF_MULTIDIM_RASTER)
+            if src_ds is None:
+                raise RuntimeError(f"Could not open {source}")
+            root: gdal.Group = src_ds.GetRootGroup()
+            if i == 0:
+                _copy_attributes(root, out_root)
+            for name in root.GetMDArrayNames():
+                if name not in copied:
+                    _copy_array(root.OpenMDArray(name), out_root, dims)
+                    copied.add(name)
+            src_ds = None
+    finally:
+        src_ds = None
+        out_ds = None  # noqa: F841
+    return output
+
+
+def _copy_array(
+    array: gdal.MDArray, root: gdal.Group, dims: Dict[str, gdal.Dimension]
+) -> None:
+    out_dims = []
+    for dim in array.GetDimensions():
+        out_dim = dims.get(dim.GetName())
+        if out_dim is None:
+            out_dim = root.CreateDimension(
+                dim.GetName(), dim.GetType(), dim.GetDirection(), dim.GetSize()
+            )
+            dims[dim.GetName()] = out_dim
+        elif out_dim.GetSize() != dim.GetSize():
+            raise ValueError(f"Size of dimension {dim.GetName()} differs")
+        out_dims.append(out_dim)
+
+    out: gdal.MDArray = root.CreateMDArray(
+        array.GetName(), out_dims, array.GetDataType()
+    )
+    if array.GetDataType().GetClass() == gdal.GEDTC_NUMERIC:
+        nodata = array.GetNoDataValueAsDouble()
+        if nodata is not None:
+            out.SetNoDataValueDouble(nodata)
+    _copy_attributes(array, out)
+    if len(out_dims) == 1 and out_dims[0].GetName() == array.GetName():
+        out_dims[0].SetIndexingVariable(out)
+
+    if not out_dims:
+        out.Write(array.Read())
+        return
+    count = [dim.GetSize() for dim in out_dims]
+    count[0] = 1
+    for i in range(out_dims[0].GetSize()):
+        start = [i] + [0] * (len(out_dims) - 1)
+        out.Write(
+            array.Read(array_start_idx=start, count=count),
+            array_start_idx=start,
+            count=count,
+        )
+
+
+def _copy_attributes(
+    src: Union[gdal.Group, gdal.MDArray], dst: Union[gdal.Group, gdal.MDArray]
+) -> None:
+    """
+    Copies the attributes of a group or an array
+    """
+    for attribute in src.GetAttributes():
+        if attribute.GetName() == FILL_VALUE_ATTRIBUTE:
+            continue
+        out = dst.CreateAttribute(
+            attribute.GetName(),
+            attribute.GetDimensionsSize(),
+            attribute.GetDataType(),
+        )
+        out.Write(attribute.Read())
@@ -0,0 +1,129 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import enum
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from osgeo import gdal
+
+from .blocks import DEFAULT_BLOCK_SIZE, block_rows, read_block
+from .time_index import TimeBandIndex
+
+GTIFF_CREATION_OPTIONS = ["COMPRESS=DEFLATE", "TILED=YES", "BIGTIFF=IF_SAFER"]
+
+
+@enum.unique
+class ComparisonMode(enum.Enum):
+    DIFFERENCE = "difference"  # latest run minus the earliest run
+    SPREAD = "spread"  # standard deviation of the runs
+
+    def compute(self, runs: np.ndarray) -> np.ndarray:
+        """
+        :param runs: array shaped (runs, times, rows, cols)
+        :return: array shaped (times, rows, cols)
+        """
+        if self == ComparisonMode.DIFFERENCE:
+            return runs[-1] - runs[0]
+        return np.nanstd(runs, axis=0)
+
+
+def common_times(indices: Sequence[TimeBandIndex]) -> List[datetime.datetime]:
+    """
+    :return: sorted times present in all the indices
+    """
+    times = set(indices[0].times)
+    for index in indices[1:]:
+        times.intersection_update(index.times)
+    return sorted(times)
+
+
+def compare_runs(
+    uris: Sequence[str],
+    indices: Sequence[TimeBandIndex],
+    output: Path,
+    mode: ComparisonMode,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+) -> TimeBandIndex:
+    """
+    Computes the per time step difference or spread of forecast runs into a
+    GeoTIFF. The runs are aligned on their common times and processed in row
+    blocks, so only a block of every run is in memory at once.
+
+    :param uris: GDAL uris of the same variable in each run, oldest run first
+    :param indices: time band index of each run
+    :param output: output GeoTIFF
+    :param mode: comparison mode
+    :return: time band index of the output
+    """
+    times = common_times(indices)
+    if not times:
+        raise ValueError("Runs do not have common times")
+    run_bands: List[List[int]] = []
+    for index in indices:
+        bands_by_time: Dict[datetime.datetime, int] = dict(
+            zip(index.times, index.bands)
+        )
+        run_bands.append([bands_by_time[time] for time in times])
+
+    datasets: List[Optional[gdal.Dataset]] = [gdal.Open(uri) for uri in uris]
+    out_ds: Optional[gdal.Dataset] = None
+    try:
+        first = datasets[0]
+        for ds in datasets[1:]:
+            if (ds.RasterXSize, ds.RasterYSize) != (
+                first.RasterXSize,
+                first.RasterYSize,
+            ):
+                raise ValueError("Runs have different grids")
+
+        out_ds = gdal.GetDriverByName("GTiff").Create(
+            str(output),
+            first.RasterXSize,
+            first.RasterYSize,
+            len(times),
+            gdal.GDT_Float32,
+            GTIFF_CREATION_OPTIONS,
+        )
+        out_ds.SetGeoTransform(first.GetGeoTransform())
+        out_ds.SetProjection(first.GetProjection())
+        for i, time in enumerate(times):
+            band: gdal.Band = out_ds.GetRasterBand(i + 1)
+            band.SetNoDataValue(float("nan"))
+            band.SetDescription(time.isoformat())
+
+        num_of_rows = block_rows(first, len(times) * len(datasets), max_bytes)
+        for y_off in range(0, first.RasterYSize, num_of_rows):
+            y_size = min(num_of_rows, first.RasterYSize - y_off)
+            runs = np.stack(
+                [
+                    read_block(ds, y_off, y_size, bands)
+                    for ds, bands in zip(datasets, run_bands)
+                ]
+            )
+            result = mode.compute(runs)
+            for i in range(len(times)):
+                out_ds.GetRasterBand(i + 1).WriteArray(result[i], 0, y_off)
+    finally:
+        out_ds = None
+        datasets.clear()
+
+    return TimeBandIndex(times)
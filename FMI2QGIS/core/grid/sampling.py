@@ -0,0 +1,138 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+
+from .blocks import DEFAULT_BLOCK_SIZE, block_rows, read_block
+
+
+def pixel_indices(
+    geo_transform: Sequence[float], xs: np.ndarray, ys: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts coordinates to pixel indices
+    :param geo_transform: GDAL geotransform of the raster
+    :param xs: x coordinates in the CRS of the raster
+    :param ys: y coordinates in the CRS of the raster
+    :return: columns and rows of the pixels containing the coordinates
+    """
+    inv = gdal.InvGeoTransform(geo_transform)
+    cols = np.floor(inv[0] + inv[1] * xs + inv[2] * ys).astype(np.int64)
+    rows = np.floor(inv[3] + inv[4] * xs + inv[5] * ys).astype(np.int64)
+    return cols, rows
+
+
+def sample_points(
+    ds: gdal.Dataset,
+    cols: np.ndarray,
+    rows: np.ndarray,
+    bands: Optional[Sequence[int]] = None,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Samples the values of all the bands at the pixels. Only the row blocks
+    containing pixels are read, each of them once.
+
+    :param ds: GDAL dataset
+    :param cols: column of each pixel
+    :param rows: row of each pixel
+    :param bands: bands to sample, defaults to all
+    :return: float64 array shaped (pixels, bands), NaN for nodata and
+        pixels outside of the raster
+    """
+    bands = list(range(1, ds.RasterCount + 1)) if bands is None else list(bands)
+    values = np.full((len(cols), len(bands)), np.nan)
+    inside = (
+        (cols >= 0) & (cols < ds.RasterXSize) & (rows >= 0) & (rows < ds.RasterYSize)
+    )
+    if not inside.any():
+        return values
+
+    num_of_rows = block_rows(ds, len(bands), max_bytes)
+    blocks = rows // num_of_rows
+    for block in np.unique(blocks[inside]):
+        y_off = int(block * num_of_rows)
+        data = read_block(
+            ds, y_off, min(num_of_rows, ds.RasterYSize - y_off), bands
+        )
+        in_block = inside & (blocks == block)
+        # (bands, pixels) -> (pixels, bands)
+        values[in_block] = data[:, rows[in_block] - y_off, cols[in_block]].T
+    return values
+
+
+def bilinear_sample(
+    ds: gdal.Dataset,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    bands: Optional[Sequence[int]] = None,
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Interpolates the values of all the bands bilinearly at the coordinates.
+    The four neighbouring pixels of every coordinate are sampled together,
+    so each row block is read only once for all the bands.
+
+    :param ds: GDAL dataset
+    :param xs: x coordinates in the CRS of the raster
+    :param ys: y coordinates in the CRS of the raster
+    :param bands: bands to sample, defaults to all
+    :return: float64 array shaped (points, bands), NaN outside of the raster.
+        Nodata neighbours are left out of the weighted mean.
+    """
+    inv = gdal.InvGeoTransform(ds.GetGeoTransform())
+    # Fractional pixel coordinates relative to the pixel centers
+    fx = inv[0] + inv[1] * xs + inv[2] * ys - 0.5
+    fy = inv[3] + inv[4] * xs + inv[5] * ys - 0.5
+    outside = (
+        (fx < -0.5)
+        | (fx > ds.RasterXSize - 0.5)
+        | (fy < -0.5)
+        | (fy > ds.RasterYSize - 0.5)
+    )
+    fx = np.clip(fx, 0, ds.RasterXSize - 1)
+    fy = np.clip(fy, 0, ds.RasterYSize - 1)
+    col0 = np.minimum(np.floor(fx).astype(np.int64), max(ds.RasterXSize - 2, 0))
+    row0 = np.minimum(np.floor(fy).astype(np.int64), max(ds.RasterYSize - 2, 0))
+    col1 = np.minimum(col0 + 1, ds.RasterXSize - 1)
+    row1 = np.minimum(row0 + 1, ds.RasterYSize - 1)
+    wx = fx - col0
+    wy = fy - row0
+
+    num_of_points = len(xs)
+    corners = sample_points(
+        ds,
+        np.concatenate((col0, col1, col0, col1)),
+        np.concatenate((row0, row0, row1, row1)),
+        bands,
+        max_bytes,
+    ).reshape(4, num_of_points, -1)
+    weights = np.stack(
+        ((1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy)
+    )[:, :, np.newaxis]
+    weights = np.where(np.isnan(corners), 0.0, weights)
+    weight_sums = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = (np.nan_to_num(corners) * weights).sum(axis=0) / weight_sums
+    values[weight_sums == 0] = np.nan
+    values[outside] = np.nan
+    return values
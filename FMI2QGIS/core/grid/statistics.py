@@ -0,0 +1,199 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsColorRampShader,
+    QgsRasterLayer,
+    QgsSingleBandGrayRenderer,
+    QgsSingleBandPseudoColorRenderer,
+)
+
+from .blocks import iter_blocks
+
+PERCENTILE_KEY = "STATISTICS_P{}"
+DEFAULT_PERCENTILES = (2.0, 98.0)
+MAX_SAMPLES = 1000000
+
+
+class BandStatistics:
+    """
+    Statistics over all the (time) bands of a raster
+    """
+
+    def __init__(
+        self,
+        minimum: float,
+        maximum: float,
+        mean: float,
+        std: float,
+        percentiles: Dict[float, float],
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.std = std
+        self.percentiles = percentiles
+
+    @property
+    def stretch_range(self) -> Sequence[float]:
+        """
+        :return: Range from the lowest to highest percentile, or min and max
+        """
+        if self.percentiles:
+            return (
+                self.percentiles[min(self.percentiles)],
+                self.percentiles[max(self.percentiles)],
+            )
+        return self.minimum, self.maximum
+
+    def write_to_dataset(self, ds: gdal.Dataset) -> None:
+        """
+        Sets the statistics to all the bands of the dataset. GDAL persists
+        them to .aux.xml file of the dataset.
+        """
+        for b in range(1, ds.RasterCount + 1):
+            band: gdal.Band = ds.GetRasterBand(b)
+            band.SetStatistics(self.minimum, self.maximum, self.mean, self.std)
+            for percentile, value in self.percentiles.items():
+                band.SetMetadataItem(
+                    PERCENTILE_KEY.format(_fmt(percentile)), str(value)
+                )
+
+    @staticmethod
+    def read_from_dataset(
+        ds: gdal.Dataset, percentiles: Sequence[float] = DEFAULT_PERCENTILES
+    ) -> Optional["BandStatistics"]:
+        """
+        :return: Statistics persisted earlier with write_to_dataset or None
+        """
+        band: gdal.Band = ds.GetRasterBand(1)
+        metadata = band.GetMetadata()
+        try:
+            values = {
+                p: float(metadata[PERCENTILE_KEY.format(_fmt(p))]) for p in percentiles
+            }
+            return BandStatistics(
+                float(metadata["STATISTICS_MINIMUM"]),
+                float(metadata["STATISTICS_MAXIMUM"]),
+                float(metadata["STATISTICS_MEAN"]),
+                float(metadata["STATISTICS_STDDEV"]),
+                values,
+            )
+        except (KeyError, ValueError):
+            return None
+
+
+def compute_statistics(
+    ds: gdal.Dataset, percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> Optional[BandStatistics]:
+    """
+    Computes global statistics over all the bands in one chunked pass.
+    Minimum, maximum, mean and standard deviation are exact, percentiles
+    are computed from an evenly strided sample of at most MAX_SAMPLES values.
+
+    :return: BandStatistics or None if the dataset has no valid values
+    """
+    num_of_values = ds.RasterCount * ds.RasterXSize * ds.RasterYSize
+    stride = max(1, num_of_values // MAX_SAMPLES)
+
+    minimum = np.inf
+    maximum = -np.inf
+    total = 0.0
+    total_sq = 0.0
+    count = 0
+    samples = []
+    offset = 0
+    for _, data in iter_blocks(ds):
+        values = data[np.isfinite(data)]
+        if values.size:
+            minimum = min(minimum, float(values.min()))
+            maximum = max(maximum, float(values.max()))
+            total += float(values.sum())
+            total_sq += float(np.square(values).sum())
+            count += values.size
+            # Keep the stride continuous across the blocks
+            samples.append(values[(-offset) % stride :: stride])
+            offset += values.size
+
+    if count == 0:
+        return None
+    mean = total / count
+    std = float(np.sqrt(max(total_sq / count - mean ** 2, 0.0)))
+    sample = np.concatenate(samples)
+    percentile_values = (
+        dict(zip(percentiles, map(float, np.percentile(sample, list(percentiles)))))
+        if percentiles
+        else {}
+    )
+    return BandStatistics(minimum, maximum, mean, std, percentile_values)
+
+
+def statistics_for_file(
+    uri: str, percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> Optional[BandStatistics]:
+    """
+    Reads the persisted statistics of the raster or computes and persists them
+    :param uri: GDAL uri of the raster, e.g. NetCDF subdataset
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.Open(uri)
+        stats = BandStatistics.read_from_dataset(ds, percentiles)
+        if stats is None:
+            stats = compute_statistics(ds, percentiles)
+            if stats is not None:
+                stats.write_to_dataset(ds)
+        return stats
+    finally:
+        # Closing the dataset flushes the .aux.xml file
+        ds = None
+
+
+def apply_statistics(layer: QgsRasterLayer, stats: BandStatistics) -> None:
+    """
+    Sets the value range of the single band renderer of the layer, so that the
+    colors stay the same in every time band
+    """
+    minimum, maximum = stats.stretch_range
+    renderer = layer.renderer()
+    if isinstance(renderer, QgsSingleBandGrayRenderer):
+        contrast_enhancement = renderer.contrastEnhancement()
+        if contrast_enhancement is None:
+            return
+        contrast_enhancement.setMinimumValue(minimum)
+        contrast_enhancement.setMaximumValue(maximum)
+    elif isinstance(renderer, QgsSingleBandPseudoColorRenderer):
+        renderer.setClassificationMin(minimum)
+        renderer.setClassificationMax(maximum)
+        shader_function = renderer.shader().rasterShaderFunction()
+        shader_function.setMinimumValue(minimum)
+        shader_function.setMaximumValue(maximum)
+        if isinstance(shader_function, QgsColorRampShader):
+            shader_function.classifyColorRamp()
+    else:
+        return
+    layer.triggerRepaint()
+
+
+def _fmt(percentile: float) -> str:
+    return f"{percentile:g}"
@@ -0,0 +1,183 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import datetime
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsRasterLayer,
+    QgsSingleBandGrayRenderer,
+    QgsSingleBandPseudoColorRenderer,
+)
+
+NETCDF_DIM_EXTRA = "NETCDF_DIM_EXTRA"
+TIME_DIMENSION_PATTERN = re.compile(r"time(_\d?h)?")
+TIME_UNITS = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400}
+
+
+class TimeBandIndex:
+    """
+    Sorted lookup table from time to raster band
+    """
+
+    def __init__(
+        self, times: Sequence[datetime.datetime], bands: Optional[Sequence[int]] = None
+    ) -> None:
+        """
+        :param times: time of each band
+        :param bands: band numbers of the times, defaults to 1...n
+        """
+        bands = list(range(1, len(times) + 1)) if bands is None else list(bands)
+        order = sorted(range(len(times)), key=lambda i: times[i])
+        self.times: List[datetime.datetime] = [times[i] for i in order]
+        self.bands: List[int] = [bands[i] for i in order]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def start_time(self) -> Optional[datetime.datetime]:
+        return self.times[0] if self.times else None
+
+    @property
+    def end_time(self) -> Optional[datetime.datetime]:
+        return self.times[-1] if self.times else None
+
+    def band_for(self, time: datetime.datetime) -> Optional[int]:
+        """
+        :return: Band of the latest time at or before the given time or None
+            if the time is outside of the index
+        """
+        if not self.times or time < self.times[0] or time > self.times[-1]:
+            return None
+        return self.bands[bisect.bisect_right(self.times, time) - 1]
+
+    def band_for_range(
+        self, begin: datetime.datetime, end: datetime.datetime
+    ) -> Optional[int]:
+        """
+        :return: Band visible in the time range or None if the range
+            does not overlap the index
+        """
+        if not self.times or end < self.times[0] or begin > self.times[-1]:
+            return None
+        return self.band_for(max(begin, self.times[0]))
+
+    @staticmethod
+    def from_gdal_dataset(
+        ds: gdal.Dataset, bands: Optional[Sequence[int]] = None
+    ) -> Optional["TimeBandIndex"]:
+        """
+        Creates index from the time coordinate of a NetCDF dataset
+        :param bands: subset of the bands, e.g. bands of a single level. The
+            bands are numbered 1...n in the index like in a VRT of the subset.
+        :return: TimeBandIndex or None if the dataset has no time dimension
+        """
+        metadata: Dict[str, str] = ds.GetMetadata()
+        extra_dims = parse_list(metadata.get(NETCDF_DIM_EXTRA, ""))
+        time_dims = [dim for dim in extra_dims if TIME_DIMENSION_PATTERN.fullmatch(dim)]
+        if not time_dims:
+            return None
+        time_dim = time_dims[0]
+        units = metadata.get(f"{time_dim}#units", "")
+        if " since " not in units:
+            return None
+
+        values = np.array(
+            parse_list(metadata.get(f"NETCDF_DIM_{time_dim}_VALUES", "")),
+            dtype=float,
+        )
+        if bands is not None or len(extra_dims) != 1 or len(values) != ds.RasterCount:
+            # Multiple extra dimensions, read the time of each band
+            bands = range(1, ds.RasterCount + 1) if bands is None else bands
+            values = np.array(
+                [
+                    ds.GetRasterBand(b).GetMetadataItem(f"NETCDF_DIM_{time_dim}")
+                    for b in bands
+                ],
+                dtype=float,
+            )
+
+        return TimeBandIndex(times_from_values(values, units))
+
+
+def times_from_values(values: np.ndarray, units: str) -> List[datetime.datetime]:
+    """
+    Converts CF time coordinate values to datetimes
+    :param values: time coordinate values
+    :param units: CF time units e.g. "hours since 2020-10-05 18:00:00"
+    :return: list of datetimes
+    """
+    unit_seconds, reference_time = _parse_time_units(units)
+    deltas = np.round(values * unit_seconds).astype("timedelta64[s]")
+    times = reference_time + deltas
+    return times.astype("datetime64[s]").astype(datetime.datetime).tolist()
+
+
+def values_from_times(
+    times: Sequence[datetime.datetime], units: str
+) -> List[float]:
+    """
+    Converts datetimes to CF time coordinate values
+    :param times: datetimes
+    :param units: CF time units e.g. "hours since 2020-10-05 18:00:00"
+    :return: list of time coordinate values
+    """
+    unit_seconds, reference_time = _parse_time_units(units)
+    seconds = (
+        np.array(times, dtype="datetime64[s]") - reference_time
+    ) / np.timedelta64(1, "s")
+    return (seconds / unit_seconds).tolist()
+
+
+def set_raster_band(layer: QgsRasterLayer, band: int) -> None:
+    """
+    Sets the band of a single band renderer and repaints the layer if it changed
+    """
+    renderer = layer.renderer()
+    if isinstance(renderer, QgsSingleBandGrayRenderer):
+        if renderer.grayBand() == band:
+            return
+        renderer.setGrayBand(band)
+    elif isinstance(renderer, QgsSingleBandPseudoColorRenderer):
+        if renderer.band() == band:
+            return
+        renderer.setBand(band)
+    else:
+        return
+    layer.triggerRepaint()
+
+
+def _parse_time_units(units: str) -> Tuple[int, np.datetime64]:
+    unit, since = units.split(" since ")
+    parts = since.strip().replace("T", " ").rstrip("Z").split(" ")
+    time_part = parts[1] if len(parts) > 1 else "00:00:00"
+    return TIME_UNITS[unit.strip().lower()], np.datetime64(f"{parts[0]}T{time_part}")
+
+
+def parse_list(value: str) -> List[str]:
+    """
+    Parses GDAL NetCDF list metadata such as "{time,level}"
+    """
+    value = value.strip().strip("{").strip("}")
+    return [item.strip() for item in value.split(",") if item.strip()]
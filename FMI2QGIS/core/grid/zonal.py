@@ -0,0 +1,239 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Dict, Iterator, Sequence, Tuple
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from .blocks import DEFAULT_BLOCK_SIZE, block_rows, read_block
+
+ZONE_FIELD = "zone"
+HISTOGRAM_BINS = 256
+
+
+def rasterize_zones(ds: gdal.Dataset, geometries_wkb: Sequence[bytes]) -> np.ndarray:
+    """
+    Burns the polygons once into a label array aligned with the dataset.
+    Every pixel belongs to one zone only: where polygons overlap, the pixel
+    is assigned to the polygon that comes last.
+    :param ds: GDAL dataset defining the grid
+    :param geometries_wkb: polygons in the CRS of the dataset as WKB
+    :return: int32 array with the zone number (1...n) of each pixel, 0 outside
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(ds.GetProjection())
+    vector_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+    layer = vector_ds.CreateLayer("zones", srs, ogr.wkbMultiPolygon)
+    layer.CreateField(ogr.FieldDefn(ZONE_FIELD, ogr.OFTInteger))
+    defn = layer.GetLayerDefn()
+    for zone, wkb in enumerate(geometries_wkb, start=1):
+        feature = ogr.Feature(defn)
+        feature.SetField(ZONE_FIELD, zone)
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(wkb))
+        layer.CreateFeature(feature)
+
+    label_ds = gdal.GetDriverByName("MEM").Create(
+        "", ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Int32
+    )
+    label_ds.SetGeoTransform(ds.GetGeoTransform())
+    label_ds.SetProjection(ds.GetProjection())
+    gdal.RasterizeLayer(label_ds, [1], layer, options=[f"ATTRIBUTE={ZONE_FIELD}"])
+    labels = label_ds.GetRasterBand(1).ReadAsArray()
+    label_ds = None
+    vector_ds = None
+    return labels
+
+
+def zonal_statistics(
+    ds: gdal.Dataset,
+    labels: np.ndarray,
+    num_of_zones: int,
+    percentiles: Sequence[float] = (),
+    max_bytes: int = DEFAULT_BLOCK_SIZE,
+    bins: int = HISTOGRAM_BINS,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes the statistics of every zone for every band in chunked passes.
+    The zone pixels of a block are sorted by zone once, and the counts, sums,
+    minima and maxima of all bands are reduced over the zone segments.
+    Percentiles are estimated from per-zone histograms filled in a second
+    pass between the zone minimum and maximum, so the memory use
+    depends on the number of zones and bins instead of the number of pixels.
+    The error of a percentile is at most (max - min) / bins of the zone.
+
+    :param ds: GDAL dataset
+    :param labels: zone label array from rasterize_zones
+    :param num_of_zones: number of zones
+    :param percentiles: percentiles to compute
+    :param max_bytes: maximum size of a block read at once
+    :param bins: number of histogram bins per zone and band
+    :return: arrays shaped (bands, zones) keyed by statistic name
+        (count, mean, max, p{percentile}), NaN for empty zones
+    """
+    num_of_bands = ds.RasterCount
+    size = num_of_zones + 1
+    counts = np.zeros((num_of_bands, size))
+    sums = np.zeros((num_of_bands, size))
+    mins = np.full((num_of_bands, size), np.inf)
+    maxs = np.full((num_of_bands, size), -np.inf)
+
+    blocks = list(_zone_blocks(ds, labels, num_of_bands, max_bytes))
+    for y_off, y_size in blocks:
+        zone_labels, zone_values = _zone_pixels(ds, labels, y_off, y_size)
+        # The pixels are sorted by zone, so every zone is a contiguous segment
+        starts = np.flatnonzero(np.r_[True, zone_labels[1:] != zone_labels[:-1]])
+        zones = zone_labels[starts]
+        valid = ~np.isnan(zone_values)
+        counts[:, zones] += np.add.reduceat(valid.astype(np.int64), starts, axis=1)
+        sums[:, zones] += np.add.reduceat(
+            np.where(valid, zone_values, 0), starts, axis=1
+        )
+        # fmin and fmax ignore NaN unless the whole segment is NaN
+        mins[:, zones] = np.fmin(
+            mins[:, zones], np.fmin.reduceat(zone_values, starts, axis=1)
+        )
+        maxs[:, zones] = np.fmax(
+            maxs[:, zones], np.fmax.reduceat(zone_values, starts, axis=1)
+        )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    empty = counts == 0
+    maxs[empty] = np.nan
+    mins[empty] = np.nan
+    stats = {"count": counts[:, 1:], "mean": means[:, 1:], "max": maxs[:, 1:]}
+    for percentile in percentiles:
+        stats[percentile_name(percentile)] = np.full(
+            (num_of_bands, num_of_zones), np.nan
+        )
+    if percentiles and blocks:
+        histograms = np.zeros((num_of_bands, size, bins), dtype=np.int64)
+        widths = (maxs - mins) / bins
+        for y_off, y_size in blocks:
+            zone_labels, zone_values = _zone_pixels(ds, labels, y_off, y_size)
+            for b, values in enumerate(zone_values):
+                valid = ~np.isnan(values)
+                histograms[b] += _histogram(
+                    zone_labels[valid], values[valid], mins[b], widths[b], size, bins
+                )
+        _zone_percentiles(histograms, counts, mins, maxs, percentiles, stats)
+    return stats
+
+
+def percentile_name(percentile: float) -> str:
+    return f"p{percentile:g}"
+
+
+def _zone_blocks(
+    ds: gdal.Dataset, labels: np.ndarray, num_of_bands: int, max_bytes: int
+) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the row offsets and heights of the blocks containing zone pixels
+    """
+    zone_rows = np.flatnonzero((labels > 0).any(axis=1))
+    if not zone_rows.size:
+        return
+    first_row, last_row = int(zone_rows[0]), int(zone_rows[-1]) + 1
+    num_of_rows = block_rows(ds, num_of_bands, max_bytes)
+    for y_off in range(first_row, last_row, num_of_rows):
+        y_size = min(num_of_rows, last_row - y_off)
+        if (labels[y_off : y_off + y_size] > 0).any():
+            yield y_off, y_size
+
+
+def _zone_pixels(
+    ds: gdal.Dataset, labels: np.ndarray, y_off: int, y_size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads a block and returns the labels and values of its zone pixels
+    sorted by zone
+    :return: labels shaped (pixels,) and values shaped (bands, pixels)
+    """
+    block_labels = labels[y_off : y_off + y_size]
+    in_zone = block_labels > 0
+    data = read_block(ds, y_off, y_size)
+    zone_labels = block_labels[in_zone]
+    order = np.argsort(zone_labels, kind="stable")
+    return zone_labels[order], data[:, in_zone][:, order]
+
+
+def _histogram(
+    band_labels: np.ndarray,
+    values: np.ndarray,
+    mins: np.ndarray,
+    widths: np.ndarray,
+    size: int,
+    bins: int,
+) -> np.ndarray:
+    """
+    Bins the values of a band between the minimum and maximum of their zones
+    :return: counts shaped (zones + 1, bins)
+    """
+    zone_widths = widths[band_labels]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        positions = (values - mins[band_labels]) / zone_widths
+    positions[zone_widths == 0] = 0
+    indices = np.clip(positions.astype(np.int64), 0, bins - 1)
+    flat = band_labels.astype(np.int64) * bins + indices
+    return np.bincount(flat, minlength=size * bins).reshape(size, bins)
+
+
+def _zone_percentiles(
+    histograms: np.ndarray,
+    counts: np.ndarray,
+    mins: np.ndarray,
+    maxs: np.ndarray,
+    percentiles: Sequence[float],
+    stats: Dict[str, np.ndarray],
+) -> None:
+    """
+    Estimates the percentiles of each zone from the histograms with the
+    linear interpolation of numpy.percentile. The values inside a bin are
+    assumed to be spread evenly over the bin.
+    """
+    histograms = histograms[:, 1:]
+    counts = counts[:, 1:]
+    mins = mins[:, 1:]
+    maxs = maxs[:, 1:]
+    bins = histograms.shape[-1]
+    widths = (maxs - mins) / bins
+    cumulative = np.cumsum(histograms, axis=-1)
+
+    def value_at(rank: np.ndarray) -> np.ndarray:
+        # First bin whose cumulative count exceeds the zero-based rank
+        index = (cumulative <= rank[..., np.newaxis]).sum(axis=-1)
+        index = np.minimum(index, bins - 1)[..., np.newaxis]
+        in_bin = np.take_along_axis(histograms, index, axis=-1)[..., 0]
+        before = np.take_along_axis(cumulative, index, axis=-1)[..., 0] - in_bin
+        with np.errstate(invalid="ignore", divide="ignore"):
+            offset = (rank - before + 0.5) / in_bin
+        value = mins + (index[..., 0] + offset) * widths
+        return np.clip(value, mins, maxs)
+
+    with np.errstate(invalid="ignore"):
+        for percentile in percentiles:
+            rank = percentile / 100 * np.maximum(counts - 1, 0)
+            lower = np.floor(rank)
+            fraction = rank - lower
+            value = value_at(lower)
+            upper = value_at(np.minimum(lower + 1, np.maximum(counts - 1, 0)))
+            value = value + (upper - value) * fraction
+            value[counts == 0] = np.nan
+            stats[percentile_name(percentile)] = value
@@ -0,0 +1,389 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import copy
+import datetime
+import enum
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from qgis.core import QgsRectangle
+from qgis.PyQt.QtCore import QVariant
+
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ..qgis_plugin_tools.tools.i18n import tr
+from .exceptions.loader_exceptions import InvalidParameterException
+from .processing.base_loader import BaseLoader
+from .processing.batch_vector_loader import BatchVectorLoader
+from .processing.file_reference_loader import FileReferenceLoader
+from .processing.mesh_loader import MeshLoader
+from .processing.raster_loader import RasterLoader
+from .processing.vector_loader import VectorLoader
+from .wfs import Parameter, StoredQuery, StoredQueryFactory
+
+
+@enum.unique
+class LoaderType(enum.Enum):
+    RASTER = "raster"
+    MESH = "mesh"
+    VECTOR = "vector"
+    FILES = "files"
+
+    @staticmethod
+    def default_for(sq: StoredQuery) -> "LoaderType":
+        if FileReferenceLoader.supports(sq):
+            return LoaderType.FILES
+        if sq.type == StoredQuery.Type.Raster:
+            return LoaderType.RASTER
+        return LoaderType.VECTOR
+
+
+class Job:
+    """
+    Download of a single stored query with its parameters
+    """
+
+    def __init__(
+        self,
+        stored_query_id: str,
+        parameters: Dict[str, Any],
+        output_dir: Path,
+        loader_type: Optional[LoaderType] = None,
+        max_features: Optional[int] = None,
+    ) -> None:
+        """
+        :param stored_query_id: id of the stored query
+        :param parameters: values of the query parameters, times as datetimes or
+            strings like 2020-11-02T15:00:00Z and bbox as QgsRectangle or string
+            "xmin,ymin,xmax,ymax"
+        :param output_dir: download directory of the output files
+        :param loader_type: loader to use, defaults to the type of the query
+        :param max_features: maximum number of features of vector queries
+        """
+        self.stored_query_id = stored_query_id
+        self.parameters = parameters
+        self.output_dir = output_dir
+        self.loader_type = loader_type
+        self.max_features = max_features
+
+    @staticmethod
+    def from_dict(job: Dict[str, Any], output_dir: Path) -> "Job":
+        """
+        :param job: job read from a JSON job file
+        :param output_dir: default output directory
+        """
+        try:
+            return Job(
+                job["stored_query_id"],
+                job.get("parameters", {}),
+                Path(job.get("output_dir", output_dir)),
+                LoaderType(job["loader"]) if job.get("loader") else None,
+                job.get("max_features"),
+            )
+        except (KeyError, ValueError) as e:
+            raise InvalidParameterException(tr("Invalid job {}: {}", job, e))
+
+
+class JobResult:
+    def __init__(
+        self,
+        job: Job,
+        success: bool,
+        outputs: Optional[List[Path]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        self.job = job
+        self.success = success
+        self.outputs = outputs if outputs is not None else []
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stored_query_id": self.job.stored_query_id,
+            "success": self.success,
+            "outputs": [str(output) for output in self.outputs],
+            "error": self.error,
+        }
+
+
+def read_job_file(path: Path, output_dir: Path) -> List[Job]:
+    """
+    Reads jobs from a JSON file containing a list of jobs or an object with
+    the list under "jobs". Each job has "stored_query_id" and optionally
+    "parameters", "output_dir", "loader" and "max_features".
+    """
+    with open(path) as f:
+        content = json.load(f)
+    jobs = content.get("jobs", []) if isinstance(content, dict) else content
+    return [Job.from_dict(job, output_dir) for job in jobs]
+
+
+class HeadlessRunner:
+    """
+    Runs the loaders of the plugin without the GUI and QgsProject. The loaders
+    are run synchronously in the calling thread or in a pool of threads.
+    Nothing is added to the map, the results are the downloaded files.
+    """
+
+    def __init__(self, wfs_url: str, wfs_version: str, fmi_download_url: str) -> None:
+        self.wfs_url = wfs_url
+        self.wfs_version = wfs_version
+        self.fmi_download_url = fmi_download_url
+        self.factory = StoredQueryFactory(wfs_url, wfs_version)
+        self._lock = threading.Lock()
+        self._stored_queries: Optional[Dict[str, StoredQuery]] = None
+        self._expand_locks: Dict[str, threading.Lock] = {}
+        self._expanded_ids: Set[str] = set()
+
+    def stored_query(self, stored_query_id: str) -> StoredQuery:
+        """
+        :return: Copy of the expanded stored query, each query is listed and
+            expanded only once per runner
+        """
+        sq, expand_lock = self._listed_query(stored_query_id)
+        with expand_lock:
+            if stored_query_id not in self._expanded_ids:
+                self.factory.expand(sq)
+                self._expanded_ids.add(stored_query_id)
+            return copy.deepcopy(sq)
+
+    def expand_all(self, stored_query_ids: Iterable[str]) -> None:
+        """
+        Expands the queries that are not expanded yet with concurrent requests.
+        Unknown ids are skipped, they are reported by the jobs.
+        """
+        sqs: List[StoredQuery] = []
+        expand_locks: List[threading.Lock] = []
+        # Locks are acquired in a fixed order
+        for stored_query_id in sorted(set(stored_query_ids)):
+            try:
+                sq, expand_lock = self._listed_query(stored_query_id)
+            except InvalidParameterException:
+                continue
+            expand_lock.acquire()
+            expand_locks.append(expand_lock)
+            if stored_query_id not in self._expanded_ids:
+                sqs.append(sq)
+        try:
+            self.factory.expand_all(sqs)
+            self._expanded_ids.update(sq.id for sq in sqs)
+        finally:
+            for expand_lock in expand_locks:
+                expand_lock.release()
+
+    def query_for_job(self, job: Job) -> StoredQuery:
+        """
+        :return: Copy of the expanded stored query with the parameter values
+            of the job
+        """
+        sq = self.stored_query(job.stored_query_id)
+        for name, value in job.parameters.items():
+            if name not in sq.parameters:
+                raise InvalidParameterException(
+                    tr(
+                        "Stored query {} has no parameter {}, the parameters are {}",
+                        sq.id,
+                        name,
+                        ", ".join(sq.parameters),
+                    )
+                )
+            set_parameter_value(sq.parameters[name], value)
+        return sq
+
+    def create_loader(self, job: Job) -> BaseLoader:
+        sq = self.query_for_job(job)
+        job.output_dir.mkdir(parents=True, exist_ok=True)
+        loader_type = job.loader_type or LoaderType.default_for(sq)
+        if loader_type == LoaderType.VECTOR:
+            return VectorLoader(
+                sq.title,
+                job.output_dir,
+                self.wfs_url,
+                self.wfs_version,
+                sq,
+                False,
+                job.max_features,
+            )
+        if loader_type == LoaderType.FILES:
+            return FileReferenceLoader(
+                sq.title, job.output_dir, self.wfs_url, self.wfs_version, sq, False
+            )
+        loader_class = MeshLoader if loader_type == LoaderType.MESH else RasterLoader
+        return loader_class(
+            sq.title, job.output_dir, self.fmi_download_url, sq, False
+        )
+
+    def run(self, job: Job) -> JobResult:
+        """
+        Runs the job in the calling thread
+        """
+        try:
+            loader = self.create_loader(job)
+            success = loader.run()
+        except Exception as e:
+            return JobResult(job, False, error=str(e))
+        return self._result(job, loader, success)
+
+    def run_all(
+        self, jobs: List[Job], num_of_workers: int = 1, batch: bool = False
+    ) -> List[JobResult]:
+        """
+        Runs the jobs in parallel
+        :param num_of_workers: number of jobs run at the same time
+        :param batch: whether to combine the stored queries of vector jobs
+            into GetFeature requests of multiple queries
+        :return: results in the order of the jobs
+        """
+        try:
+            self.expand_all(job.stored_query_id for job in jobs)
+        except QgsPluginNetworkException:
+            # The queries are expanded one by one and the jobs report the error
+            pass
+        results: Dict[int, JobResult] = self._run_in_batches(jobs) if batch else {}
+        remaining = [job for i, job in enumerate(jobs) if i not in results]
+        if num_of_workers <= 1:
+            remaining_results = [self.run(job) for job in remaining]
+        else:
+            with ThreadPoolExecutor(num_of_workers) as executor:
+                remaining_results = list(executor.map(self.run, remaining))
+        results_iter = iter(remaining_results)
+        return [
+            results[i] if i in results else next(results_iter)
+            for i in range(len(jobs))
+        ]
+
+    def _run_in_batches(self, jobs: List[Job]) -> Dict[int, JobResult]:
+        """
+        Runs the vector jobs with BatchVectorLoader
+        :return: results of the batched jobs by their indices
+        """
+        loaders: Dict[int, VectorLoader] = {}
+        for i, job in enumerate(jobs):
+            try:
+                loader = self.create_loader(job)
+            except Exception:
+                # The error is reported when the job is run alone
+                continue
+            if isinstance(loader, VectorLoader) and loader.batch_key is not None:
+                loaders[i] = loader
+        if len(loaders) < 2:
+            return {}
+
+        batch_loader = BatchVectorLoader(tr("Batch"), list(loaders.values()))
+        batch_loader.run()
+        return {
+            i: self._result(jobs[i], loader, bool(result))
+            for (i, loader), result in zip(loaders.items(), batch_loader.results)
+        }
+
+    @staticmethod
+    def _result(job: Job, loader: BaseLoader, success: bool) -> JobResult:
+        if not success:
+            error = str(loader.exception) if loader.exception else tr("Job failed")
+            return JobResult(job, False, error=error)
+        if isinstance(loader, MeshLoader) and loader.paths_to_files:
+            outputs = list(loader.paths_to_files.values())
+        else:
+            outputs = [loader.path_to_file]
+        return JobResult(job, True, outputs)
+
+    def _listed_query(self, stored_query_id: str) -> Tuple[StoredQuery, threading.Lock]:
+        """
+        :return: Listed stored query and the lock of its expansion
+        """
+        with self._lock:
+            if self._stored_queries is None:
+                self._stored_queries = {
+                    sq.id: sq for sq in self.factory.list_queries()
+                }
+            sq = self._stored_queries.get(stored_query_id)
+            if sq is None:
+                raise InvalidParameterException(
+                    tr("Unknown stored query {}", stored_query_id)
+                )
+            return sq, self._expand_locks.setdefault(
+                stored_query_id, threading.Lock()
+            )
+
+
+def set_parameter_value(parameter: Parameter, value: Any) -> None:
+    """
+    Sets the value of the parameter from a plain JSON or command line value
+    """
+    if parameter.type == QVariant.DateTime and isinstance(value, str):
+        try:
+            value = datetime.datetime.strptime(value, Parameter.TIME_FORMAT)
+        except ValueError:
+            value = datetime.datetime.fromisoformat(value)
+    elif parameter.type in (QVariant.Rect, QVariant.RectF) and isinstance(
+        value, (str, list)
+    ):
+        coordinates = value.split(",") if isinstance(value, str) else value
+        if len(coordinates) != 4:
+            raise InvalidParameterException(
+                tr("Bbox must have four coordinates, got {}", value)
+            )
+        value = QgsRectangle(*(float(c) for c in coordinates))
+    elif parameter.has_variables() and isinstance(value, (str, list)):
+        if isinstance(value, str):
+            value = [v.strip() for v in value.split(",") if v.strip()]
+        _check_variables(parameter, value)
+    elif parameter.type == QVariant.Int:
+        try:
+            value = str(int(str(value).strip()))
+        except ValueError:
+            raise InvalidParameterException(
+                tr("Parameter {} must be an integer, got {}", parameter.name, value)
+            )
+    elif parameter.type == QVariant.Bool:
+        text = str(value).strip().lower()
+        if text not in ("true", "false", "1", "0"):
+            raise InvalidParameterException(
+                tr("Parameter {} must be true or false, got {}", parameter.name, value)
+            )
+        value = "true" if text in ("true", "1") else "false"
+    elif not isinstance(value, (list, datetime.datetime, QgsRectangle)):
+        value = str(value)
+    parameter.value = value
+
+
+def _check_variables(parameter: Parameter, variables: List[str]) -> None:
+    """
+    Checks the variables against the variables of the expanded stored query,
+    if the query lists them
+    """
+    if not parameter.variables:
+        return
+    known = {
+        name.lower()
+        for variable in parameter.variables
+        for name in (variable.id, variable.alias)
+    }
+    unknown = [variable for variable in variables if variable.lower() not in known]
+    if unknown:
+        raise InvalidParameterException(
+            tr(
+                "Unknown variables {}, the variables are {}",
+                ", ".join(unknown),
+                ", ".join(variable.alias for variable in parameter.variables),
+            )
+        )
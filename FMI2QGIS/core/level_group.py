@@ -0,0 +1,167 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from qgis.core import (
+    QgsDateTimeRange,
+    QgsLayerTree,
+    QgsLayerTreeGroup,
+    QgsLayerTreeNode,
+    QgsProject,
+    QgsRasterLayer,
+)
+from qgis.PyQt.QtCore import QObject
+
+from ..qgis_plugin_tools.tools.custom_logging import bar_msg
+from ..qgis_plugin_tools.tools.i18n import tr
+from ..qgis_plugin_tools.tools.raster_layers import (
+    set_fixed_temporal_range,
+    set_raster_renderer_to_singleband,
+)
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .grid.levels import LevelBands, create_level_vrt
+from .grid.statistics import BandStatistics, apply_statistics
+from .grid.time_index import TimeBandIndex, set_raster_band
+
+try:
+    from qgis.core import QgsTemporalController
+except ImportError:
+    QgsTemporalController = None
+
+LOGGER = logging.getLogger(plugin_name())
+
+
+class LazyLevelGroup(QObject):
+    """
+    Layer tree group of a variable with vertical levels. Each level has its
+    own subgroup and the layer of the level is created only when the user
+    turns the subgroup on.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        level_bands: LevelBands,
+        vrt_dir: Path,
+        parent_group: QgsLayerTreeGroup,
+        stats: Optional[BandStatistics] = None,
+        temporal_controller: Optional["QgsTemporalController"] = None,
+    ) -> None:
+        """
+        :param name: name of the variable
+        :param level_bands: bands of the levels
+        :param vrt_dir: directory for the virtual rasters of the levels
+        :param parent_group: layer tree group where the group is added
+        :param stats: statistics applied to the renderers of the levels
+        :param temporal_controller: controller whose range selects the
+            band of the level layers
+        """
+        group = parent_group.insertGroup(0, name)
+        # The group owns this object, so it lives as long as the group
+        super().__init__(group)
+        self.group: QgsLayerTreeGroup = group
+        self.name = name
+        self.level_bands = level_bands
+        self.vrt_dir = vrt_dir
+        self.stats = stats
+        self.levels_by_group: Dict[str, float] = {}
+        self.time_band_indices: Dict[str, TimeBandIndex] = {}
+        self.temporal_range: Optional[QgsDateTimeRange] = None
+
+        for level in level_bands.levels:
+            level_group = self.group.addGroup(self.level_name(level))
+            level_group.setItemVisibilityChecked(False)
+            self.levels_by_group[level_group.name()] = level
+        self.group.setExpanded(False)
+
+        # noinspection PyUnresolvedReferences
+        self.group.visibilityChanged.connect(self._visibility_changed)
+        if temporal_controller is not None:
+            # noinspection PyUnresolvedReferences
+            temporal_controller.updateTemporalRange.connect(self.set_temporal_range)
+
+    def level_name(self, level: float) -> str:
+        return f"{self.name} {tr('level')} {level:g}"
+
+    def set_temporal_range(self, t_range: QgsDateTimeRange) -> None:
+        """
+        Shows the band of the time range in the instantiated level layers
+        """
+        self.temporal_range = t_range
+        begin = t_range.begin().toPyDateTime()
+        end = t_range.end().toPyDateTime()
+        for layer_id, index in self.time_band_indices.items():
+            band = index.band_for_range(begin, end)
+            # noinspection PyArgumentList
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if band is not None and isinstance(layer, QgsRasterLayer):
+                set_raster_band(layer, band)
+
+    def _visibility_changed(self, node: QgsLayerTreeNode) -> None:
+        if (
+            QgsLayerTree.isGroup(node)
+            and node.name() in self.levels_by_group
+            and node.itemVisibilityChecked()
+            and not node.children()
+        ):
+            self._add_level_layer(node, self.levels_by_group[node.name()])
+
+    def _add_level_layer(self, level_group: QgsLayerTreeGroup, level: float) -> None:
+        try:
+            vrt = create_level_vrt(
+                self.level_bands.uri,
+                self.level_bands.bands[level],
+                self.vrt_dir,
+                level_group.name().replace(" ", "_"),
+            )
+        except RuntimeError as e:
+            LOGGER.warning(
+                tr("Could not create layer for level {}", level), extra=bar_msg(e)
+            )
+            return
+
+        layer = QgsRasterLayer(str(vrt), level_group.name())
+        if not layer.isValid():
+            return
+        # noinspection PyArgumentList
+        QgsProject.instance().addMapLayer(layer, False)
+        level_group.addLayer(layer)
+        set_raster_renderer_to_singleband(layer, 1)
+        if self.stats is not None:
+            apply_statistics(layer, self.stats)
+
+        index = self.level_bands.time_indices.get(level)
+        if index is not None and len(index):
+            self.time_band_indices[layer.id()] = index
+            try:
+                set_fixed_temporal_range(
+                    layer,
+                    QgsDateTimeRange(
+                        index.start_time,
+                        index.end_time + datetime.timedelta(seconds=1),
+                    ),
+                )
+            except AttributeError:
+                pass
+            if self.temporal_range is not None:
+                self.set_temporal_range(self.temporal_range)
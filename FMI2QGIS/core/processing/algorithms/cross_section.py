@@ -0,0 +1,175 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsDistanceArea,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterString,
+)
+
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.levels import sample_levels, write_cross_section
+from .utils import grid_crs, level_variable
+
+
+class CrossSectionAlgorithm(QgsProcessingAlgorithm):
+    """
+    Interpolates a vertical cross-section of a hybrid grid along a line
+    """
+
+    INPUT = "INPUT"
+    GRID = "GRID"
+    VARIABLE = "VARIABLE"
+    NUM_OF_POINTS = "NUM_OF_POINTS"
+    OUTPUT = "OUTPUT"
+
+    def createInstance(self) -> "CrossSectionAlgorithm":  # noqa N802
+        return CrossSectionAlgorithm()
+
+    def name(self) -> str:
+        return "crosssection"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Vertical cross-section")
+
+    def group(self) -> str:
+        return tr("Grid analysis")
+
+    def groupId(self) -> str:  # noqa N802
+        return "gridanalysis"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Interpolates the values of all the levels and times of a downloaded "
+            "hybrid grid (NetCDF) along the first line of the input. In the output "
+            "raster the columns are evenly spaced points along the line, the rows "
+            "are the levels in ascending order and the bands are the times. "
+            "The x coordinate of the output is the distance along the line in "
+            "meters."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Line"), [QgsProcessing.TypeVectorLine]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.GRID, tr("Hybrid grid (NetCDF)"), extension="nc"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.VARIABLE, tr("Variable"), defaultValue="", optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.NUM_OF_POINTS,
+                tr("Number of points along the line"),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=100,
+                minValue=2,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(self.OUTPUT, tr("Cross-section"))
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(tr("Invalid input"))
+        feature = next(source.getFeatures(), None)
+        if feature is None or feature.geometry().isEmpty():
+            raise QgsProcessingException(tr("The input has no lines"))
+        level_bands = level_variable(
+            self.parameterAsFile(parameters, self.GRID, context),
+            self.parameterAsString(parameters, self.VARIABLE, context),
+        )
+        num_of_points = self.parameterAsInt(parameters, self.NUM_OF_POINTS, context)
+        output = self.parameterAsOutputLayer(parameters, self.OUTPUT, context)
+
+        ds: Optional[gdal.Dataset] = None
+        try:
+            ds = gdal.Open(level_bands.uri)
+            if ds is None:
+                raise QgsProcessingException(
+                    tr("Could not open grid {}", level_bands.uri)
+                )
+            crs = grid_crs(ds)
+            geometry = feature.geometry()
+            geometry.transform(
+                QgsCoordinateTransform(
+                    source.sourceCrs(), crs, context.transformContext()
+                )
+            )
+            length = geometry.length()
+            xs = np.empty(num_of_points)
+            ys = np.empty(num_of_points)
+            for i in range(num_of_points):
+                point = geometry.interpolate(
+                    length * i / (num_of_points - 1)
+                ).asPoint()
+                xs[i] = point.x()
+                ys[i] = point.y()
+            feedback.setProgress(10)
+
+            profiles = sample_levels(ds, level_bands, xs, ys)
+        finally:
+            ds = None
+        feedback.setProgress(80)
+
+        distance_area = QgsDistanceArea()
+        distance_area.setSourceCrs(crs, context.transformContext())
+        distance_area.setEllipsoid(context.ellipsoid() or "WGS84")
+        spacing = distance_area.measureLength(geometry) / (num_of_points - 1)
+
+        first_level = level_bands.levels[0]
+        index = level_bands.time_indices.get(first_level)
+        write_cross_section(
+            profiles,
+            level_bands.levels,
+            index.times if index is not None else [],
+            spacing,
+            output,
+        )
+        feedback.setProgress(100)
+        return {self.OUTPUT: output}
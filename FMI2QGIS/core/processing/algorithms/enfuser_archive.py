@@ -0,0 +1,143 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputFolder,
+    QgsProcessingOutputNumber,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterExtent,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+)
+
+from ....definitions.configurable_settings import Settings
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...products.enfuser_archive import EnfuserArchive
+from .enfuser_download import PRODUCTS
+
+
+class EnfuserArchiveAlgorithm(QgsProcessingAlgorithm):
+    """
+    Updates a rolling local archive of Enfuser air quality products
+    """
+
+    PRODUCTS = "PRODUCTS"
+    EXTENT = "EXTENT"
+    RETENTION = "RETENTION"
+    ARCHIVE_DIR = "ARCHIVE_DIR"
+    OUTPUT = "OUTPUT"
+    ADDED_HOURS = "ADDED_HOURS"
+
+    def createInstance(self) -> "EnfuserArchiveAlgorithm":  # noqa N802
+        return EnfuserArchiveAlgorithm()
+
+    def name(self) -> str:
+        return "updateenfuserarchive"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Update Enfuser air quality archive")
+
+    def group(self) -> str:
+        return tr("Download")
+
+    def groupId(self) -> str:  # noqa N802
+        return "download"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Downloads the hours of the selected Enfuser air quality products "
+            "that are missing from the retention window of a local archive and "
+            "removes the older hours. Every hour is stored as its own NetCDF "
+            "file. Run it hourly, e.g. with qgis_process from cron, to keep "
+            "the archive up to date."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.PRODUCTS,
+                tr("Products"),
+                [product.value for product in PRODUCTS],
+                allowMultiple=True,
+                defaultValue=[0],
+            )
+        )
+        self.addParameter(QgsProcessingParameterExtent(self.EXTENT, tr("Extent")))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.RETENTION,
+                tr("Retention (hours)"),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=Settings.ENFUSER_ARCHIVE_RETENTION.get(int),
+                minValue=1,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.ARCHIVE_DIR, tr("Archive directory")
+            )
+        )
+        self.addOutput(QgsProcessingOutputFolder(self.OUTPUT, tr("Archive")))
+        self.addOutput(QgsProcessingOutputNumber(self.ADDED_HOURS, tr("Added hours")))
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        products = {
+            PRODUCTS[i]
+            for i in self.parameterAsEnums(parameters, self.PRODUCTS, context)
+        }
+        if not products:
+            raise QgsProcessingException(tr("Select at least one product"))
+        archive = EnfuserArchive(
+            Path(self.parameterAsString(parameters, self.ARCHIVE_DIR, context)),
+            Settings.FMI_DOWNLOAD_URL.get(),
+            products,
+            self.parameterAsExtent(
+                parameters,
+                self.EXTENT,
+                context,
+                QgsCoordinateReferenceSystem("EPSG:4326"),
+            ),
+            feedback,
+            datetime.timedelta(
+                hours=self.parameterAsInt(parameters, self.RETENTION, context)
+            ),
+        )
+        added = archive.update()
+        for product, hours in added.items():
+            feedback.pushInfo(tr("Added {} hours of {}", len(hours), product.value))
+        return {
+            self.OUTPUT: str(archive.archive_dir),
+            self.ADDED_HOURS: sum(len(hours) for hours in added.values()),
+        }
@@ -0,0 +1,146 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputFile,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDateTime,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterExtent,
+    QgsProcessingParameterFolderDestination,
+)
+
+from ....definitions.configurable_settings import Settings
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...products.enfuser import EnfuserNetcdfLoader
+
+PRODUCTS = list(EnfuserNetcdfLoader.Products)
+
+
+class EnfuserDownloadAlgorithm(QgsProcessingAlgorithm):
+    """
+    Downloads Enfuser air quality products of the Helsinki metropolitan area
+    """
+
+    PRODUCTS = "PRODUCTS"
+    EXTENT = "EXTENT"
+    START_TIME = "START_TIME"
+    END_TIME = "END_TIME"
+    PARALLEL = "PARALLEL"
+    OUTPUT_DIR = "OUTPUT_DIR"
+    OUTPUT = "OUTPUT"
+
+    def createInstance(self) -> "EnfuserDownloadAlgorithm":  # noqa N802
+        return EnfuserDownloadAlgorithm()
+
+    def name(self) -> str:
+        return "downloadenfuser"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Download Enfuser air quality")
+
+    def group(self) -> str:
+        return tr("Download")
+
+    def groupId(self) -> str:  # noqa N802
+        return "download"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Downloads the selected Enfuser air quality products of the Helsinki "
+            "metropolitan area into a single NetCDF file. With parallel download "
+            "each product is fetched concurrently and the files are merged."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.PRODUCTS,
+                tr("Products"),
+                [product.value for product in PRODUCTS],
+                allowMultiple=True,
+                defaultValue=[0],
+            )
+        )
+        self.addParameter(QgsProcessingParameterExtent(self.EXTENT, tr("Extent")))
+        self.addParameter(
+            QgsProcessingParameterDateTime(self.START_TIME, tr("Start time (UTC)"))
+        )
+        self.addParameter(
+            QgsProcessingParameterDateTime(self.END_TIME, tr("End time (UTC)"))
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARALLEL, tr("Download products in parallel"), defaultValue=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_DIR, tr("Download directory")
+            )
+        )
+        self.addOutput(QgsProcessingOutputFile(self.OUTPUT, tr("Downloaded file")))
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        products = {
+            PRODUCTS[i]
+            for i in self.parameterAsEnums(parameters, self.PRODUCTS, context)
+        }
+        if not products:
+            raise QgsProcessingException(tr("Select at least one product"))
+        extent = self.parameterAsExtent(
+            parameters, self.EXTENT, context, QgsCoordinateReferenceSystem("EPSG:4326")
+        )
+        start_time = self.parameterAsDateTime(parameters, self.START_TIME, context)
+        end_time = self.parameterAsDateTime(parameters, self.END_TIME, context)
+        download_dir = Path(
+            self.parameterAsString(parameters, self.OUTPUT_DIR, context)
+        )
+        download_dir.mkdir(parents=True, exist_ok=True)
+
+        loader = EnfuserNetcdfLoader(
+            download_dir, Settings.FMI_DOWNLOAD_URL.get(), feedback
+        )
+        output = loader.download(
+            products,
+            extent,
+            start_time.toPyDateTime(),
+            end_time.toPyDateTime(),
+            self.parameterAsBoolean(parameters, self.PARALLEL, context),
+        )
+        if not output.is_file():
+            if feedback.isCanceled():
+                return {}
+            raise QgsProcessingException(tr("Download failed"))
+        return {self.OUTPUT: str(output)}
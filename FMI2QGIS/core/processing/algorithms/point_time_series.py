@@ -0,0 +1,216 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterMapLayer,
+)
+from qgis.PyQt.QtCore import QDateTime, QVariant
+
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.archive import read_point_series
+from ...grid.cache import GridCacheEntry
+from ...grid.sampling import pixel_indices, sample_points
+from ...grid.time_index import TimeBandIndex
+from .utils import archived_grid, grid_uri
+
+
+class PointTimeSeriesAlgorithm(QgsProcessingAlgorithm):
+    """
+    Extracts the time series of every band of an FMI grid at points
+    """
+
+    INPUT = "INPUT"
+    GRID = "GRID"
+    OUTPUT = "OUTPUT"
+
+    BAND_FIELD = "band"
+    TIME_FIELD = "time"
+    VALUE_FIELD = "value"
+
+    def createInstance(self) -> "PointTimeSeriesAlgorithm":  # noqa N802
+        return PointTimeSeriesAlgorithm()
+
+    def name(self) -> str:
+        return "pointtimeseries"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Point time series")
+
+    def group(self) -> str:
+        return tr("Grid analysis")
+
+    def groupId(self) -> str:  # noqa N802
+        return "gridanalysis"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Extracts the values of all the time bands of a downloaded FMI grid "
+            "(raster or mesh layer) at the input points. The output contains "
+            "one feature per point and time."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Points"), [QgsProcessing.TypeVectorPoint]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMapLayer(
+                self.GRID,
+                tr("FMI grid"),
+                types=[QgsProcessing.TypeRaster, QgsProcessing.TypeMesh],
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT, tr("Time series"))
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        grid_layer = self.parameterAsLayer(parameters, self.GRID, context)
+        if source is None or grid_layer is None:
+            raise QgsProcessingException(tr("Invalid input"))
+
+        fields = QgsFields(source.fields())
+        fields.append(QgsField(self.BAND_FIELD, QVariant.Int))
+        fields.append(QgsField(self.TIME_FIELD, QVariant.DateTime))
+        fields.append(QgsField(self.VALUE_FIELD, QVariant.Double))
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            source.wkbType(),
+            source.sourceCrs(),
+        )
+
+        features: List[QgsFeature] = list(source.getFeatures())
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(), grid_layer.crs(), context.transformContext()
+        )
+        xs = np.empty(len(features))
+        ys = np.empty(len(features))
+        for i, feature in enumerate(features):
+            point = transform.transform(feature.geometry().centroid().asPoint())
+            xs[i] = point.x()
+            ys[i] = point.y()
+        feedback.setProgress(10)
+
+        uri = grid_uri(grid_layer)
+        archived = archived_grid(uri)
+        ds: Optional[gdal.Dataset] = None
+        try:
+            ds = gdal.Open(uri)
+            if ds is None:
+                raise QgsProcessingException(
+                    tr("Could not open grid {}", grid_layer.source())
+                )
+            cols, rows = pixel_indices(ds.GetGeoTransform(), xs, ys)
+            values = (
+                self._sample_archive(ds, archived, cols, rows, xs, ys)
+                if archived is not None
+                else None
+            )
+            if values is None:
+                values = sample_points(ds, cols, rows)
+            index = TimeBandIndex.from_gdal_dataset(ds)
+        finally:
+            ds = None
+        feedback.setProgress(60)
+
+        times = (
+            {band: QDateTime(time) for band, time in zip(index.bands, index.times)}
+            if index is not None
+            else {}
+        )
+        num_of_bands = values.shape[1]
+        for i, feature in enumerate(features):
+            if feedback.isCanceled():
+                break
+            for b in range(num_of_bands):
+                value = values[i, b]
+                out_feature = QgsFeature(fields)
+                out_feature.setGeometry(feature.geometry())
+                out_feature.setAttributes(
+                    feature.attributes()
+                    + [
+                        b + 1,
+                        times.get(b + 1),
+                        None if np.isnan(value) else float(value),
+                    ]
+                )
+                sink.addFeature(out_feature, QgsFeatureSink.FastInsert)
+            feedback.setProgress(60 + 40 * (i + 1) / max(len(features), 1))
+
+        return {self.OUTPUT: dest_id}
+
+    @staticmethod
+    def _sample_archive(
+        ds: gdal.Dataset,
+        archived: Tuple[GridCacheEntry, str],
+        cols: np.ndarray,
+        rows: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+    ) -> Optional[np.ndarray]:
+        """
+        Reads the series from the archived copy of the grid, whose chunks
+        span the time dimension of small windows
+        :return: float64 array shaped (points, bands), NaN for nodata and
+            points outside of the grid, or None if the archived series do not
+            match the bands of the grid
+        """
+        entry, variable = archived
+        values = np.full((len(xs), ds.RasterCount), np.nan)
+        inside = (
+            (cols >= 0)
+            & (cols < ds.RasterXSize)
+            & (rows >= 0)
+            & (rows < ds.RasterYSize)
+        )
+        for i in np.flatnonzero(inside):
+            _, series = read_point_series(entry, variable, xs[i], ys[i])
+            if len(series) != ds.RasterCount:
+                return None
+            values[i] = series
+        return values
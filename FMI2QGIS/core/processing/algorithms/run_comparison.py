@@ -0,0 +1,164 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+from typing import Any, Dict, List, Optional
+
+from qgis.core import (
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputMultipleLayers,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterString,
+)
+
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.run_comparison import ComparisonMode
+from ...headless import LoaderType
+from ...wfs import Parameter
+from ..run_comparison_loader import RunComparisonLoader
+from .stored_query_download import StoredQueryDownloadAlgorithm, headless_runner
+
+MODES = list(ComparisonMode)
+
+
+class RunComparisonAlgorithm(StoredQueryDownloadAlgorithm):
+    """
+    Downloads several forecast runs of a grid and compares them
+    """
+
+    ORIGIN_TIMES = "ORIGIN_TIMES"
+    MODE = "MODE"
+    OUTPUTS = "OUTPUTS"
+
+    DEFAULT_STORED_QUERY = "fmi::forecast::harmonie::surface::grid"
+    loader_type = LoaderType.RASTER
+
+    def createInstance(self) -> "RunComparisonAlgorithm":  # noqa N802
+        return RunComparisonAlgorithm()
+
+    def name(self) -> str:
+        return "compareruns"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Compare forecast runs")
+
+    def group(self) -> str:
+        return tr("Grid analysis")
+
+    def groupId(self) -> str:  # noqa N802
+        return "gridanalysis"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Downloads the forecast runs of the given origin times with an FMI "
+            "stored query and computes the difference of the latest and the "
+            "earliest run or the spread of the runs for every common time step. "
+            "Each variable is written into its own GeoTIFF with a band per time."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        super().initAlgorithm(config)
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.ORIGIN_TIMES,
+                tr("Origin times of the runs (UTC, comma separated)"),
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.MODE,
+                tr("Comparison"),
+                [mode.value for mode in MODES],
+                defaultValue=0,
+            )
+        )
+        self.addOutput(
+            QgsProcessingOutputMultipleLayers(self.OUTPUTS, tr("Compared variables"))
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        loader = self.create_loader(parameters, context)
+        feedback.pushInfo(tr("Comparing runs of {}", loader.sq.id))
+        # noinspection PyUnresolvedReferences
+        loader.progressChanged.connect(feedback.setProgress)
+        feedback.canceled.connect(loader.cancel)
+        if not loader.run():
+            if feedback.isCanceled():
+                return {}
+            raise QgsProcessingException(
+                str(loader.exception) if loader.exception else tr("Comparison failed")
+            )
+        outputs = [str(path) for path in loader.output_files.values()]
+        return {self.OUTPUT: outputs[0] if outputs else None, self.OUTPUTS: outputs}
+
+    def create_loader(
+        self, parameters: Dict[str, Any], context: QgsProcessingContext
+    ) -> RunComparisonLoader:
+        """
+        :return: Loader of the runs with the query parameters of the algorithm
+        """
+        job = self.create_job(parameters, context)
+        origin_times = self._origin_times(parameters, context)
+        mode = MODES[self.parameterAsEnum(parameters, self.MODE, context)]
+        runner = headless_runner()
+        try:
+            sq = runner.query_for_job(job)
+            job.output_dir.mkdir(parents=True, exist_ok=True)
+            return RunComparisonLoader(
+                sq.title,
+                job.output_dir,
+                runner.fmi_download_url,
+                sq,
+                origin_times,
+                mode,
+                False,
+            )
+        except Exception as e:
+            raise QgsProcessingException(str(e))
+
+    def _origin_times(
+        self, parameters: Dict[str, Any], context: QgsProcessingContext
+    ) -> List[datetime.datetime]:
+        text = self.parameterAsString(parameters, self.ORIGIN_TIMES, context)
+        origin_times = []
+        for value in text.split(","):
+            if not value.strip():
+                continue
+            try:
+                origin_times.append(
+                    datetime.datetime.strptime(value.strip(), Parameter.TIME_FORMAT)
+                )
+            except ValueError:
+                raise QgsProcessingException(
+                    tr(
+                        "Origin time {} is not in form {}",
+                        value.strip(),
+                        "2020-11-05T12:00:00Z",
+                    )
+                )
+        return origin_times
@@ -0,0 +1,179 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterString,
+)
+from qgis.PyQt.QtCore import QDateTime, QVariant
+
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.levels import sample_levels
+from .utils import grid_crs, level_variable
+
+
+class SoundingProfileAlgorithm(QgsProcessingAlgorithm):
+    """
+    Interpolates vertical profiles of a hybrid grid at points
+    """
+
+    INPUT = "INPUT"
+    GRID = "GRID"
+    VARIABLE = "VARIABLE"
+    OUTPUT = "OUTPUT"
+
+    LEVEL_FIELD = "level"
+    TIME_FIELD = "time"
+    VALUE_FIELD = "value"
+
+    def createInstance(self) -> "SoundingProfileAlgorithm":  # noqa N802
+        return SoundingProfileAlgorithm()
+
+    def name(self) -> str:
+        return "soundingprofile"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Sounding profile")
+
+    def group(self) -> str:
+        return tr("Grid analysis")
+
+    def groupId(self) -> str:  # noqa N802
+        return "gridanalysis"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Interpolates the values of all the levels and times of a downloaded "
+            "hybrid grid (NetCDF) at the input points. The output contains one "
+            "feature per point, time and level."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Points"), [QgsProcessing.TypeVectorPoint]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.GRID, tr("Hybrid grid (NetCDF)"), extension="nc"
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.VARIABLE, tr("Variable"), defaultValue="", optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT, tr("Sounding profiles"))
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(tr("Invalid input"))
+        level_bands = level_variable(
+            self.parameterAsFile(parameters, self.GRID, context),
+            self.parameterAsString(parameters, self.VARIABLE, context),
+        )
+
+        fields = QgsFields(source.fields())
+        fields.append(QgsField(self.LEVEL_FIELD, QVariant.Double))
+        fields.append(QgsField(self.TIME_FIELD, QVariant.DateTime))
+        fields.append(QgsField(self.VALUE_FIELD, QVariant.Double))
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            source.wkbType(),
+            source.sourceCrs(),
+        )
+
+        features: List[QgsFeature] = list(source.getFeatures())
+        ds: Optional[gdal.Dataset] = None
+        try:
+            ds = gdal.Open(level_bands.uri)
+            if ds is None:
+                raise QgsProcessingException(
+                    tr("Could not open grid {}", level_bands.uri)
+                )
+            transform = QgsCoordinateTransform(
+                source.sourceCrs(), grid_crs(ds), context.transformContext()
+            )
+            xs = np.empty(len(features))
+            ys = np.empty(len(features))
+            for i, feature in enumerate(features):
+                point = transform.transform(feature.geometry().centroid().asPoint())
+                xs[i] = point.x()
+                ys[i] = point.y()
+            feedback.setProgress(10)
+
+            # (times, levels, points)
+            profiles = sample_levels(ds, level_bands, xs, ys)
+        finally:
+            ds = None
+        feedback.setProgress(60)
+
+        levels = level_bands.levels
+        index = level_bands.time_indices.get(levels[0])
+        times = [QDateTime(time) for time in index.times] if index is not None else []
+        for i, feature in enumerate(features):
+            if feedback.isCanceled():
+                break
+            for t in range(profiles.shape[0]):
+                for j, level in enumerate(levels):
+                    value = profiles[t, j, i]
+                    out_feature = QgsFeature(fields)
+                    out_feature.setGeometry(feature.geometry())
+                    out_feature.setAttributes(
+                        feature.attributes()
+                        + [
+                            level,
+                            times[t] if t < len(times) else None,
+                            None if np.isnan(value) else float(value),
+                        ]
+                    )
+                    sink.addFeature(out_feature, QgsFeatureSink.FastInsert)
+            feedback.setProgress(60 + 40 * (i + 1) / max(len(features), 1))
+
+        return {self.OUTPUT: dest_id}
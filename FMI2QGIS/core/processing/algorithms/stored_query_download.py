@@ -0,0 +1,284 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingOutputFile,
+    QgsProcessingParameterDateTime,
+    QgsProcessingParameterExtent,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+)
+
+from ....definitions.configurable_settings import Settings
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...headless import HeadlessRunner, Job, LoaderType
+
+_runner: Optional[HeadlessRunner] = None
+_runner_lock = threading.Lock()
+
+
+def headless_runner() -> HeadlessRunner:
+    """
+    :return: Runner shared by the algorithms, so that the stored queries are
+        listed and expanded only once even in batch mode
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = HeadlessRunner(
+                Settings.FMI_WFS_URL.get(),
+                Settings.FMI_WFS_VERSION.get(),
+                Settings.FMI_DOWNLOAD_URL.get(),
+            )
+        return _runner
+
+
+class StoredQueryDownloadAlgorithm(QgsProcessingAlgorithm):
+    """
+    Base class of the algorithms downloading data with a stored query
+    """
+
+    STORED_QUERY = "STORED_QUERY"
+    EXTENT = "EXTENT"
+    START_TIME = "START_TIME"
+    END_TIME = "END_TIME"
+    PARAMETERS = "PARAMETERS"
+    OTHER_PARAMETERS = "OTHER_PARAMETERS"
+    OUTPUT_DIR = "OUTPUT_DIR"
+    OUTPUT = "OUTPUT"
+
+    # Query parameters set by the typed algorithm parameters
+    BBOX_PARAM = "bbox"
+    START_TIME_PARAM = "starttime"
+    END_TIME_PARAM = "endtime"
+    VARIABLES_PARAM = "param"
+
+    DEFAULT_STORED_QUERY = ""
+    loader_type = LoaderType.RASTER
+
+    def group(self) -> str:
+        return tr("Download")
+
+    def groupId(self) -> str:  # noqa N802
+        return "download"
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.STORED_QUERY,
+                tr("Stored query id"),
+                defaultValue=self.DEFAULT_STORED_QUERY,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterExtent(self.EXTENT, tr("Extent"), optional=True)
+        )
+        self.addParameter(
+            QgsProcessingParameterDateTime(
+                self.START_TIME, tr("Start time (UTC)"), optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterDateTime(
+                self.END_TIME, tr("End time (UTC)"), optional=True
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.PARAMETERS,
+                tr("Parameters (comma separated)"),
+                defaultValue="",
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.OTHER_PARAMETERS,
+                tr("Other query parameters (name=value;name=value)"),
+                defaultValue="",
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_DIR, tr("Download directory")
+            )
+        )
+        self.addOutput(QgsProcessingOutputFile(self.OUTPUT, tr("Downloaded file")))
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        runner = headless_runner()
+        job = self.create_job(parameters, context)
+        feedback.pushInfo(tr("Downloading {}", job.stored_query_id))
+        try:
+            loader = runner.create_loader(job)
+        except Exception as e:
+            raise QgsProcessingException(str(e))
+        # noinspection PyUnresolvedReferences
+        loader.progressChanged.connect(feedback.setProgress)
+        feedback.canceled.connect(loader.cancel)
+        if not loader.run():
+            raise QgsProcessingException(
+                str(loader.exception) if loader.exception else tr("Download failed")
+            )
+        return {self.OUTPUT: str(loader.path_to_file)}
+
+    def create_job(
+        self, parameters: Dict[str, Any], context: QgsProcessingContext
+    ) -> Job:
+        """
+        :return: Job with the query parameters of the algorithm parameters
+        """
+        query_parameters: Dict[str, Any] = {}
+        other = self.parameterAsString(parameters, self.OTHER_PARAMETERS, context)
+        for item in other.split(";"):
+            if not item.strip():
+                continue
+            name, separator, value = item.partition("=")
+            if not separator:
+                raise QgsProcessingException(
+                    tr("Parameter {} is not in form name=value", item)
+                )
+            query_parameters[name.strip()] = value.strip()
+
+        if parameters.get(self.EXTENT) is not None:
+            query_parameters[self.BBOX_PARAM] = self.parameterAsExtent(
+                parameters,
+                self.EXTENT,
+                context,
+                QgsCoordinateReferenceSystem("EPSG:4326"),
+            )
+        for name, param in (
+            (self.START_TIME, self.START_TIME_PARAM),
+            (self.END_TIME, self.END_TIME_PARAM),
+        ):
+            time = self.parameterAsDateTime(parameters, name, context)
+            if time.isValid():
+                query_parameters[param] = time.toPyDateTime()
+        variables = self.parameterAsString(parameters, self.PARAMETERS, context)
+        if variables:
+            query_parameters[self.VARIABLES_PARAM] = variables
+
+        return Job(
+            self.parameterAsString(parameters, self.STORED_QUERY, context),
+            query_parameters,
+            Path(self.parameterAsString(parameters, self.OUTPUT_DIR, context)),
+            self.loader_type,
+        )
+
+
+class GridDownloadAlgorithm(StoredQueryDownloadAlgorithm):
+    """
+    Downloads a grid with a stored query
+    """
+
+    DEFAULT_STORED_QUERY = "fmi::forecast::harmonie::surface::grid"
+    loader_type = LoaderType.RASTER
+
+    def createInstance(self) -> "GridDownloadAlgorithm":  # noqa N802
+        return GridDownloadAlgorithm()
+
+    def name(self) -> str:
+        return "downloadgrid"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Download grid")
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Downloads a NetCDF grid with an FMI stored query, e.g. a forecast. "
+            "The parameters of the stored query that do not have their own "
+            "field can be given as name=value pairs separated by semicolons. "
+            "The fields cannot depend on the stored query given at run time, "
+            "so these parameters are plain text: their names, integer and "
+            "boolean values and the variables are checked against the expanded "
+            "stored query only when the algorithm is run."
+        )
+
+
+class VectorDownloadAlgorithm(StoredQueryDownloadAlgorithm):
+    """
+    Downloads observations with a stored query
+    """
+
+    MAX_FEATURES = "MAX_FEATURES"
+
+    DEFAULT_STORED_QUERY = "fmi::observations::weather::hourly::simple"
+    loader_type = LoaderType.VECTOR
+
+    def createInstance(self) -> "VectorDownloadAlgorithm":  # noqa N802
+        return VectorDownloadAlgorithm()
+
+    def name(self) -> str:
+        return "downloadvector"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Download observations")
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Downloads features with an FMI stored query, e.g. observations, "
+            "into an SQLite file. The parameters of the stored query that do "
+            "not have their own field can be given as name=value pairs separated "
+            "by semicolons. The fields cannot depend on the stored query given "
+            "at run time, so these parameters are plain text: their names, "
+            "integer and boolean values and the variables are checked against "
+            "the expanded stored query only when the algorithm is run."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        super().initAlgorithm(config)
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_FEATURES,
+                tr("Maximum number of features"),
+                QgsProcessingParameterNumber.Integer,
+                optional=True,
+                minValue=1,
+            )
+        )
+
+    def create_job(
+        self, parameters: Dict[str, Any], context: QgsProcessingContext
+    ) -> Job:
+        job = super().create_job(parameters, context)
+        if parameters.get(self.MAX_FEATURES) is not None:
+            job.max_features = self.parameterAsInt(
+                parameters, self.MAX_FEATURES, context
+            )
+        return job
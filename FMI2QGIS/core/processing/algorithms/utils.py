@@ -0,0 +1,121 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsMapLayer,
+    QgsProcessingException,
+)
+
+from ....definitions.configurable_settings import Settings
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.archive import GridArchive
+from ...grid.cache import GridCache, GridCacheEntry
+from ...grid.levels import LevelBands, find_level_variable
+
+MESH_URI_PATTERN = re.compile(r'^\w+:"(?P<path>.+)"(:(?P<variable>.*))?$')
+
+
+def grid_uri(layer: QgsMapLayer) -> str:
+    """
+    :return: GDAL uri of a raster layer or of the variable of a mesh layer
+    """
+    uri = layer.source()
+    if layer.type() != QgsMapLayer.MeshLayer:
+        return uri
+    match = MESH_URI_PATTERN.match(uri)
+    path = match.group("path") if match else uri
+    variable = match.group("variable") if match else None
+
+    ds: Optional[gdal.Dataset] = gdal.Open(path)
+    if ds is None:
+        raise QgsProcessingException(tr("Could not open {}", path))
+    try:
+        sub_datasets = [name for name, _ in ds.GetSubDatasets()]
+    finally:
+        ds = None
+    if not sub_datasets:
+        return path
+    if variable:
+        matching = [
+            name for name in sub_datasets if name.rsplit(":", 1)[-1] == variable
+        ]
+    else:
+        matching = [name for name in sub_datasets if "time_bounds_" not in name]
+    if len(matching) != 1:
+        raise QgsProcessingException(
+            tr("Could not find the variable {} of the mesh layer in {}", variable, path)
+        )
+    return matching[0]
+
+
+def archived_grid(uri: str) -> Optional[Tuple[GridCacheEntry, str]]:
+    """
+    :param uri: GDAL uri of a variable of a downloaded grid
+    :return: archived copy of the grid and the name of the variable, or None
+        if the grid is not archived
+    """
+    match = MESH_URI_PATTERN.match(uri)
+    path = Path(match.group("path") if match else uri)
+    archive_dir = Path(path.parent, Settings.GRID_ARCHIVE_DIR.get())
+    if not archive_dir.is_dir():
+        return None
+    entry = next((e for e in GridCache(path.parent).entries if e.path == path), None)
+    if entry is None:
+        return None
+    archived = GridArchive(archive_dir).archived(entry)
+    if archived is None:
+        return None
+    variable = match.group("variable") if match else None
+    if not variable:
+        variables = list(archived.variables.values())
+        if len(variables) != 1:
+            return None
+        variable = variables[0]
+    return archived, variable
+
+
+def level_variable(path: str, variable: str) -> LevelBands:
+    """
+    :param path: NetCDF file of a hybrid grid
+    :param variable: name of the variable, empty for the first variable
+        with vertical levels
+    :return: LevelBands of the variable
+    """
+    level_bands = find_level_variable(Path(path), variable)
+    if level_bands is None:
+        raise QgsProcessingException(
+            tr("Could not find a variable with vertical levels in {}", path)
+        )
+    return level_bands
+
+
+def grid_crs(ds: gdal.Dataset) -> QgsCoordinateReferenceSystem:
+    """
+    :return: CRS of the dataset, WGS 84 if the dataset has none
+    """
+    wkt = ds.GetProjection()
+    if wkt:
+        return QgsCoordinateReferenceSystem.fromWkt(wkt)
+    return QgsCoordinateReferenceSystem("EPSG:4326")
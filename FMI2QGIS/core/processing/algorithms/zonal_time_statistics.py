@@ -0,0 +1,206 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from osgeo import gdal
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterMapLayer,
+    QgsProcessingParameterString,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QDateTime, QVariant
+
+from ....qgis_plugin_tools.tools.i18n import tr
+from ...grid.time_index import TimeBandIndex
+from ...grid.zonal import percentile_name, rasterize_zones, zonal_statistics
+from .utils import grid_uri
+
+
+class ZonalTimeStatisticsAlgorithm(QgsProcessingAlgorithm):
+    """
+    Computes statistics of polygon zones for every time band of an FMI grid
+    """
+
+    INPUT = "INPUT"
+    GRID = "GRID"
+    PERCENTILES = "PERCENTILES"
+    OUTPUT = "OUTPUT"
+
+    BAND_FIELD = "band"
+    TIME_FIELD = "time"
+    STATISTICS = ("count", "mean", "max")
+
+    def createInstance(self) -> "ZonalTimeStatisticsAlgorithm":  # noqa N802
+        return ZonalTimeStatisticsAlgorithm()
+
+    def name(self) -> str:
+        return "zonaltimestatistics"
+
+    def displayName(self) -> str:  # noqa N802
+        return tr("Zonal statistics over time")
+
+    def group(self) -> str:
+        return tr("Grid analysis")
+
+    def groupId(self) -> str:  # noqa N802
+        return "gridanalysis"
+
+    def shortHelpString(self) -> str:  # noqa N802
+        return tr(
+            "Computes the count, mean, maximum and percentiles of the polygons "
+            "for every time band of a downloaded FMI grid (raster or mesh layer). "
+            "The output table contains one row per polygon and time. "
+            "Percentiles are estimated from histograms of 256 bins per polygon. "
+            "Overlapping parts of the polygons are counted only for the polygon "
+            "that comes last in the input layer."
+        )
+
+    def initAlgorithm(  # noqa N802
+        self, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT, tr("Zones"), [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMapLayer(
+                self.GRID,
+                tr("FMI grid"),
+                types=[QgsProcessing.TypeRaster, QgsProcessing.TypeMesh],
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.PERCENTILES,
+                tr("Percentiles (comma separated)"),
+                defaultValue="50,90",
+                optional=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.OUTPUT, tr("Zonal statistics"), QgsProcessing.TypeVector
+            )
+        )
+
+    def processAlgorithm(  # noqa N802
+        self,
+        parameters: Dict[str, Any],
+        context: QgsProcessingContext,
+        feedback: QgsProcessingFeedback,
+    ) -> Dict[str, Any]:
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        grid_layer = self.parameterAsLayer(parameters, self.GRID, context)
+        if source is None or grid_layer is None:
+            raise QgsProcessingException(tr("Invalid input"))
+        try:
+            percentiles = [
+                float(value)
+                for value in self.parameterAsString(
+                    parameters, self.PERCENTILES, context
+                ).split(",")
+                if value.strip()
+            ]
+        except ValueError:
+            raise QgsProcessingException(tr("Invalid percentiles"))
+        if any(not 0 <= percentile <= 100 for percentile in percentiles):
+            raise QgsProcessingException(
+                tr("Percentiles must be between 0 and 100")
+            )
+
+        statistic_names = list(self.STATISTICS) + [
+            percentile_name(p) for p in percentiles
+        ]
+        fields = QgsFields(source.fields())
+        fields.append(QgsField(self.BAND_FIELD, QVariant.Int))
+        fields.append(QgsField(self.TIME_FIELD, QVariant.DateTime))
+        for name in statistic_names:
+            fields.append(QgsField(name, QVariant.Double))
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.OUTPUT,
+            context,
+            fields,
+            QgsWkbTypes.NoGeometry,
+            source.sourceCrs(),
+        )
+
+        features: List[QgsFeature] = list(source.getFeatures())
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(), grid_layer.crs(), context.transformContext()
+        )
+        geometries_wkb = []
+        for feature in features:
+            geometry = feature.geometry()
+            geometry.transform(transform)
+            geometries_wkb.append(bytes(geometry.asWkb()))
+
+        ds: Optional[gdal.Dataset] = None
+        try:
+            ds = gdal.Open(grid_uri(grid_layer))
+            if ds is None:
+                raise QgsProcessingException(
+                    tr("Could not open grid {}", grid_layer.source())
+                )
+            labels = rasterize_zones(ds, geometries_wkb)
+            feedback.setProgress(20)
+            stats = zonal_statistics(ds, labels, len(features), percentiles)
+            index = TimeBandIndex.from_gdal_dataset(ds)
+        finally:
+            ds = None
+        feedback.setProgress(80)
+
+        times = (
+            {band: QDateTime(time) for band, time in zip(index.bands, index.times)}
+            if index is not None
+            else {}
+        )
+        num_of_bands = stats["count"].shape[0]
+        for zone, feature in enumerate(features):
+            if feedback.isCanceled():
+                break
+            for b in range(num_of_bands):
+                out_feature = QgsFeature(fields)
+                out_feature.setAttributes(
+                    feature.attributes()
+                    + [b + 1, times.get(b + 1)]
+                    + [_to_attribute(stats[name][b, zone]) for name in statistic_names]
+                )
+                sink.addFeature(out_feature, QgsFeatureSink.FastInsert)
+
+        return {self.OUTPUT: dest_id}
+
+
+def _to_attribute(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
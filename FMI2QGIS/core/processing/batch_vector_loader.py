@@ -0,0 +1,165 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from qgis.core import Qgis
+
+from ...definitions.configurable_settings import Settings
+from ...qgis_plugin_tools.tools.resources import plugin_name
+from ..wfs import StoredQueryFactory
+from .base_loader import BaseLoader
+from .vector_loader import VectorLoader
+
+LOGGER = logging.getLogger(plugin_name())
+
+
+class BatchVectorLoader(BaseLoader):
+    """
+    Runs several vector loaders with as few requests as possible. The stored
+    queries of compatible loaders are combined into GetFeature requests and
+    the responses are split back into the files of the loaders.
+    """
+
+    MESSAGE_CATEGORY = "FmiBatchVectorLoader"
+
+    def __init__(
+        self,
+        description: str,
+        loaders: List[VectorLoader],
+        batch_size: Optional[int] = None,
+    ) -> None:
+        """
+        :param loaders: vector loaders that are not run by themselves
+        :param batch_size: maximum number of stored queries in a request,
+            defaults to the setting WFS_BATCH_SIZE
+        """
+        super().__init__(description, loaders[0].download_dir)
+        self.loaders = loaders
+        self.batch_size = batch_size or Settings.WFS_BATCH_SIZE.get(int)
+        # Results of the loaders, None if the loader was not run
+        self.results: List[Optional[bool]] = [None] * len(loaders)
+
+    def run(self) -> bool:
+        """
+        NOTE: LOGGER cannot be used in here or any methods that are called from here
+        :return:
+        """
+        batches = self._batches()
+        for i, batch in enumerate(batches):
+            if self.isCanceled():
+                return False
+            for idx, result in zip(batch, self._run_batch(batch)):
+                self.results[idx] = result
+            self.setProgress(100 * (i + 1) / len(batches))
+        return all(self.results)
+
+    def finished(self, result: bool) -> None:
+        """
+        This function is automatically called when the task has completed
+        (successfully or not).
+
+        finished is always called from the main thread, so it's safe
+        to do GUI operations and raise Python exceptions here.
+
+        :param result: the return value from self.run
+        """
+        for loader, loader_result in zip(self.loaders, self.results):
+            if loader_result is not None:
+                loader.finished(loader_result)
+                self.layer_ids.update(loader.layer_ids)
+        if self.isCanceled():
+            self._report_error(LOGGER)
+
+    def _batches(self) -> List[List[int]]:
+        """
+        :return: indices of the loaders grouped into batches of compatible loaders
+        """
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        batches: List[List[int]] = []
+        for idx, loader in enumerate(self.loaders):
+            key = loader.batch_key
+            if key is None:
+                batches.append([idx])
+            else:
+                groups.setdefault(key, []).append(idx)
+        for indices in groups.values():
+            batches += [
+                indices[i : i + self.batch_size]
+                for i in range(0, len(indices), self.batch_size)
+            ]
+        return batches
+
+    def _run_batch(self, batch: List[int]) -> List[bool]:
+        """
+        :return: results of the loaders of the batch
+        """
+        loaders = [self.loaders[idx] for idx in batch]
+        if len(loaders) == 1:
+            return [loaders[0].run()]
+
+        try:
+            contents = self._get_features(loaders)
+            if contents is not None:
+                return [
+                    self._process_content(loader, content)
+                    for loader, content in zip(loaders, contents)
+                ]
+        finally:
+            for loader in loaders:
+                loader._clean_up()
+
+        # Each loader gets its own features and reports its own errors
+        self._log("Getting the features of the batch separately", Qgis.Warning)
+        return [loader.run() for loader in loaders]
+
+    def _get_features(self, loaders: List[VectorLoader]) -> Optional[List[bytes]]:
+        """
+        Prepares the queries of the loaders and requests their features
+        :return: features of each loader or None if the batch request failed
+        """
+        factory = StoredQueryFactory(loaders[0].wfs_url, loaders[0].wfs_version)
+        try:
+            for loader in loaders:
+                loader._prepare_request()
+            return factory.get_features_in_batch([loader.sq for loader in loaders])
+        except Exception as e:
+            self._log(f"Batch request failed: {e}", Qgis.Warning)
+            return None
+
+    def _process_content(self, loader: VectorLoader, content: bytes) -> bool:
+        """
+        Writes the features of the loader to a file and processes it like the
+        loader would process its own download
+        :return: Whether processing was successful or not
+        """
+        try:
+            output = Path(loader.download_dir, loader.file_name)  # type: ignore
+            with open(output, "wb") as f:
+                f.write(content)
+            loader.path_to_file = loader._process_downloaded_file(output)
+            self._log(f'File path is: "{loader.path_to_file}"')
+            result = loader._process_features()
+        except Exception as e:
+            loader.exception = e
+            result = False
+        loader.setProgress(100)
+        return result
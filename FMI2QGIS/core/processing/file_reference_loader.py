@@ -0,0 +1,274 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from osgeo import gdal
+from qgis.core import QgsDateTimeRange, QgsProject, QgsRasterLayer
+
+from ...definitions.configurable_settings import Settings
+from ...qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+from ...qgis_plugin_tools.tools.i18n import tr
+from ...qgis_plugin_tools.tools.raster_layers import (
+    set_fixed_temporal_range,
+    set_raster_renderer_to_singleband,
+)
+from ...qgis_plugin_tools.tools.resources import plugin_name
+from ..async_downloads import AsyncDownloader
+from ..exceptions.loader_exceptions import LoaderException
+from ..grid.statistics import apply_statistics
+from ..grid.time_index import TimeBandIndex
+from ..wfs import FileReference, StoredQuery, raise_based_on_response
+from .raster_loader import RasterLoader
+
+LOGGER = logging.getLogger(plugin_name())
+
+
+class FileReferenceLoader(RasterLoader):
+    """
+    Downloads all files referenced by the members of the GetFeature response
+    of a grid stored query concurrently and stacks them into a single raster
+    with a band per time step, e.g. a radar loop with an image per time step.
+    Files downloaded earlier are reused.
+    """
+
+    MESSAGE_CATEGORY = "FmiFileReferenceLoader"
+    # Suffixes of the downloaded files by the format parameter of the references
+    FORMAT_SUFFIXES = {
+        "tiff": ".tif",
+        "netcdf": ".nc",
+        "grib2": ".grb2",
+        "grib": ".grb",
+    }
+
+    def __init__(
+        self,
+        description: str,
+        download_dir: Path,
+        wfs_url: str,
+        wfs_version: str,
+        sq: StoredQuery,
+        add_to_map: bool = True,
+    ) -> None:
+        """
+        :param download_dir:Download directory of the output file(s)
+        :param wfs_url: FMI wfs url
+        :param sq: StoredQuery of a grid whose members have file references
+        """
+        # The download urls are in the file references
+        super().__init__(description, download_dir, "", sq, add_to_map)
+        self.wfs_url = wfs_url
+        self.wfs_version = wfs_version
+
+    @staticmethod
+    def supports(sq: StoredQuery) -> bool:
+        """
+        :return: Whether the members of the stored query are separate files
+        """
+        return sq.type == StoredQuery.Type.Files
+
+    @property
+    def is_manually_temporal(self) -> bool:
+        return True
+
+    def run(self) -> bool:
+        """
+        NOTE: LOGGER cannot be used in here or any methods that are called from here
+        :return:
+        """
+        result = False
+        try:
+            self.setProgress(0)
+            references = self._file_references()
+            self.setProgress(10)
+            files = self._download_files(references)
+            if not self.isCanceled():
+                self.path_to_file = self._build_time_stack(files)
+                self._update_band_statistics()
+                result = True
+        except Exception as e:
+            self.exception = e
+            result = False
+
+        self.setProgress(100)
+        return result
+
+    def finished(self, result: bool) -> None:
+        """
+        This function is automatically called when the task has completed
+        (successfully or not).
+
+        finished is always called from the main thread, so it's safe
+        to do GUI operations and raise Python exceptions here.
+
+        :param result: the return value from self.run
+        """
+        if result and self.time_band_index is not None:
+            index = self.time_band_index
+            layer = QgsRasterLayer(str(self.path_to_file), self.sq.title)
+            if layer.isValid() and self.add_to_map:
+                # noinspection PyArgumentList
+                QgsProject.instance().addMapLayer(layer)
+                set_raster_renderer_to_singleband(layer, 1)
+                stats = self.band_statistics.get(str(self.path_to_file))
+                if stats is not None:
+                    apply_statistics(layer, stats)
+                self.time_band_indices[layer.id()] = index
+                try:
+                    set_fixed_temporal_range(
+                        layer,
+                        QgsDateTimeRange(
+                            index.start_time,
+                            index.end_time  # type: ignore
+                            + datetime.timedelta(seconds=1),
+                        ),
+                    )
+                except AttributeError:
+                    pass
+                self.layer_ids.add(layer.id())
+                self._build_overviews_in_background()
+
+        # Error handling
+        else:
+            self._report_error(LOGGER)
+
+    def _construct_uri(self) -> str:
+        url = (
+            f"{self.wfs_url}?service=WFS&version={self.wfs_version}&request=GetFeature"
+        )
+        url += f"&storedquery_id={self.sq.id}"
+        url += "&" + "&".join(
+            [
+                f"{name}={param.value}"
+                for name, param in self.sq.parameters.items()
+                if param.value is not None
+            ]
+        )
+        return url
+
+    def _file_references(self) -> List[FileReference]:
+        """
+        :return: file references of the members that have a time
+        """
+        uri = self._construct_uri()
+        self._log(f'GetFeature url is: "{uri}"')
+        try:
+            content = AsyncDownloader().fetch_all([uri])[0]
+        except QgsPluginNetworkException as e:
+            error_message = e.bar_msg["details"]  # type: ignore
+            if "<?xml" in error_message:
+                raise_based_on_response(error_message[error_message.index("<?xml") :])
+            raise
+
+        references = [
+            reference
+            for reference in FileReference.parse_all(content)
+            if reference.time is not None
+        ]
+        if not references:
+            raise LoaderException(
+                tr("Stored query {} did not return any files", self.sq.id)
+            )
+        self._log(f"Found {len(references)} file references")
+        return references
+
+    def _download_files(
+        self, references: List[FileReference]
+    ) -> List[Tuple[datetime.datetime, Path]]:
+        """
+        Downloads the files that are not in the download directory yet
+        :return: times and paths of the files
+        """
+        names = {self._file_name(reference): reference for reference in references}
+        uris = {
+            name: reference.url
+            for name, reference in names.items()
+            if not Path(self.download_dir, name).is_file()
+        }
+        self._log(f"Downloading {len(uris)} of {len(names)} files")
+        downloaded: Dict[str, int] = {}
+        totals: Dict[str, Optional[int]] = {}
+
+        def report_progress(name: str, num_of_bytes: int, total: Optional[int]) -> None:
+            downloaded[name] = num_of_bytes
+            totals[name] = total
+            known_totals = [t for t in totals.values() if t]
+            if len(known_totals) == len(uris):
+                self.setProgress(10 + 60 * sum(downloaded.values()) / sum(known_totals))
+
+        if uris:
+            AsyncDownloader(Settings.PARALLEL_DOWNLOADS.get(int)).download_all(
+                uris, self.download_dir, report_progress, self.isCanceled
+            )
+        return [
+            (reference.time, Path(self.download_dir, name))  # type: ignore
+            for name, reference in names.items()
+        ]
+
+    def _build_time_stack(self, files: List[Tuple[datetime.datetime, Path]]) -> Path:
+        """
+        Stacks the first band of each file into a VRT with a band per time step
+        :return: path to the VRT
+        """
+        files = sorted(files)
+        digest = hashlib.sha1(
+            "".join(str(path) for _, path in files).encode("utf-8")
+        ).hexdigest()[:10]
+        output = Path(
+            self.download_dir,
+            f"{self.sq.producer or 'grid'}_{files[0][0]:%Y%m%dT%H%M%S}_"
+            f"{files[-1][0]:%Y%m%dT%H%M%S}_{digest}.vrt",
+        )
+        ds: Optional[gdal.Dataset] = gdal.BuildVRT(
+            str(output), [str(path) for _, path in files], separate=True
+        )
+        if ds is None:
+            raise LoaderException(tr("Could not stack the downloaded files"))
+        try:
+            for band, (time, _) in enumerate(files, start=1):
+                ds.GetRasterBand(band).SetDescription(time.isoformat())
+        finally:
+            ds = None
+        self.time_band_index = TimeBandIndex([time for time, _ in files])
+        self._log(f'Stacked {len(files)} files to "{output}"')
+        return output
+
+    def _file_name(self, reference: FileReference) -> str:
+        """
+        :return: name of the downloaded file, unique for each url
+        """
+        query = parse_qs(urlsplit(reference.url).query)
+        file_format = query.get("format", [""])[0].lower()
+        suffix = next(
+            (
+                suffix
+                for name, suffix in self.FORMAT_SUFFIXES.items()
+                if name in file_format
+            ),
+            "",
+        )
+        producer = query.get("producer", [self.sq.producer or "grid"])[0]
+        digest = hashlib.sha1(reference.url.encode("utf-8")).hexdigest()[:10]
+        return f"{producer}_{reference.time:%Y%m%dT%H%M%S}_{digest}{suffix}"
+
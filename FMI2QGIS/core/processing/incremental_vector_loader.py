@@ -0,0 +1,309 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import copy
+import datetime
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from osgeo import ogr
+from qgis.core import QgsProject
+
+from ...qgis_plugin_tools.tools.i18n import tr
+from ...qgis_plugin_tools.tools.resources import plugin_name
+from ..exceptions.loader_exceptions import LoaderException
+from ..wfs import StoredQuery, WFSMetadata
+from .vector_loader import VectorLoader
+
+LOGGER = logging.getLogger(plugin_name())
+
+
+class IncrementalVectorLoader(VectorLoader):
+    """
+    Fetches only the observations newer than the ones already stored in
+    the SQLite file of an existing layer and upserts them into that file.
+    """
+
+    MESSAGE_CATEGORY = "FmiIncrementalVectorLoader"
+    PARAMETER_FIELDS = ("parametername",)
+    START_TIME_PARAM = "starttime"
+    END_TIME_PARAM = "endtime"
+
+    def __init__(
+        self,
+        description: str,
+        download_dir: Path,
+        wfs_url: str,
+        wfs_version: str,
+        sq: StoredQuery,
+        existing_file: Path,
+        layer_id: Optional[str] = None,
+        max_features: Optional[int] = None,
+    ) -> None:
+        """
+        :param download_dir:Download directory of the output file(s)
+        :param wfs_url: FMI wfs url
+        :param sq: StoredQuery used to create the existing file
+        :param existing_file: SQLite file created earlier by VectorLoader
+        :param layer_id: id of the layer to reload after the refresh
+        :param max_features: maximum number of features
+        """
+        # The time parameters are modified, so the original query is left intact
+        super().__init__(
+            description,
+            download_dir,
+            wfs_url,
+            wfs_version,
+            copy.deepcopy(sq),
+            False,
+            max_features,
+        )
+        self.existing_file = existing_file
+        self.layer_id = layer_id
+        self.num_of_added_features = 0
+        self.num_of_updated_features = 0
+        self._temp_dir: Optional[Path] = None
+
+    def run(self) -> bool:
+        """
+        NOTE: LOGGER cannot be used in here or any methods that are called from here
+        :return:
+        """
+        result = False
+        try:
+            self._prepare_request()
+            self.path_to_file, result = self._download()
+            if result and self.path_to_file.is_file():
+                result = self._process_features()
+        except Exception as e:
+            self.exception = e
+            result = False
+        finally:
+            self._clean_up()
+
+        self.setProgress(100)
+        return result
+
+    def finished(self, result: bool) -> None:
+        """
+        This function is automatically called when the task has completed
+        (successfully or not).
+
+        finished is always called from the main thread, so it's safe
+        to do GUI operations and raise Python exceptions here.
+
+        :param result: the return value from self.run
+        """
+        if result:
+            if self.layer_id is not None:
+                # noinspection PyArgumentList
+                layer = QgsProject.instance().mapLayer(self.layer_id)
+                if layer is not None:
+                    layer.dataProvider().reloadData()
+                    layer.triggerRepaint()
+                    self.layer_ids.add(self.layer_id)
+            LOGGER.info(
+                tr(
+                    "Added {} and updated {} observations",
+                    self.num_of_added_features,
+                    self.num_of_updated_features,
+                )
+            )
+
+        # Error handling
+        else:
+            self._report_error(LOGGER)
+
+    def _prepare_request(self) -> None:
+        """
+        Starts the query from the latest stored time. The downloaded and
+        converted files are needed only for the merge, so they are written
+        into a temporary directory.
+        """
+        self._temp_dir = Path(tempfile.mkdtemp(dir=self.download_dir))
+        self.download_dir = self._temp_dir
+        self._update_time_parameters(self._latest_time())
+
+    def _process_features(self) -> bool:
+        """
+        Converts the new features to SpatiaLite and merges them into the
+        existing file
+        :return: Whether processing was successful or not
+        """
+        self._update_vector_metadata()
+        if not all((self.metadata.time_field_idx, self.metadata.fields)):
+            self._log("No new observations")
+            return True
+        return self._convert_to_spatialite() and self._merge_into_existing_file()
+
+    def _clean_up(self) -> None:
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self.download_dir = self._temp_dir.parent
+            self._temp_dir = None
+        self.path_to_file = self.existing_file
+
+    def _update_time_parameters(self, latest_time: Optional[datetime.datetime]) -> None:
+        """
+        Sets the start time of the query to the latest stored time and the end
+        time to the current time
+        """
+        if latest_time is None:
+            return
+        if self.START_TIME_PARAM in self.sq.parameters:
+            # Parameter rounds the time to the nearest ten minutes. Stepping back
+            # five minutes makes sure that the rounded start time never skips
+            # observations, the overlapping ones are deduplicated anyway.
+            self.sq.parameters[self.START_TIME_PARAM].value = (
+                latest_time - datetime.timedelta(minutes=5)
+            )
+        if self.END_TIME_PARAM in self.sq.parameters:
+            self.sq.parameters[self.END_TIME_PARAM].value = datetime.datetime.utcnow()
+
+    def _latest_time(self) -> Optional[datetime.datetime]:
+        """
+        :return: The latest observation time stored in the existing file
+        """
+        ds: Optional[ogr.DataSource] = None
+        try:
+            ds = ogr.Open(str(self.existing_file))
+            if ds is None:
+                raise LoaderException(
+                    tr("Could not open file {}", self.existing_file)
+                )
+            layer = ds.GetLayer(0)
+            time_field = self._time_field_name(layer.GetLayerDefn())
+            sql_layer = ds.ExecuteSQL(
+                f'SELECT MAX(datetime("{time_field}")) FROM "{layer.GetName()}"'
+            )
+            try:
+                feature = sql_layer.GetNextFeature()
+                value = feature.GetFieldAsString(0) if feature is not None else ""
+            finally:
+                ds.ReleaseResultSet(sql_layer)
+        finally:
+            ds = None
+
+        if not value:
+            return None
+        return datetime.datetime.strptime(value, WFSMetadata.TIME_FORMAT)
+
+    def _merge_into_existing_file(self) -> bool:
+        """
+        Upserts the features of the downloaded file into the existing file.
+        Features are deduplicated on (station, time, parameter).
+
+        :return: Whether merge was successful or not
+        """
+        src_ds: Optional[ogr.DataSource] = None
+        dst_ds: Optional[ogr.DataSource] = None
+        try:
+            src_ds = ogr.Open(str(self.path_to_file))
+            dst_ds = ogr.Open(str(self.existing_file), update=1)
+            src_layer: ogr.Layer = src_ds.GetLayer(0)
+            dst_layer: ogr.Layer = dst_ds.GetLayer(0)
+            time_field = self._time_field_name(dst_layer.GetLayerDefn())
+
+            new_features: Dict[Tuple[str, ...], ogr.Feature] = {}
+            min_time: Optional[str] = None
+            for feature in src_layer:
+                key = self._feature_key(feature, time_field)
+                new_features[key] = feature
+                if min_time is None or key[1] < min_time:
+                    min_time = key[1]
+            if not new_features:
+                return True
+
+            # Only the stored features overlapping the new ones can be duplicates
+            dst_layer.SetAttributeFilter(
+                f"datetime(\"{time_field}\") >= datetime('{min_time}')"
+            )
+            existing_fids = {
+                self._feature_key(feature, time_field): feature.GetFID()
+                for feature in dst_layer
+            }
+            dst_layer.SetAttributeFilter(None)
+
+            dst_layer.StartTransaction()
+            dst_defn = dst_layer.GetLayerDefn()
+            for key, src_feature in new_features.items():
+                if key in existing_fids:
+                    dst_feature = dst_layer.GetFeature(existing_fids[key])
+                    dst_feature.SetFrom(src_feature)
+                    dst_layer.SetFeature(dst_feature)
+                    self.num_of_updated_features += 1
+                else:
+                    dst_feature = ogr.Feature(dst_defn)
+                    dst_feature.SetFrom(src_feature)
+                    dst_layer.CreateFeature(dst_feature)
+                    self.num_of_added_features += 1
+            dst_layer.CommitTransaction()
+        except Exception as e:
+            self.exception = e
+            return False
+        finally:
+            src_ds = None
+            dst_ds = None  # noqa: F841
+
+        self._log(
+            f"Added {self.num_of_added_features} and "
+            f"updated {self.num_of_updated_features} features"
+        )
+        return True
+
+    def _feature_key(self, feature: ogr.Feature, time_field: str) -> Tuple[str, ...]:
+        """
+        :return: (station, time, parameter) key of the feature
+        """
+        geometry = feature.GetGeometryRef()
+        station = geometry.ExportToWkt() if geometry is not None else ""
+        time_idx = feature.GetFieldIndex(time_field)
+        time = self._normalized_time(feature, time_idx)
+        parameters = tuple(
+            feature.GetFieldAsString(i)
+            for i in range(feature.GetFieldCount())
+            if feature.GetFieldDefnRef(i).GetName().lower() in self.PARAMETER_FIELDS
+        )
+        return (station, time) + parameters
+
+    @staticmethod
+    def _normalized_time(feature: ogr.Feature, field_idx: int) -> str:
+        """
+        :return: time of the feature formatted like SQLite datetime()
+        """
+        year, month, day, hour, minute, second, _ = feature.GetFieldAsDateTime(
+            field_idx
+        )
+        return datetime.datetime(
+            year, month, day, hour, minute, int(second)
+        ).strftime(WFSMetadata.TIME_FORMAT)
+
+    @staticmethod
+    def _time_field_name(defn: ogr.FeatureDefn) -> str:
+        for i in range(defn.GetFieldCount()):
+            field_defn = defn.GetFieldDefn(i)
+            if (
+                field_defn.GetName().lower() in WFSMetadata.DATETIME_FIELDS
+                and field_defn.GetType() in WFSMetadata.DATETIME_TYPES
+            ):
+                return field_defn.GetName()
+        raise LoaderException(tr("Could not find the time field of the layer"))
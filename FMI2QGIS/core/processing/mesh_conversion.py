@@ -0,0 +1,56 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# Run in the spawned worker processes of MeshLoader, so this module must not
+# import qgis or anything else but GDAL.
+
+from typing import Dict, List, Optional
+
+from osgeo import gdal
+
+
+def write_virtual_copy(
+    sub_ds_name: str,
+    dst_filename: str,
+    metadata: Dict[str, str],
+    band_metadata: List[Dict[str, str]],
+) -> str:
+    """
+    Writes a VRT file that references the data of the subdataset and
+    overrides its metadata. No pixel data is read or copied.
+    :param sub_ds_name: GDAL name of the subdataset or path to the file
+    :param dst_filename: path to the VRT file
+    :param metadata: metadata of the dataset
+    :param band_metadata: metadata of each band
+    :return: path to the VRT file
+    """
+    src_ds: Optional[gdal.Dataset] = None
+    vrt_ds: Optional[gdal.Dataset] = None
+    try:
+        src_ds = gdal.Open(sub_ds_name)
+        assert src_ds
+        vrt_ds = gdal.GetDriverByName("VRT").CreateCopy(dst_filename, src_ds, 0)
+        vrt_ds.SetMetadata(metadata)
+        for b, band_md in enumerate(band_metadata, start=1):
+            vrt_ds.GetRasterBand(b).SetMetadata(band_md)
+    finally:
+        # Properly close the datasets to flush to disk
+        vrt_ds = None
+        src_ds = None
+    return dst_filename
@@ -18,15 +18,21 @@
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 
 import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from osgeo import gdal
 from qgis.core import QgsMeshLayer, QgsProject
+from qgis.PyQt.QtCore import pyqtSignal
 
 from ...definitions.configurable_settings import Settings
 from ...qgis_plugin_tools.tools.resources import plugin_name
 from ..wfs import StoredQuery
+from .mesh_conversion import write_virtual_copy
 from .raster_loader import RasterLoader
 
 try:
@@ -39,6 +45,11 @@ LOGGER = logging.getLogger(plugin_name())
 
 class MeshLoader(RasterLoader):
     MESSAGE_CATEGORY = "FmiMeshLoader"
+    # MDAL driver that reads the virtual files through GDAL
+    VIRTUAL_FILE_DRIVER = "GDAL_NetCDF"
+
+    # Emitted from the worker threads with the name of the layer and path to the file
+    file_converted = pyqtSignal(str, str)
 
     def __init__(
         self,
@@ -55,6 +66,10 @@ class MeshLoader(RasterLoader):
         """
         super().__init__(description, download_dir, fmi_download_url, sq, add_to_map)
         self.paths_to_files: Dict[str, Path] = {}
+        self.added_layer_names: Set[str] = set()
+        # Queued to the main thread, so that layers are added as soon as converted
+        # noinspection PyUnresolvedReferences
+        self.file_converted.connect(self._add_converted_layer)
 
     @property
     def is_manually_temporal(self) -> bool:
@@ -67,6 +82,7 @@ class MeshLoader(RasterLoader):
         """
         self.path_to_file, result = self._download()
         if result and self.path_to_file.is_file():
+            self._derive_variables()
             result = self._convert_to_mesh_compatible_files()
         self.setProgress(100)
         return result
@@ -79,6 +95,11 @@ class MeshLoader(RasterLoader):
         have temporal dimension called "time_h". QgsMeshLayer seems to work only
         with temporal variables called "time" so metadata has to be updated.
 
+        Each variable is split to a virtual (VRT) file that references the data
+        of the source file and carries the fixed metadata, so the bulk data is
+        never copied. Files with a single, already compatible variable are used
+        as they are.
+
         :return: Whether conversion was successful or not
         """
         result = True
@@ -86,51 +107,35 @@ class MeshLoader(RasterLoader):
             ds: Optional[gdal.Dataset]
             try:
                 ds = gdal.Open(str(self.path_to_file))
+                all_sub_datasets = [sub_ds for sub_ds, _ in ds.GetSubDatasets()]
                 sub_datasets = [
                     sub_ds
-                    for sub_ds, _ in ds.GetSubDatasets()
+                    for sub_ds in all_sub_datasets
                     if "time_bounds_" not in sub_ds
                 ]
             finally:
                 ds = None
 
-            if sub_datasets:
-                self._log("Converting files to be mesh compatible")
-                format = "NETCDF"
-                driver = gdal.GetDriverByName(format)
-
-                for sub_ds_name in sub_datasets:
-                    var_name = sub_ds_name.split(":")[-1]
-                    long_name = var_name
-                    dst_filename = str(self.path_to_file).replace(
-                        ".nc", f"_{var_name}.nc"
-                    )
-                    src_ds: Optional[gdal.Dataset]
-                    try:
-                        src_ds = gdal.Open(sub_ds_name)
-                        assert src_ds
-
-                        metadata = src_ds.GetMetadata()
-                        src_ds.SetMetadata(self.metadata.fix_gdal_metadata(metadata))
-
-                        for b in range(1, src_ds.RasterCount + 1):
-                            band = src_ds.GetRasterBand(b)
-                            metadata = band.GetMetadata()
-                            if b == 1:
-                                long_name = metadata.get("long_name", long_name)
-                            band.SetMetadata(self.metadata.fix_gdal_metadata(metadata))
-
-                        # Output to new format
-                        dst_ds = driver.CreateCopy(dst_filename, src_ds, 0)
-
-                        # Properly close the datasets to flush to disk
-                        dst_ds = None  # noqa: F841
-                        src_ds = None
-                    finally:
-                        ds = None
-                    self.paths_to_files[long_name] = Path(dst_filename)
-
-            else:
+            if not all_sub_datasets:
+                # The file itself is the only variable
+                sub_datasets = [str(self.path_to_file)]
+            sources = {
+                sub_ds: self._sub_dataset_metadata(sub_ds) for sub_ds in sub_datasets
+            }
+
+            if len(all_sub_datasets) <= 1 and len(sub_datasets) == 1:
+                sub_ds = sub_datasets[0]
+                metadata, band_metadata = sources[sub_ds]
+                if self._is_mesh_compatible(metadata, band_metadata):
+                    name = self._layer_name(sub_ds, band_metadata)
+                    self.paths_to_files[name] = self.path_to_file
+                    sources = {}
+
+            if sources:
+                self._log("Creating mesh compatible virtual files")
+                result = self._convert_sub_datasets(sources)
+
+            if result and not self.paths_to_files:
                 layer_name = self.sq.title
                 self.paths_to_files[layer_name] = self.path_to_file
         except Exception as e:
@@ -141,6 +146,87 @@ class MeshLoader(RasterLoader):
 
         return result
 
+    @staticmethod
+    def _sub_dataset_metadata(
+        sub_ds_name: str,
+    ) -> Tuple[Dict[str, str], List[Dict[str, str]]]:
+        """
+        :return: metadata of the subdataset and each of its bands
+        """
+        src_ds: Optional[gdal.Dataset] = None
+        try:
+            src_ds = gdal.Open(sub_ds_name)
+            assert src_ds
+            return src_ds.GetMetadata(), [
+                src_ds.GetRasterBand(b).GetMetadata()
+                for b in range(1, src_ds.RasterCount + 1)
+            ]
+        finally:
+            src_ds = None
+
+    def _is_mesh_compatible(
+        self, metadata: Dict[str, str], band_metadata: List[Dict[str, str]]
+    ) -> bool:
+        return all(
+            self.metadata.fix_gdal_metadata(md) == md
+            for md in [metadata, *band_metadata]
+        )
+
+    def _layer_name(self, sub_ds_name: str, band_metadata: List[Dict[str, str]]) -> str:
+        """
+        :return: long name of the variable or the title of the stored query
+            if the file has no subdatasets
+        """
+        if sub_ds_name == str(self.path_to_file):
+            return self.sq.title
+        var_name = sub_ds_name.split(":")[-1]
+        if band_metadata:
+            return band_metadata[0].get("long_name", var_name)
+        return var_name
+
+    def _convert_sub_datasets(
+        self, sources: Dict[str, Tuple[Dict[str, str], List[Dict[str, str]]]]
+    ) -> bool:
+        """
+        Writes the virtual files of the subdatasets in a pool of processes.
+        GDAL serializes the calls of the netCDF driver with a global lock, so
+        opening the subdatasets does not run in parallel in threads of a
+        single process.
+        :param sources: metadata of the subdatasets and their bands
+        :return: Whether all subdatasets were converted or not
+        """
+        workers = max(1, Settings.MESH_CONVERSION_WORKERS.get(int))
+        with _process_pool(min(workers, len(sources))) as executor:
+            futures = {
+                executor.submit(
+                    write_virtual_copy,
+                    sub_ds_name,
+                    self._converted_file_name(sub_ds_name),
+                    self.metadata.fix_gdal_metadata(metadata),
+                    [self.metadata.fix_gdal_metadata(md) for md in band_metadata],
+                ): self._layer_name(sub_ds_name, band_metadata)
+                for sub_ds_name, (metadata, band_metadata) in sources.items()
+            }
+            for i, future in enumerate(as_completed(futures)):
+                if self.isCanceled():
+                    for f in futures:
+                        f.cancel()
+                    return False
+                long_name = futures[future]
+                dst_path = future.result()
+                self.paths_to_files[long_name] = Path(dst_path)
+                self.file_converted.emit(long_name, dst_path)
+                self.setProgress(70 + 30 * (i + 1) / len(futures))
+        return True
+
+    def _converted_file_name(self, sub_ds_name: str) -> str:
+        if sub_ds_name == str(self.path_to_file):
+            return str(self.path_to_file.with_suffix(".vrt"))
+        var_name = sub_ds_name.split(":")[-1]
+        return str(
+            self.path_to_file.with_name(f"{self.path_to_file.stem}_{var_name}.vrt")
+        )
+
     def finished(self, result: bool) -> None:
         """
         This function is automatically called when the task has completed
@@ -152,7 +238,11 @@ class MeshLoader(RasterLoader):
         :param result: the return value from self.run
         """
         if result and self.path_to_file.is_file():
-            layers = self._files_to_mesh_layers()
+            layers = self._files_to_mesh_layers(
+                name
+                for name in self.paths_to_files.keys()
+                if name not in self.added_layer_names
+            )
             for layer in layers:
                 if layer.isValid() and self.add_to_map:
                     # noinspection PyArgumentList
@@ -161,17 +251,79 @@ class MeshLoader(RasterLoader):
 
         # Error handling
         else:
+            self._remove_added_layers()
             self._report_error(LOGGER)
 
-    def _files_to_mesh_layers(self) -> Set[QgsMeshLayer]:
+    def _remove_added_layers(self) -> None:
+        """
+        Removes the layers added while the files were being converted, so that
+        a canceled or failed task leaves no partial results in the project
+        """
+        if self.layer_ids:
+            # noinspection PyArgumentList
+            QgsProject.instance().removeMapLayers(list(self.layer_ids))
+        self.layer_ids.clear()
+        self.added_layer_names.clear()
+
+    def _add_converted_layer(self, name: str, file_path: str) -> None:
+        """
+        Adds the layer of a converted file to the map while the rest
+        of the files are still being converted
+        """
+        if not self.add_to_map or name in self.added_layer_names:
+            return
+        layer = self._file_to_mesh_layer(name, Path(file_path))
+        if layer.isValid():
+            # noinspection PyArgumentList
+            QgsProject.instance().addMapLayer(layer)
+            self.layer_ids.add(layer.id())
+            self.added_layer_names.add(name)
+
+    def _files_to_mesh_layers(
+        self, names: Optional[Iterable[str]] = None
+    ) -> Set[QgsMeshLayer]:
         """
         Creates QgsMeshLayer out of the grid file(s)
+        :param names: names of the files to create layers from, defaults to all
         :return: Set of QgsMeshLayers
         """
-        layers: Set[QgsMeshLayer] = {
-            QgsMeshLayer(str(file_path), name, Settings.MESH_PROVIDER_LIB.get())
-            for name, file_path in self.paths_to_files.items()
+        names = self.paths_to_files.keys() if names is None else names
+        return {
+            self._file_to_mesh_layer(name, self.paths_to_files[name]) for name in names
         }
-        for layer in layers:
-            layer.temporalProperties().setIsActive(True)
-        return layers
+
+    @classmethod
+    def _file_to_mesh_layer(cls, name: str, file_path: Path) -> QgsMeshLayer:
+        uri = str(file_path)
+        if file_path.suffix == ".vrt":
+            uri = f'{cls.VIRTUAL_FILE_DRIVER}:"{uri}"'
+        layer = QgsMeshLayer(uri, name, Settings.MESH_PROVIDER_LIB.get())
+        layer.temporalProperties().setIsActive(True)
+        return layer
+
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    :return: pool of freshly spawned Python processes. Forking the QGIS
+        process is not safe and sys.executable may be the QGIS binary.
+    """
+    context = multiprocessing.get_context("spawn")
+    executable = _python_executable()
+    if executable is not None:
+        context.set_executable(executable)
+    return ProcessPoolExecutor(max_workers, mp_context=context)
+
+
+def _python_executable() -> Optional[str]:
+    """
+    :return: Python interpreter of the running QGIS or None if not found
+    """
+    if Path(sys.executable).name.lower().startswith("python"):
+        return sys.executable
+    names = ("pythonw.exe", "python.exe") if os.name == "nt" else ("python3",)
+    for directory in (sys.exec_prefix, os.path.join(sys.exec_prefix, "bin")):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+    return None
@@ -0,0 +1,189 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from osgeo import gdal
+from qgis.core import Qgis, QgsMessageLog, QgsProject, QgsTask
+
+from ...qgis_plugin_tools.tools.custom_logging import bar_msg
+from ...qgis_plugin_tools.tools.i18n import tr
+from ...qgis_plugin_tools.tools.resources import plugin_name
+
+LOGGER = logging.getLogger(plugin_name())
+
+# e.g. NETCDF:"/path/to/file.nc":air_temperature
+SUB_DATASET_PATTERN = re.compile(
+    r'(?P<driver>\w+):"?(?P<path>.+?)"?:(?P<variable>[^:"]+)'
+)
+
+
+class OverviewBuilder(QgsTask):
+    """
+    Builds external overviews (.ovr) for the rasters of added layers
+    and reloads the layers afterwards. Subdatasets, such as NetCDF variables,
+    cannot have external overviews of their own, so their overviews are built
+    for a VRT of the subdataset and the layers are switched to the VRT.
+    """
+
+    MESSAGE_CATEGORY = "FmiOverviewBuilder"
+    MIN_OVERVIEW_SIZE = 64  # pixels
+
+    def __init__(
+        self,
+        description: str,
+        layer_uris: Dict[str, str],
+        levels: Sequence[int],
+        resampling: str = "AVERAGE",
+    ) -> None:
+        """
+        :param layer_uris: GDAL uris of the rasters by layer id
+        :param levels: overview decimation factors
+        :param resampling: GDAL overview resampling method
+        """
+        super().__init__(description, QgsTask.CanCancel)
+        self.layer_uris = layer_uris
+        self.levels = sorted(levels)
+        self.resampling = resampling
+        self.built_layer_ids: List[str] = []
+        # Uris of the VRTs that have the overviews of subdatasets by layer id
+        self.overview_uris: Dict[str, str] = {}
+        self.exception: Optional[Exception] = None
+
+    def run(self) -> bool:
+        """
+        NOTE: LOGGER cannot be used in here or any methods that are called from here
+        :return:
+        """
+        num_of_rasters = len(self.layer_uris)
+        for i, (layer_id, uri) in enumerate(self.layer_uris.items()):
+            if self.isCanceled():
+                return False
+            try:
+                overview_uri = self._overview_uri(uri)
+                if overview_uri != uri:
+                    self.overview_uris[layer_id] = overview_uri
+                if self._build_overviews(overview_uri, i, num_of_rasters):
+                    self.built_layer_ids.append(layer_id)
+            except RuntimeError as e:
+                self.exception = e
+                self._log(f"Could not build overviews for {uri}: {e}", Qgis.Warning)
+        self.setProgress(100)
+        return not self.isCanceled()
+
+    def finished(self, result: bool) -> None:
+        """
+        This function is automatically called when the task has completed
+        (successfully or not).
+
+        finished is always called from the main thread, so it's safe
+        to do GUI operations and raise Python exceptions here.
+
+        :param result: the return value from self.run
+        """
+        for layer_id in self.built_layer_ids:
+            # noinspection PyArgumentList
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if layer is None:
+                continue
+            if layer_id in self.overview_uris:
+                layer.setDataSource(
+                    self.overview_uris[layer_id], layer.name(), layer.providerType()
+                )
+            else:
+                # Provider has to reopen the dataset to see the overviews
+                layer.dataProvider().reloadData()
+            layer.triggerRepaint()
+        if self.exception is not None:
+            LOGGER.warning(
+                tr("Could not build overviews for all layers"),
+                extra=bar_msg(self.exception),
+            )
+
+    def _build_overviews(self, uri: str, idx: int, num_of_rasters: int) -> bool:
+        """
+        :return: Whether overviews were built or not
+        """
+        ds: Optional[gdal.Dataset] = None
+        try:
+            ds = gdal.Open(uri)
+            if ds is None:
+                raise RuntimeError(f"Could not open {uri}")
+            if ds.GetRasterBand(1).GetOverviewCount() > 0:
+                return False
+            min_size = min(ds.RasterXSize, ds.RasterYSize)
+            levels = [
+                level
+                for level in self.levels
+                if min_size // level >= self.MIN_OVERVIEW_SIZE
+            ]
+            if not levels:
+                return False
+
+            def progress(complete: float, message: str, data: None) -> int:
+                self.setProgress(100 * (idx + complete) / num_of_rasters)
+                return 0 if self.isCanceled() else 1
+
+            # Read-only datasets get external .ovr overviews
+            ds.BuildOverviews(self.resampling, levels, progress)
+            return not self.isCanceled()
+        finally:
+            ds = None
+
+    @staticmethod
+    def _overview_uri(uri: str) -> str:
+        """
+        Creates a VRT of a subdataset next to its file if it does not exist
+        :return: uri of the dataset whose overviews are built
+        """
+        match = SUB_DATASET_PATTERN.fullmatch(uri)
+        if Path(uri).exists() or match is None:
+            return uri
+        path = Path(match.group("path"))
+        vrt_path = path.with_name(f'{path.stem}_{match.group("variable")}.vrt')
+        if not vrt_path.exists():
+            src_ds: Optional[gdal.Dataset] = None
+            vrt_ds: Optional[gdal.Dataset] = None
+            try:
+                src_ds = gdal.Open(uri)
+                if src_ds is None:
+                    raise RuntimeError(f"Could not open {uri}")
+                vrt_ds = gdal.GetDriverByName("VRT").CreateCopy(str(vrt_path), src_ds)
+            finally:
+                vrt_ds = None  # noqa: F841
+                src_ds = None
+        return str(vrt_path)
+
+    def _log(self, msg: str, level: int = Qgis.Info) -> None:
+        """
+        Used to log messages instead of LOGGER while in task thread
+        """
+        # noinspection PyCallByClass,PyTypeChecker
+        QgsMessageLog.logMessage(msg, self.MESSAGE_CATEGORY, level)
+
+
+def overview_levels(value: str) -> List[int]:
+    """
+    Parses comma separated overview levels such as "2,4,8,16"
+    :return: levels or empty list if overviews are disabled
+    """
+    return [int(level) for level in value.split(",") if level.strip()]
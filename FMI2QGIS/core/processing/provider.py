@@ -19,6 +19,18 @@
 
 from qgis.core import QgsProcessingProvider
 
+from .algorithms.cross_section import CrossSectionAlgorithm
+from .algorithms.enfuser_archive import EnfuserArchiveAlgorithm
+from .algorithms.enfuser_download import EnfuserDownloadAlgorithm
+from .algorithms.point_time_series import PointTimeSeriesAlgorithm
+from .algorithms.run_comparison import RunComparisonAlgorithm
+from .algorithms.sounding_profile import SoundingProfileAlgorithm
+from .algorithms.stored_query_download import (
+    GridDownloadAlgorithm,
+    VectorDownloadAlgorithm,
+)
+from .algorithms.zonal_time_statistics import ZonalTimeStatisticsAlgorithm
+
 
 class Fmi2QgisProcessingProvider(QgsProcessingProvider):
     ID = "fmi2qgis"
@@ -27,8 +39,17 @@ class Fmi2QgisProcessingProvider(QgsProcessingProvider):
         QgsProcessingProvider.__init__(self)
 
     def loadAlgorithms(self) -> None:  # noqa N802
-        # Add processing algorithms if there are any
-        for alg in []:  # type: ignore
+        for alg in [
+            PointTimeSeriesAlgorithm(),
+            ZonalTimeStatisticsAlgorithm(),
+            RunComparisonAlgorithm(),
+            CrossSectionAlgorithm(),
+            SoundingProfileAlgorithm(),
+            VectorDownloadAlgorithm(),
+            GridDownloadAlgorithm(),
+            EnfuserDownloadAlgorithm(),
+            EnfuserArchiveAlgorithm(),
+        ]:
             self.addAlgorithm(alg)
 
     def id(self) -> str:
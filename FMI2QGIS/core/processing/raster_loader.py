@@ -17,13 +17,16 @@
 #  You should have received a copy of the GNU General Public License
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 
+import datetime
 import logging
 from pathlib import Path
-from typing import Set
+from typing import Dict, List, Optional, Set, Tuple
 
 from osgeo import gdal
-from qgis.core import QgsProject, QgsRasterLayer
+from qgis.core import Qgis, QgsApplication, QgsProject, QgsRasterLayer
+from qgis.utils import iface
 
+from ...definitions.configurable_settings import Settings
 from ...qgis_plugin_tools.tools.custom_logging import bar_msg
 from ...qgis_plugin_tools.tools.exceptions import QgsPluginNotImplementedException
 from ...qgis_plugin_tools.tools.i18n import tr
@@ -32,8 +35,16 @@ from ...qgis_plugin_tools.tools.raster_layers import (
     set_raster_renderer_to_singleband,
 )
 from ...qgis_plugin_tools.tools.resources import plugin_name
-from ..wfs import StoredQuery
+from ..grid.archive import GridArchive
+from ..grid.cache import GridCache, GridCacheEntry, read_origin_time
+from ..grid.derived import DERIVED_VARIABLE_NAMES, add_derived_variables
+from ..grid.levels import LevelBands
+from ..grid.statistics import BandStatistics, apply_statistics, statistics_for_file
+from ..grid.time_index import TimeBandIndex
+from ..level_group import LazyLevelGroup
+from ..wfs import Parameter, StoredQuery
 from .base_loader import BaseLoader
+from .overview_builder import OverviewBuilder, overview_levels
 
 try:
     from qgis.core import QgsRasterLayerTemporalProperties
@@ -63,6 +74,14 @@ class RasterLoader(BaseLoader):
         self.url = fmi_download_url
         self.sq = sq
         self.add_to_map = add_to_map
+        self.time_band_index: Optional[TimeBandIndex] = None
+        self.time_band_indices: Dict[str, Optional[TimeBandIndex]] = {}
+        self.band_statistics: Dict[str, BandStatistics] = {}
+        self.overview_builder: Optional[OverviewBuilder] = None
+        self.grid_cache = GridCache(download_dir)
+        self.is_from_cache = False
+        self.level_bands: Dict[str, LevelBands] = {}
+        self.level_groups: List[LazyLevelGroup] = []
 
     @property
     def is_manually_temporal(self) -> bool:
@@ -76,26 +95,167 @@ class RasterLoader(BaseLoader):
         self.path_to_file, result = self._download()
         if result and self.path_to_file.is_file():
             result = self._update_raster_metadata()
+            if result and not self.is_from_cache:
+                entry = self._add_to_grid_cache()
+                if entry is not None and Settings.ARCHIVE_GRIDS.get(bool):
+                    self._archive_grid(entry)
+            if result:
+                self._add_derived_layers(self._derive_variables())
+                self._update_level_bands()
+            if result and self.metadata.is_temporal:
+                self._update_band_statistics()
         self.setProgress(100)
         return result
 
+    def _download(self) -> Tuple[Path, bool]:
+        """
+        Subsets the grid from a cached grid covering the request or downloads it
+        :return: Path to the file and whether was succesful or not
+        """
+        request = GridCacheEntry.from_stored_query(self.sq)
+        if request is not None and request.origin_time is None:
+            # The latest run is looked up with the run it currently resolves to
+            request.origin_time = self.sq.latest_origin_time(
+                datetime.timedelta(minutes=Settings.FILE_REFERENCE_MAX_AGE.get(int))
+            )
+        cached = self.grid_cache.find(request) if request is not None else None
+        if request is not None and cached is not None:
+            try:
+                self.setProgress(10)
+                output = self.grid_cache.subset(cached, request)
+                self._log(f'Subset "{output}" from cached grid "{cached.path}"')
+                self.is_from_cache = True
+                self.setProgress(70)
+                return output, True
+            except RuntimeError as e:
+                self._log(f"Could not use cached grid: {e}", Qgis.Warning)
+        return super()._download()
+
+    def _derive_variables(self) -> Dict[str, str]:
+        """
+        Adds the derived variables, such as wind speed, to the downloaded NetCDF
+        :return: long names of the added variables by their names
+        """
+        if (
+            not Settings.DERIVED_VARIABLES.get(bool)
+            or self.path_to_file.suffix != ".nc"
+        ):
+            return {}
+        try:
+            derived = add_derived_variables(
+                self.path_to_file, origin_time=self._origin_time()
+            )
+        except RuntimeError as e:
+            self._log(f"Could not compute derived variables: {e}", Qgis.Warning)
+            return {}
+        if derived:
+            self._log(f"Added derived variables {', '.join(derived)}")
+        return derived
+
+    def _origin_time(self) -> Optional[datetime.datetime]:
+        """
+        :return: origin time of the requested forecast run or None if the
+            latest run was requested
+        """
+        origin_time = self._query_parameters().get("origintime")
+        if origin_time is None:
+            return None
+        try:
+            return datetime.datetime.strptime(origin_time, Parameter.TIME_FORMAT)
+        except ValueError:
+            return None
+
+    def _add_derived_layers(self, derived: Dict[str, str]) -> None:
+        if not derived:
+            return
+        if self.metadata.sub_dataset_dict is None:
+            # The file had a single variable, but now it has subdatasets
+            ds: Optional[gdal.Dataset] = None
+            try:
+                ds = gdal.Open(str(self.path_to_file))
+                uris = [
+                    uri
+                    for uri, _ in ds.GetSubDatasets()
+                    if uri.rsplit(":", 1)[-1] not in DERIVED_VARIABLE_NAMES
+                    and "time_bounds_" not in uri
+                ]
+            finally:
+                ds = None
+            self.metadata.sub_dataset_dict = {self.sq.title: uris[0]} if uris else {}
+        for name, long_name in derived.items():
+            self.metadata.sub_dataset_dict[
+                long_name
+            ] = f'NETCDF:"{self.path_to_file}":{name}'
+
+    def _add_to_grid_cache(self) -> Optional[GridCacheEntry]:
+        entry = GridCacheEntry.from_stored_query(self.sq, self.path_to_file)
+        if entry is None:
+            return None
+        if entry.origin_time is None:
+            # Latest run was requested, the run of the grid can be read from
+            # the file only
+            entry.origin_time = read_origin_time(self.path_to_file)
+        if self.time_band_index is not None and len(self.time_band_index):
+            # The grid covers the actual times, not the requested ones
+            entry.start_time = self.time_band_index.start_time  # type: ignore
+            entry.end_time = self.time_band_index.end_time  # type: ignore
+        if self.metadata.sub_dataset_dict is not None:
+            entry.variables = {
+                param: uri.rsplit(":", 1)[-1]
+                for param, uri in self.metadata.sub_dataset_dict.items()
+            }
+        self.grid_cache.add(entry)
+        return entry
+
+    def _archive_grid(self, entry: GridCacheEntry) -> None:
+        archive = GridArchive(
+            Path(self.download_dir, Settings.GRID_ARCHIVE_DIR.get())
+        )
+        try:
+            archived = archive.archive(entry)
+            self._log(f'Archived grid to "{archived.path}"')
+        except RuntimeError as e:
+            self._log(f"Could not archive the grid: {e}", Qgis.Warning)
+
     def _construct_uri(self) -> str:
-        url = self.url + f"?producer={self.sq.producer}"
+        query = self._query_parameters()
+        # A file reference discovered by expand avoids url construction mismatches
+        reference_url = self.sq.matching_file_reference(
+            query,
+            datetime.timedelta(minutes=Settings.FILE_REFERENCE_MAX_AGE.get(int)),
+        )
+        if reference_url is not None:
+            self._log("Using the file reference of the stored query")
+            return reference_url
+        return self.url + "?" + "&".join(
+            f"{name}={value}" for name, value in query.items()
+        )
+
+    def _query_parameters(self) -> Dict[str, str]:
+        """
+        :return: query parameters of the download url
+        """
+        query = {"producer": self.sq.producer}
         if (
             "format" not in self.sq.parameters
             or self.sq.parameters["format"].value is None
         ):
-            url += f"&format={self.sq.format}"
-        url += "&" + "&".join(
-            [
-                f"{name}={param.value}"
+            query["format"] = self.sq.format
+        query.update(
+            {
+                name: str(param.value)
                 for name, param in self.sq.parameters.items()
                 if param.value is not None
-            ]
+            }
         )
-        if "starttime" in self.sq.parameters and "levels" in self.sq.parameters:
-            url += f'&origintime={self.sq.parameters["starttime"].value}'
-        return url
+        origin_time = self.sq.parameters.get("origintime")
+        if (
+            "starttime" in self.sq.parameters
+            and "levels" in self.sq.parameters
+            and (origin_time is None or origin_time.value is None)
+        ):
+            query["origintime"] = str(self.sq.parameters["starttime"].value)
+        return query
 
     def finished(self, result: bool) -> None:
         """
@@ -115,6 +275,10 @@ class RasterLoader(BaseLoader):
                     QgsProject.instance().addMapLayer(layer)
                     if self.metadata.is_temporal:
                         set_raster_renderer_to_singleband(layer, 1)
+                        stats = self.band_statistics.get(layer.source())
+                        if stats is not None:
+                            apply_statistics(layer, stats)
+                        self.time_band_indices[layer.id()] = self.time_band_index
                         try:
                             set_fixed_temporal_range(layer, self.metadata.time_range)
                         except AttributeError:
@@ -132,12 +296,40 @@ class RasterLoader(BaseLoader):
                             )
 
                     self.layer_ids.add(layer.id())
+            if self.add_to_map:
+                self._add_level_groups()
+                self._build_overviews_in_background()
 
         # Error handling
         else:
             if self.exception is None:
                 self._report_error(LOGGER)
 
+    def _build_overviews_in_background(self) -> None:
+        """
+        Starts a task that builds overviews for the added layers
+        """
+        levels = overview_levels(Settings.RASTER_OVERVIEW_LEVELS.get())
+        if not levels:
+            return
+        # noinspection PyArgumentList
+        project = QgsProject.instance()
+        layer_uris = {
+            layer_id: project.mapLayer(layer_id).source()
+            for layer_id in self.layer_ids
+            if project.mapLayer(layer_id) is not None
+        }
+        if not layer_uris:
+            return
+        self.overview_builder = OverviewBuilder(
+            tr("Build overviews"),
+            layer_uris,
+            levels,
+            Settings.RASTER_OVERVIEW_RESAMPLING.get(),
+        )
+        # noinspection PyArgumentList
+        QgsApplication.taskManager().addTask(self.overview_builder)
+
     def raster_to_layers(self) -> Set[QgsRasterLayer]:
         """
         Creates QgsRasterLayers out of raster file
@@ -145,15 +337,75 @@ class RasterLoader(BaseLoader):
         """
         # TODO: add support for other raster formats
         layers: Set[QgsRasterLayer] = set()
-        if self.metadata.sub_dataset_dict is not None:
-            for layer_name, layer_uri in self.metadata.sub_dataset_dict.items():
+        for layer_name, layer_uri in self._layer_uris().items():
+            # Layers of the levels are created lazily
+            if layer_name not in self.level_bands:
                 layers.add(QgsRasterLayer(layer_uri, layer_name))
-        else:
-            layer_name = self.sq.title
-            uri = str(self.path_to_file)
-            layers.add(QgsRasterLayer(uri, layer_name))
         return layers
 
+    def _layer_uris(self) -> Dict[str, str]:
+        """
+        :return: GDAL uris of the layers by their names
+        """
+        if self.metadata.sub_dataset_dict is not None:
+            return dict(self.metadata.sub_dataset_dict)
+        return {self.sq.title: str(self.path_to_file)}
+
+    def _update_level_bands(self) -> None:
+        """
+        Finds the variables with multiple vertical levels
+        """
+        for layer_name, layer_uri in self._layer_uris().items():
+            ds: Optional[gdal.Dataset] = None
+            try:
+                ds = gdal.Open(layer_uri)
+                if ds is None:
+                    continue
+                level_bands = LevelBands.from_gdal_dataset(ds, layer_uri)
+            except (RuntimeError, ValueError) as e:
+                self._log(f"Could not read the levels of {layer_uri}: {e}")
+                continue
+            finally:
+                ds = None
+            if level_bands is not None and len(level_bands.levels) > 1:
+                self.level_bands[layer_name] = level_bands
+
+    def _add_level_groups(self) -> None:
+        """
+        Adds a lazily instantiated layer group for each variable with levels
+        """
+        try:
+            temporal_controller = iface.mapCanvas().temporalController()
+        except AttributeError:
+            temporal_controller = None
+        # noinspection PyArgumentList
+        root = QgsProject.instance().layerTreeRoot()
+        for layer_name, level_bands in self.level_bands.items():
+            self.level_groups.append(
+                LazyLevelGroup(
+                    layer_name,
+                    level_bands,
+                    self.download_dir,
+                    root,
+                    self.band_statistics.get(level_bands.uri),
+                    temporal_controller,
+                )
+            )
+
+    def _update_band_statistics(self) -> None:
+        """
+        Computes the statistics over all time bands of each raster once, so that
+        every band is rendered with the same value range
+        """
+        for uri in self._layer_uris().values():
+            try:
+                stats = statistics_for_file(uri)
+            except (RuntimeError, ValueError, MemoryError) as e:
+                self._log(f"Could not compute statistics for {uri}: {e}", Qgis.Warning)
+                continue
+            if stats is not None:
+                self.band_statistics[uri] = stats
+
     def _update_raster_metadata(self) -> bool:
         """
         Update raster metadata
@@ -161,7 +413,11 @@ class RasterLoader(BaseLoader):
         """
         try:
             ds: gdal.Dataset = gdal.Open(str(self.path_to_file))
-            sub_datasets = ds.GetSubDatasets()
+            sub_datasets = [
+                sub_dataset
+                for sub_dataset in ds.GetSubDatasets()
+                if sub_dataset[0].rsplit(":", 1)[-1] not in DERIVED_VARIABLE_NAMES
+            ]
             if sub_datasets:
                 sub_dataset_parameters = [
                     param
@@ -198,6 +454,10 @@ class RasterLoader(BaseLoader):
                 ds: gdal.Dataset = gdal.Open(first_path)  # type: ignore
 
             self.metadata.update_from_gdal_metadata(ds.GetMetadata())
+            try:
+                self.time_band_index = TimeBandIndex.from_gdal_dataset(ds)
+            except (KeyError, ValueError) as e:
+                self._log(f"Could not read the time coordinate: {e}", Qgis.Warning)
         finally:
             ds = None
 
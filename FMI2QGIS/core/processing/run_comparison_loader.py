@@ -0,0 +1,224 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import copy
+import datetime
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from qgis.core import QgsDateTimeRange, QgsProject, QgsRasterLayer
+from qgis.PyQt.QtCore import QVariant
+
+from ...qgis_plugin_tools.tools.i18n import tr
+from ...qgis_plugin_tools.tools.raster_layers import (
+    set_fixed_temporal_range,
+    set_raster_renderer_to_singleband,
+)
+from ...qgis_plugin_tools.tools.resources import plugin_name
+from ..exceptions.loader_exceptions import InvalidParameterException, LoaderException
+from ..grid.run_comparison import ComparisonMode, compare_runs
+from ..grid.statistics import apply_statistics, statistics_for_file
+from ..grid.time_index import TimeBandIndex
+from ..wfs import Parameter, StoredQuery, WFSMetadata
+from .raster_loader import RasterLoader
+
+LOGGER = logging.getLogger(plugin_name())
+
+# Variable names and GDAL uris of a run and its time band index
+Run = Tuple[Dict[str, str], TimeBandIndex]
+
+
+class RunComparisonLoader(RasterLoader):
+    """
+    Downloads several forecast runs of the same grid and computes the
+    difference or spread of the runs for every common time step
+    """
+
+    MESSAGE_CATEGORY = "FmiRunComparisonLoader"
+    ORIGIN_TIME_PARAM = "origintime"
+
+    def __init__(
+        self,
+        description: str,
+        download_dir: Path,
+        fmi_download_url: str,
+        sq: StoredQuery,
+        origin_times: List[datetime.datetime],
+        mode: ComparisonMode = ComparisonMode.DIFFERENCE,
+        add_to_map: bool = True,
+    ) -> None:
+        """
+        :param download_dir:Download directory of the output file(s)
+        :param fmi_download_url: FMI download url
+        :param sq: StoredQuery of a forecast grid
+        :param origin_times: origin times of the compared runs
+        :param mode: how the runs are compared
+        """
+        if len(origin_times) < 2:
+            raise InvalidParameterException(tr("At least two runs are needed"))
+        # The origin time is changed for every run
+        super().__init__(
+            description, download_dir, fmi_download_url, copy.deepcopy(sq), add_to_map
+        )
+        self.origin_times = sorted(origin_times)
+        self.mode = mode
+        self.output_files: Dict[str, Path] = {}
+        self.output_index: Optional[TimeBandIndex] = None
+        self._file_name: Optional[str] = None
+
+    @property
+    def is_manually_temporal(self) -> bool:
+        return True
+
+    @property
+    def file_name(self) -> Optional[str]:
+        return self._file_name
+
+    def run(self) -> bool:
+        """
+        NOTE: LOGGER cannot be used in here or any methods that are called from here
+        :return:
+        """
+        result = False
+        try:
+            runs: List[Run] = []
+            for origin_time in self.origin_times:
+                if self.isCanceled():
+                    return False
+                run = self._download_run(origin_time)
+                if run is None:
+                    return False
+                runs.append(run)
+            self._compare(runs)
+            result = True
+        except Exception as e:
+            self.exception = e
+            result = False
+
+        self.setProgress(100)
+        return result
+
+    def finished(self, result: bool) -> None:
+        """
+        This function is automatically called when the task has completed
+        (successfully or not).
+
+        finished is always called from the main thread, so it's safe
+        to do GUI operations and raise Python exceptions here.
+
+        :param result: the return value from self.run
+        """
+        if result and self.output_index is not None:
+            index = self.output_index
+            t_range = QgsDateTimeRange(
+                index.start_time,
+                index.end_time + datetime.timedelta(seconds=1),  # type: ignore
+            )
+            for variable, path in self.output_files.items():
+                layer = QgsRasterLayer(
+                    str(path), f"{variable} {tr(self.mode.value)}"
+                )
+                if not layer.isValid() or not self.add_to_map:
+                    continue
+                # noinspection PyArgumentList
+                QgsProject.instance().addMapLayer(layer)
+                set_raster_renderer_to_singleband(layer, 1)
+                stats = self.band_statistics.get(str(path))
+                if stats is not None:
+                    apply_statistics(layer, stats)
+                self.time_band_indices[layer.id()] = index
+                try:
+                    set_fixed_temporal_range(layer, t_range)
+                except AttributeError:
+                    pass
+                self.layer_ids.add(layer.id())
+
+        # Error handling
+        else:
+            self._report_error(LOGGER)
+
+    def _download_run(self, origin_time: datetime.datetime) -> Optional[Run]:
+        self._set_origin_time(origin_time)
+        self._file_name = (
+            f"{self.sq.producer}_{origin_time.strftime('%Y%m%dT%H%M')}_"
+            f"{self._query_digest()}.nc"
+        )
+        self.metadata = WFSMetadata()
+        self.time_band_index = None
+        self.is_from_cache = False
+
+        self.path_to_file, result = self._download()
+        if not result or not self._update_raster_metadata():
+            return None
+        if self.time_band_index is None:
+            raise LoaderException(tr("Run {} has no time dimension", origin_time))
+        if not self.is_from_cache:
+            self._add_to_grid_cache()
+        uris = (
+            dict(self.metadata.sub_dataset_dict)
+            if self.metadata.sub_dataset_dict is not None
+            else {self.sq.title: str(self.path_to_file)}
+        )
+        return uris, self.time_band_index
+
+    def _set_origin_time(self, origin_time: datetime.datetime) -> None:
+        if self.ORIGIN_TIME_PARAM not in self.sq.parameters:
+            self.sq.parameters[self.ORIGIN_TIME_PARAM] = Parameter(
+                self.ORIGIN_TIME_PARAM, "", "", QVariant.DateTime
+            )
+        self.sq.parameters[self.ORIGIN_TIME_PARAM].value = origin_time
+
+    def _query_digest(self, *extra: str) -> str:
+        """
+        :param extra: other values identifying the files
+        :return: hash of the query, so that the files of different requests
+            sharing the download directory never overwrite each other
+        """
+        query = [
+            f"{name}={param.value}"
+            for name, param in sorted(self.sq.parameters.items())
+            if param.value is not None
+        ]
+        digest = hashlib.sha1("|".join([*query, *extra]).encode("utf-8"))
+        return digest.hexdigest()[:10]
+
+    def _compare(self, runs: List[Run]) -> None:
+        first_uris, _ = runs[0]
+        digest = self._query_digest(
+            *(origin_time.isoformat() for origin_time in self.origin_times)
+        )
+        name = (
+            f"{self.sq.producer}_{self.origin_times[0].strftime('%Y%m%dT%H%M')}_"
+            f"{self.origin_times[-1].strftime('%Y%m%dT%H%M')}_{digest}"
+        )
+        for variable in first_uris:
+            output = Path(self.download_dir, f"{name}_{variable}_{self.mode.value}.tif")
+            self._log(f'Comparing runs of "{variable}" to "{output}"')
+            self.output_index = compare_runs(
+                [uris[variable] for uris, _ in runs],
+                [index for _, index in runs],
+                output,
+                self.mode,
+            )
+            self.output_files[variable] = output
+            stats = statistics_for_file(str(output))
+            if stats is not None:
+                self.band_statistics[str(output)] = stats
@@ -20,7 +20,7 @@ import gzip
 import logging
 import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 from osgeo import gdal, ogr
 from qgis.core import QgsProject, QgsVectorLayer
@@ -69,9 +69,7 @@ class VectorLoader(BaseLoader):
         """
         self.path_to_file, result = self._download()
         if result and self.path_to_file.is_file():
-            self._update_vector_metadata()
-            if all((self.metadata.time_field_idx, self.metadata.fields)):
-                result = self._convert_to_spatialite()
+            result = self._process_features()
         self.setProgress(100)
         return result
 
@@ -79,6 +77,46 @@ class VectorLoader(BaseLoader):
     def file_name(self) -> Optional[str]:
         return f'{self.sq.id.replace("::", "_")}_{uuid.uuid4()}.gml'
 
+    @property
+    def is_refreshable(self) -> bool:
+        """
+        :return: Whether the features were converted to SpatiaLite with a time
+            field, so that refreshes can upsert new features into the file
+        """
+        return self.path_to_file.suffix == ".sqlite"
+
+    @property
+    def batch_key(self) -> Optional[Tuple[str, str]]:
+        """
+        Loaders with the same key can get their features with a single
+        GetFeature request. The count of a request limits the features of all
+        of its queries, so loaders with max features are not batched.
+        :return: key of compatible loaders or None if the loader is not batched
+        """
+        if self.max_features:
+            return None
+        return self.wfs_url, self.wfs_version
+
+    def _prepare_request(self) -> None:
+        """
+        Prepares the stored query right before its features are requested.
+        Used by BatchVectorLoader, which requests the features of the loader.
+        """
+
+    def _clean_up(self) -> None:
+        """Removes the intermediate files after the features are processed"""
+
+    def _process_features(self) -> bool:
+        """
+        Reads the metadata of the downloaded features and converts temporal
+        features to SpatiaLite
+        :return: Whether processing was successful or not
+        """
+        self._update_vector_metadata()
+        if all((self.metadata.time_field_idx, self.metadata.fields)):
+            return self._convert_to_spatialite()
+        return True
+
     def _process_downloaded_file(self, downloaded_file_path: Path) -> Path:
         """ Do some postprocessing after the file is downloaded"""
         output = Path(
@@ -18,15 +18,20 @@
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Optional
 
 from qgis.core import QgsProcessingFeedback
 
-from ...qgis_plugin_tools.tools import network
+from ...definitions.configurable_settings import Settings
 from ...qgis_plugin_tools.tools.custom_logging import bar_msg
 from ...qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
 from ...qgis_plugin_tools.tools.i18n import tr
-from ..exceptions.loader_exceptions import BadRequestException
+from ..async_downloads import AsyncDownloader
+from ..downloads import stream_to_file
+from ..exceptions.loader_exceptions import (
+    BadRequestException,
+    DownloadCanceledException,
+)
 
 
 class BaseProduct:
@@ -42,8 +47,7 @@ class BaseProduct:
         :param feedback:
         """
         self.download_dir = download_dir
-        if not self.download_dir.exists():
-            self.download_dir.mkdir()
+        self.download_dir.mkdir(parents=True, exist_ok=True)
         self.url = fmi_download_url
         self.feedback = feedback
 
@@ -55,19 +59,11 @@ class BaseProduct:
         """
         try:
             self.feedback.setProgress(0)
-            uri = self._construct_uri(**kwargs)
-            self.feedback.setProgress(10)
-            self.feedback.pushDebugInfo(uri)
-
             try:
-                data, default_name = network.fetch_raw(uri)
-                self.feedback.pushDebugInfo(f'File name is: "{default_name}"')
-                self.feedback.setProgress(70)
-                if not self.feedback.isCanceled():
-                    output = Path(self.download_dir, default_name)
-                    with open(output, "wb") as f:
-                        f.write(data)
-                    return output
+                output = self._download(**kwargs)
+                self.feedback.pushDebugInfo(f'File name is: "{output.name}"')
+                self.feedback.setProgress(90)
+                return output
             except QgsPluginNetworkException as e:
                 error_message = e.bar_msg["details"]  # type: ignore
                 if "Bad Request" in error_message:
@@ -75,6 +71,8 @@ class BaseProduct:
                         tr("Bad request"),
                         bar_msg=bar_msg(tr("Try with different start and end times")),
                     )
+        except DownloadCanceledException as e:
+            self.feedback.pushInfo(str(e))
         except Exception as e:
             self.feedback.reportError(tr("Error occurred: {}", e), True)
             self.feedback.cancel()
@@ -82,6 +80,62 @@ class BaseProduct:
         self.feedback.setProgress(100)
         return Path()
 
+    def _download(self, **kwargs: Any) -> Path:
+        """
+        Streams the file of the request to the disk
+        :return: Path to the downloaded file
+        """
+        uri = self._construct_uri(**kwargs)
+        self.feedback.setProgress(10)
+        self.feedback.pushDebugInfo(uri)
+        return stream_to_file(
+            uri,
+            self.download_dir,
+            progress=self._report_download_progress,
+            is_canceled=self.feedback.isCanceled,
+        )
+
+    def _download_in_parallel(self, uris: Dict[str, str]) -> Dict[str, Path]:
+        """
+        Streams the files concurrently to the disk on a single event loop. If
+        one of the downloads fails, the others are canceled and the downloaded
+        files are removed.
+
+        :param uris: urls by the names of the output files
+        :return: paths of the downloaded files by the names of the output files
+        """
+        downloaded: Dict[str, int] = {}
+        totals: Dict[str, Optional[int]] = {}
+
+        def report_progress(name: str, num_of_bytes: int, total: Optional[int]) -> None:
+            downloaded[name] = num_of_bytes
+            totals[name] = total
+            known_totals = [t for t in totals.values() if t]
+            self._report_download_progress(
+                sum(downloaded.values()),
+                sum(known_totals) if len(known_totals) == len(uris) else None,
+            )
+
+        downloader = AsyncDownloader(Settings.PARALLEL_DOWNLOADS.get(int))
+        return downloader.download_all(
+            uris,
+            self.download_dir,
+            progress=report_progress,
+            is_canceled=self.feedback.isCanceled,
+        )
+
+    def _report_download_progress(
+        self, num_of_bytes: int, total: Optional[int]
+    ) -> None:
+        megabytes = num_of_bytes / 1024 ** 2
+        if total:
+            self.feedback.setProgress(10 + 80 * num_of_bytes / total)
+            self.feedback.setProgressText(
+                tr("Downloaded {:.1f} / {:.1f} MB", megabytes, total / 1024 ** 2)
+            )
+        else:
+            self.feedback.setProgressText(tr("Downloaded {:.1f} MB", megabytes))
+
     def _construct_uri(self, **kwargs: Any) -> str:
         url = self.url + f"?producer={self.producer}"
         return url
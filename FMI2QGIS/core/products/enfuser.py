@@ -18,15 +18,18 @@
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 
 import enum
+import hashlib
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Set
+from typing import Any, Set
 
 from qgis.core import QgsRectangle
 
 from ...core.exceptions.loader_exceptions import InvalidParameterException
 from ...qgis_plugin_tools.tools.i18n import tr
 from ...qgis_plugin_tools.tools.misc_utils import extent_to_bbox
+from ..grid.merge import merge_variables
 from .base import BaseProduct
 
 
@@ -57,14 +60,61 @@ class EnfuserNetcdfLoader(BaseProduct):
         extent: QgsRectangle,
         start_time: datetime,
         end_time: datetime,
+        parallel: bool = False,
     ) -> Path:
+        """
+        :param parallel: download the products concurrently and merge them into
+            a single NetCDF file with the same variables as the combined request
+        """
         return super(EnfuserNetcdfLoader, self).download(
             products=products,  # type: ignore
             extent=extent,  # type: ignore
             start_time=start_time,  # type: ignore
             end_time=end_time,  # type: ignore
+            parallel=parallel,  # type: ignore
         )
 
+    def _download(self, parallel: bool = False, **kwargs: Any) -> Path:
+        products: Set[EnfuserNetcdfLoader.Products] = kwargs["products"]
+        if not parallel or len(products) < 2:
+            return super(EnfuserNetcdfLoader, self)._download(**kwargs)
+
+        # Unique names, so that downloads sharing the directory never
+        # overwrite or clean up each other's files
+        run_id = uuid.uuid4().hex
+        uris = {
+            f"{self.producer}_{product.value}_{run_id}.nc": self._construct_uri(
+                **{**kwargs, "products": {product}}
+            )
+            for product in sorted(products, key=lambda p: p.value)
+        }
+        self.feedback.setProgress(10)
+        for uri in uris.values():
+            self.feedback.pushDebugInfo(uri)
+        paths = self._download_in_parallel(uris)
+
+        start_time: datetime = kwargs["start_time"]
+        end_time: datetime = kwargs["end_time"]
+        digest = hashlib.sha1(
+            "|".join(sorted(uris.values())).encode("utf-8")
+        ).hexdigest()[:10]
+        output = Path(
+            self.download_dir,
+            f"{self.producer}_{start_time:%Y%m%dT%H%M%S}_"
+            f"{end_time:%Y%m%dT%H%M%S}_{digest}.nc",
+        )
+        merged = output.with_name(f"{output.stem}_{run_id}.nc")
+        try:
+            merge_variables(list(paths.values()), merged)
+            # Equal requests produce equal files, so replacing is safe
+            merged.replace(output)
+        finally:
+            for path in paths.values():
+                path.unlink()
+            if merged.exists():
+                merged.unlink()
+        return output
+
     def _construct_uri(  # type: ignore
         self,
         products: Set[Products],
@@ -0,0 +1,326 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from osgeo import gdal
+from qgis.core import QgsProcessingFeedback, QgsRectangle
+
+from ...definitions.configurable_settings import Settings
+from ...qgis_plugin_tools.tools.i18n import tr
+from ...qgis_plugin_tools.tools.misc_utils import extent_to_bbox
+from ..grid.archive import creation_options
+from ..grid.time_index import times_from_values, values_from_times
+from .enfuser import EnfuserNetcdfLoader
+
+ENFUSER_ARCHIVE_CATALOG = "enfuser_archive.json"
+HOUR_FILE_FORMAT = "%Y%m%dT%H%M%S"
+
+Products = EnfuserNetcdfLoader.Products
+HourRange = Tuple[datetime.datetime, datetime.datetime]
+
+_catalog_lock = threading.Lock()
+
+
+class EnfuserArchive:
+    """
+    Rolling local archive of Enfuser air quality grids of a fixed extent.
+    Every hour of every product is stored as its own compressed and chunked
+    NetCDF slice, so an update only downloads the hours that are missing
+    and the hours older than the retention window are simply removed.
+    """
+
+    def __init__(
+        self,
+        archive_dir: Path,
+        fmi_download_url: str,
+        products: Iterable[Products],
+        extent: QgsRectangle,
+        feedback: QgsProcessingFeedback,
+        retention: Optional[datetime.timedelta] = None,
+    ) -> None:
+        """
+        :param archive_dir: root directory of the archives
+        :param fmi_download_url: FMI download url
+        :param products: archived products
+        :param extent: archived extent in EPSG:4326
+        :param feedback:
+        :param retention: how long the hours are kept, defaults to the
+            ENFUSER_ARCHIVE_RETENTION setting
+        """
+        self.products = sorted(set(products), key=lambda p: p.value)
+        self.extent = extent
+        self.retention = (
+            retention
+            if retention is not None
+            else datetime.timedelta(hours=Settings.ENFUSER_ARCHIVE_RETENTION.get(int))
+        )
+        self.feedback = feedback
+        bbox = extent_to_bbox(extent)
+        self.archive_dir = Path(
+            archive_dir, f"{EnfuserNetcdfLoader.producer}_{bbox.replace(',', '_')}"
+        )
+        self.catalog_file = Path(self.archive_dir, ENFUSER_ARCHIVE_CATALOG)
+        self.download_dir = Path(self.archive_dir, "downloads")
+        self.loader = EnfuserNetcdfLoader(
+            self.download_dir, fmi_download_url, feedback
+        )
+
+    def hours(self, product: Products) -> List[datetime.datetime]:
+        """
+        :return: archived hours of the product in time order
+        """
+        with _catalog_lock:
+            return sorted(self._read_catalog().get(product, set()))
+
+    def files(self, product: Products) -> List[Tuple[datetime.datetime, Path]]:
+        """
+        :return: archived hours of the product with their NetCDF files
+        """
+        return [(hour, self._hour_file(product, hour)) for hour in self.hours(product)]
+
+    def update(
+        self, now: Optional[datetime.datetime] = None
+    ) -> Dict[Products, List[datetime.datetime]]:
+        """
+        Downloads the missing hours of the retention window and removes the
+        hours that have fallen out of it. Products missing the same hours are
+        downloaded with a single request.
+
+        :param now: end of the retention window, defaults to the current UTC time
+        :return: added hours of each product
+        """
+        end = _floor_hour(now if now is not None else datetime.datetime.utcnow())
+        start = end - self.retention
+        self._remove_hours_before(start)
+
+        window = set(_hours_between(start, end))
+        stored = self._catalog()
+        products_by_ranges: Dict[Tuple[HourRange, ...], List[Products]] = {}
+        for product in self.products:
+            missing = window - stored.get(product, set())
+            ranges = tuple(_contiguous_ranges(missing))
+            if ranges:
+                products_by_ranges.setdefault(ranges, []).append(product)
+
+        added: Dict[Products, List[datetime.datetime]] = {}
+        for ranges, products in products_by_ranges.items():
+            for range_start, range_end in ranges:
+                if self.feedback.isCanceled():
+                    return added
+                self.feedback.pushInfo(
+                    tr(
+                        "Fetching {} - {} UTC of {}",
+                        range_start.isoformat(),
+                        range_end.isoformat(),
+                        ", ".join(p.value for p in products),
+                    )
+                )
+                path = self.loader.download(
+                    set(products),
+                    self.extent,
+                    range_start,
+                    range_end,
+                    parallel=len(products) > 1,
+                )
+                if not path.is_file():
+                    return added
+                try:
+                    for product in products:
+                        hours = self._store_hours(
+                            path, product, set(_hours_between(range_start, range_end))
+                        )
+                        added.setdefault(product, []).extend(hours)
+                finally:
+                    path.unlink()
+        return added
+
+    def _store_hours(
+        self, path: Path, product: Products, hours: Set[datetime.datetime]
+    ) -> List[datetime.datetime]:
+        """
+        Writes the hours of the product in the downloaded file as slices and
+        adds them to the catalog
+        :return: stored hours
+        """
+        product_dir = Path(self.archive_dir, product.value)
+        product_dir.mkdir(parents=True, exist_ok=True)
+        stored = split_hours(
+            path,
+            EnfuserNetcdfLoader.layer_names[product],
+            hours,
+            lambda hour: self._hour_file(product, hour),
+        )
+        with _catalog_lock:
+            catalog = self._read_catalog()
+            catalog.setdefault(product, set()).update(stored)
+            self._write_catalog(catalog)
+        return stored
+
+    def _remove_hours_before(self, start: datetime.datetime) -> None:
+        with _catalog_lock:
+            catalog = self._read_catalog()
+            for product, hours in catalog.items():
+                for hour in [hour for hour in hours if hour < start]:
+                    hour_file = self._hour_file(product, hour)
+                    if hour_file.exists():
+                        hour_file.unlink()
+                    hours.remove(hour)
+            self._write_catalog(catalog)
+
+    def _hour_file(self, product: Products, hour: datetime.datetime) -> Path:
+        return Path(self.archive_dir, product.value, f"{hour:{HOUR_FILE_FORMAT}}.nc")
+
+    def _catalog(self) -> Dict[Products, Set[datetime.datetime]]:
+        with _catalog_lock:
+            return self._read_catalog()
+
+    def _read_catalog(self) -> Dict[Products, Set[datetime.datetime]]:
+        if not self.catalog_file.exists():
+            return {}
+        try:
+            with open(self.catalog_file) as f:
+                stored = json.load(f)
+            catalog: Dict[Products, Set[datetime.datetime]] = {}
+            for value, hours in stored.items():
+                product = Products(value)
+                catalog[product] = {
+                    hour
+                    for hour in (
+                        datetime.datetime.strptime(h, HOUR_FILE_FORMAT) for h in hours
+                    )
+                    if self._hour_file(product, hour).exists()
+                }
+            return catalog
+        except (ValueError, KeyError):
+            # Corrupted catalog, start over
+            return {}
+
+    def _write_catalog(self, catalog: Dict[Products, Set[datetime.datetime]]) -> None:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.catalog_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    product.value: [
+                        f"{hour:{HOUR_FILE_FORMAT}}" for hour in sorted(hours)
+                    ]
+                    for product, hours in catalog.items()
+                },
+                f,
+                indent=2,
+            )
+        tmp_file.replace(self.catalog_file)
+
+
+def split_hours(
+    path: Path,
+    variable: str,
+    hours: Set[datetime.datetime],
+    output_for: Callable[[datetime.datetime], Path],
+) -> List[datetime.datetime]:
+    """
+    Writes every requested hour of the variable into its own compressed
+    NetCDF file with spatial chunks
+
+    :param path: NetCDF file
+    :param variable: name of the variable
+    :param hours: hours to write
+    :param output_for: output file of an hour
+    :return: written hours
+    """
+    ds: Optional[gdal.Dataset] = None
+    try:
+        ds = gdal.OpenEx(str(path), gdal.OF_MULTIDIM_RASTER)
+        if ds is None:
+            raise RuntimeError(f"Could not open {path}")
+        root: gdal.Group = ds.GetRootGroup()
+        time_variables = {
+            dim.GetName(): dim.GetIndexingVariable()
+            for dim in root.OpenMDArray(variable).GetDimensions()
+            if dim.GetIndexingVariable() is not None
+            and " since " in dim.GetIndexingVariable().GetUnit()
+        }
+        if not time_variables:
+            raise ValueError(f"Variable {variable} has no time dimension")
+        time_variable = next(iter(time_variables.values()))
+        times = times_from_values(
+            time_variable.ReadAsArray(), time_variable.GetUnit()
+        )
+        options = creation_options(root, time_chunk_size=1)
+
+        written = []
+        for time in times:
+            if time not in hours:
+                continue
+            subset_specs = []
+            for name, indexing_variable in time_variables.items():
+                value = values_from_times([time], indexing_variable.GetUnit())[0]
+                subset_specs.append(f"{name}({value},{value})")
+            result = gdal.MultiDimTranslate(
+                str(output_for(time)),
+                ds,
+                format="netCDF",
+                arraySpecs=[variable],
+                subsetSpecs=subset_specs,
+                creationOptions=options,
+            )
+            if result is None:
+                raise RuntimeError(f"Could not write {time} of {variable}")
+            result = None  # noqa: F841
+            written.append(time)
+        return written
+    finally:
+        ds = None
+
+
+def _floor_hour(time: datetime.datetime) -> datetime.datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+def _hours_between(
+    start: datetime.datetime, end: datetime.datetime
+) -> List[datetime.datetime]:
+    """
+    :return: full hours from start to end, both included
+    """
+    hours = []
+    hour = _floor_hour(start)
+    while hour <= end:
+        if hour >= start:
+            hours.append(hour)
+        hour += datetime.timedelta(hours=1)
+    return hours
+
+
+def _contiguous_ranges(hours: Set[datetime.datetime]) -> List[HourRange]:
+    """
+    :return: first and last hour of each run of consecutive hours
+    """
+    ranges: List[HourRange] = []
+    for hour in sorted(hours):
+        if ranges and hour - ranges[-1][1] == datetime.timedelta(hours=1):
+            ranges[-1] = (ranges[-1][0], hour)
+        else:
+            ranges.append((hour, hour))
+    return ranges
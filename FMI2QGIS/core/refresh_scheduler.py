@@ -0,0 +1,311 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+import copy
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+from qgis.core import QgsApplication, QgsProject, QgsTask
+from qgis.PyQt.QtCore import QObject, QTimer
+
+from ..definitions.configurable_settings import Settings
+from ..qgis_plugin_tools.tools.custom_logging import bar_msg
+from ..qgis_plugin_tools.tools.i18n import tr
+from ..qgis_plugin_tools.tools.resources import plugin_name
+from .processing.batch_vector_loader import BatchVectorLoader
+from .processing.incremental_vector_loader import IncrementalVectorLoader
+from .processing.vector_loader import VectorLoader
+from .wms import WMSLayer, WMSLayerHandler
+
+LOGGER = logging.getLogger(plugin_name())
+
+
+class RefreshEntry:
+    """Refresh schedule of a single layer"""
+
+    # Used for producers whose cadence is unknown or shorter
+    MIN_INTERVAL = datetime.timedelta(minutes=1)
+
+    def __init__(
+        self,
+        layer_id: str,
+        interval: datetime.timedelta,
+        delay: datetime.timedelta,
+    ) -> None:
+        """
+        :param layer_id: id of the refreshed layer
+        :param interval: publication cadence of the producer
+        :param delay: how long after the cadence the new data is available
+        """
+        self.layer_id = layer_id
+        self.interval = max(interval, self.MIN_INTERVAL)
+        self.delay = delay
+        self.next_refresh = self.next_refresh_after(datetime.datetime.utcnow())
+
+    def next_refresh_after(self, time: datetime.datetime) -> datetime.datetime:
+        """
+        :return: First publication time aligned to the interval after the given time
+        """
+        midnight = time.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = time - self.delay - midnight
+        num_of_intervals = elapsed // self.interval + 1
+        return midnight + num_of_intervals * self.interval + self.delay
+
+    def is_due(self, time: datetime.datetime) -> bool:
+        return time >= self.next_refresh
+
+    def schedule_next(self, time: datetime.datetime) -> None:
+        self.next_refresh = self.next_refresh_after(time)
+
+
+class VectorRefreshEntry(RefreshEntry):
+    def __init__(self, loader: VectorLoader, layer_id: str) -> None:
+        super().__init__(
+            layer_id,
+            datetime.timedelta(minutes=loader.sq.time_step),
+            datetime.timedelta(minutes=Settings.REFRESH_PUBLICATION_DELAY.get(int)),
+        )
+        # Stored query might be modified in the dialog after the registration
+        self.sq = copy.deepcopy(loader.sq)
+        self.download_dir = loader.download_dir
+        self.wfs_url = loader.wfs_url
+        self.wfs_version = loader.wfs_version
+        self.path_to_file = loader.path_to_file
+        self.max_features = loader.max_features
+
+    def create_task(self) -> IncrementalVectorLoader:
+        return IncrementalVectorLoader(
+            tr("Refresh {}", self.sq.title),
+            self.download_dir,
+            self.wfs_url,
+            self.wfs_version,
+            self.sq,
+            self.path_to_file,
+            self.layer_id,
+            self.max_features,
+        )
+
+
+class WMSRefreshEntry(RefreshEntry):
+    TIME_STEP_UNITS = {"M": "minutes", "H": "hours", "D": "days"}
+
+    def __init__(
+        self,
+        wms_layer: WMSLayer,
+        layer_id: str,
+        start_time: Optional[datetime.datetime],
+        end_time: Optional[datetime.datetime],
+        elevation: Optional[float],
+    ) -> None:
+        unit = self.TIME_STEP_UNITS.get(str(wms_layer.time_step_uom), "minutes")
+        super().__init__(
+            layer_id,
+            datetime.timedelta(**{unit: wms_layer.t_step}),
+            datetime.timedelta(minutes=Settings.REFRESH_PUBLICATION_DELAY.get(int)),
+        )
+        self.wms_layer = wms_layer
+        self.start_time = start_time if start_time is not None else wms_layer.start_time
+        self.end_time = end_time if end_time is not None else wms_layer.end_time
+        self.elevation = elevation
+
+    def update_time_window(self, wms_layer: WMSLayer) -> bool:
+        """
+        Moves the time window of the layer to end at the latest published time
+        :return: Whether the time window changed or not
+        """
+        if (
+            wms_layer.end_time is None
+            or self.end_time is None
+            or self.start_time is None
+            or wms_layer.end_time <= self.end_time
+        ):
+            return False
+        shift = wms_layer.end_time - self.end_time
+        self.start_time += shift
+        self.end_time = wms_layer.end_time
+        self.wms_layer = wms_layer
+        return True
+
+
+class RefreshScheduler(QObject):
+    """
+    Keeps registered layers current by running incremental or conditional
+    fetches as background tasks aligned to the publication cadence of
+    the producers.
+    """
+
+    TICK_INTERVAL = 30 * 1000  # ms
+
+    def __init__(self, wms_layer_handler: WMSLayerHandler) -> None:
+        super().__init__()
+        self.wms_layer_handler = wms_layer_handler
+        self.entries: Dict[str, RefreshEntry] = {}
+        self.tasks: Dict[str, QgsTask] = {}
+
+        self.timer = QTimer(self)
+        # noinspection PyUnresolvedReferences
+        self.timer.timeout.connect(self.refresh_due_layers)
+
+    def register_vector_layer(self, loader: VectorLoader, layer_id: str) -> None:
+        """
+        Registers observation layer created by the loader to be refreshed
+        """
+        if not loader.is_refreshable:
+            LOGGER.warning(
+                tr("Layer has no time field"),
+                extra=bar_msg(tr("Only layers with a time field can be refreshed")),
+            )
+            return
+        self._register(VectorRefreshEntry(loader, layer_id))
+
+    def register_wms_layer(
+        self,
+        wms_layer: WMSLayer,
+        layer_id: str,
+        start_time: Optional[datetime.datetime] = None,
+        end_time: Optional[datetime.datetime] = None,
+        elevation: Optional[float] = None,
+    ) -> None:
+        """
+        Registers temporal WMS layer (e.g. radar) to be refreshed
+        """
+        if not wms_layer.is_temporal:
+            LOGGER.warning(
+                tr("Layer is not temporal"),
+                extra=bar_msg(tr("Only temporal WMS layers can be refreshed")),
+            )
+            return
+        self._register(
+            WMSRefreshEntry(wms_layer, layer_id, start_time, end_time, elevation)
+        )
+
+    def unregister(self, layer_id: str) -> None:
+        self.entries.pop(layer_id, None)
+        if not self.entries:
+            self.timer.stop()
+
+    def stop(self) -> None:
+        self.timer.stop()
+        for task in self.tasks.values():
+            task.cancel()
+        self.entries.clear()
+        self.tasks.clear()
+
+    def refresh_due_layers(self) -> None:
+        """
+        Starts refreshes for all layers that are due. Layers whose previous
+        refresh is still running are coalesced into that refresh, vector
+        layers share batched GetFeature requests and WMS layers share a single
+        capabilities request.
+        """
+        now = datetime.datetime.utcnow()
+        due_vector_entries: List[VectorRefreshEntry] = []
+        due_wms_entries: List[WMSRefreshEntry] = []
+        for layer_id, entry in list(self.entries.items()):
+            # noinspection PyArgumentList
+            if QgsProject.instance().mapLayer(layer_id) is None:
+                # removed by user
+                self.unregister(layer_id)
+                continue
+            if not entry.is_due(now):
+                continue
+            entry.schedule_next(now)
+            if layer_id in self.tasks:
+                continue
+            if isinstance(entry, VectorRefreshEntry):
+                due_vector_entries.append(entry)
+            elif isinstance(entry, WMSRefreshEntry):
+                due_wms_entries.append(entry)
+
+        if due_vector_entries:
+            self._refresh_vector_layers(due_vector_entries)
+        if due_wms_entries:
+            self._refresh_wms_layers(due_wms_entries)
+
+    def _register(self, entry: RefreshEntry) -> None:
+        self.entries[entry.layer_id] = entry
+        if not self.timer.isActive():
+            self.timer.start(self.TICK_INTERVAL)
+
+    def _add_task(self, layer_ids: List[str], task: QgsTask) -> None:
+        for layer_id in layer_ids:
+            self.tasks[layer_id] = task
+        # noinspection PyUnresolvedReferences
+        task.taskCompleted.connect(lambda: self._remove_tasks(layer_ids))
+        # noinspection PyUnresolvedReferences
+        task.taskTerminated.connect(lambda: self._remove_tasks(layer_ids))
+        # noinspection PyArgumentList
+        QgsApplication.taskManager().addTask(task)
+
+    def _remove_tasks(self, layer_ids: List[str]) -> None:
+        for layer_id in layer_ids:
+            self.tasks.pop(layer_id, None)
+
+    def _refresh_vector_layers(self, entries: List[VectorRefreshEntry]) -> None:
+        """
+        Refreshes the layers in a single task, so that the stored queries of
+        the layers are requested together whenever they are compatible
+        """
+        loaders: List[VectorLoader] = [entry.create_task() for entry in entries]
+        task: QgsTask = (
+            loaders[0]
+            if len(loaders) == 1
+            else BatchVectorLoader(tr("Refresh observations"), loaders)
+        )
+        self._add_task([entry.layer_id for entry in entries], task)
+
+    def _refresh_wms_layers(self, entries: List[WMSRefreshEntry]) -> None:
+        def list_layers(task: QgsTask) -> List[WMSLayer]:
+            return self.wms_layer_handler.list_wms_layers()
+
+        def update_layers(
+            exception: Optional[Exception], wms_layers: Optional[List[WMSLayer]] = None
+        ) -> None:
+            for entry in entries:
+                self.tasks.pop(entry.layer_id, None)
+            if exception is not None or wms_layers is None:
+                LOGGER.warning(
+                    tr("Could not refresh WMS layers"), extra=bar_msg(exception)
+                )
+                return
+            layers_by_name = {wms_layer.name: wms_layer for wms_layer in wms_layers}
+            for entry in entries:
+                wms_layer = layers_by_name.get(entry.wms_layer.name)
+                # noinspection PyArgumentList
+                layer = QgsProject.instance().mapLayer(entry.layer_id)
+                if (
+                    wms_layer is None
+                    or layer is None
+                    or not entry.update_time_window(wms_layer)
+                ):
+                    continue
+                url = self.wms_layer_handler.construct_qgis_url(
+                    entry.wms_layer, entry.start_time, entry.end_time, entry.elevation
+                )
+                layer.setDataSource(url, layer.name(), "wms")
+                layer.triggerRepaint()
+
+        task = QgsTask.fromFunction(
+            tr("Refresh WMS layers"), list_layers, on_finished=update_layers
+        )
+        for entry in entries:
+            self.tasks[entry.layer_id] = task
+        # noinspection PyArgumentList
+        QgsApplication.taskManager().addTask(task)
@@ -19,10 +19,11 @@
 
 import datetime
 import enum
+import io
 import logging
 import re
 import xml.etree.ElementTree as ET  # noqa
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 from urllib.parse import parse_qs, urlsplit
 
 from osgeo import ogr
@@ -31,10 +32,12 @@ from qgis.PyQt.QtCore import QVariant
 
 from ..definitions.configurable_settings import Namespace
 from ..qgis_plugin_tools.tools.custom_logging import bar_msg
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
 from ..qgis_plugin_tools.tools.i18n import tr
 from ..qgis_plugin_tools.tools.misc_utils import extent_to_bbox
 from ..qgis_plugin_tools.tools.network import fetch
 from ..qgis_plugin_tools.tools.resources import plugin_name
+from .async_downloads import AsyncDownloader
 from .exceptions.loader_exceptions import WfsException
 
 LOGGER = logging.getLogger(plugin_name())
@@ -143,10 +146,16 @@ class Parameter:
     def has_variables(self) -> bool:
         return self.name == "param" and self.type == QVariant.StringList
 
-    def populate_variables(self, observed_property_url: str) -> None:
+    def populate_variables(
+        self, observed_property_url: str, content: Optional[str] = None
+    ) -> None:
+        """
+        :param content: response of the observed property url if fetched already
+        """
         variables: List[ParameterVariable] = []
         url_lower = observed_property_url.lower()
-        content = fetch(observed_property_url)
+        if content is None:
+            content = fetch(observed_property_url)
         root = ET.ElementTree(ET.fromstring(content)).getroot()
         for component in root.findall("{%s}component" % Namespace.OMOP.value):
             op = component.find("{%s}ObservableProperty" % Namespace.OMOP.value)
@@ -165,10 +174,13 @@ class Parameter:
 
 class StoredQuery:
     TIME_STEP_NAMES = ("timestep", "time_step")
+    # Queries whose members are separate files, e.g. a radar image per time step
+    FILE_QUERY_PATTERNS = ("::radar::",)
 
     class Type(enum.Enum):
         Raster = "raster"
         Vector = "vector"
+        Files = "files"
 
     def __init__(
         self,
@@ -185,6 +197,9 @@ class StoredQuery:
         self.parameters = parameters
         self.producer: str = ""
         self.format: str = ""
+        # File references of the GetFeature response of expand
+        self.file_references: List[FileReference] = []
+        self.expanded_at: Optional[datetime.datetime] = None
 
     @property
     def time_step(self) -> int:
@@ -201,12 +216,80 @@ class StoredQuery:
             value = time_step_params[0].value
         return int(value) if value is not None else 60
 
+    def matching_file_reference(
+        self, query: Dict[str, str], max_age: datetime.timedelta
+    ) -> Optional[str]:
+        """
+        Finds a file reference of the expand response whose query has exactly
+        the given parameters with the same values. Only the order and case of
+        the variables of param may differ.
+        :param query: query parameters of the download url
+        :param max_age: maximum age of the expand response
+        :return: url of the file reference or None
+        """
+        if (
+            self.expanded_at is None
+            or datetime.datetime.utcnow() - self.expanded_at > max_age
+        ):
+            return None
+        for reference in self.file_references:
+            reference_query = {
+                name: values[0]
+                for name, values in parse_qs(urlsplit(reference.url).query).items()
+            }
+            if reference_query.keys() == query.keys() and all(
+                self._comparable(name, reference_query[name])
+                == self._comparable(name, value)
+                for name, value in query.items()
+            ):
+                return reference.url
+        return None
+
+    def latest_origin_time(self, max_age: datetime.timedelta) -> Optional[str]:
+        """
+        Resolves the latest forecast run from the file references of the
+        expand response, so that requests of the latest run can be compared
+        with grids of known runs
+        :param max_age: maximum age of the expand response
+        :return: latest origintime of the file references or None
+        """
+        if (
+            self.expanded_at is None
+            or datetime.datetime.utcnow() - self.expanded_at > max_age
+        ):
+            return None
+        origin_times = []
+        for reference in self.file_references:
+            values = parse_qs(urlsplit(reference.url).query).get("origintime")
+            if not values:
+                continue
+            try:
+                origin_times.append(
+                    datetime.datetime.strptime(values[0], Parameter.TIME_FORMAT)
+                )
+            except ValueError:
+                continue
+        if not origin_times:
+            return None
+        return max(origin_times).strftime(Parameter.TIME_FORMAT)
+
+    @staticmethod
+    def _comparable(name: str, value: Optional[str]) -> Optional[str]:
+        if value is not None and name == "param":
+            # Order and case of the variables do not matter
+            return ",".join(sorted(value.lower().split(",")))
+        return value
+
     @staticmethod
     def create(sq_element: ET.Element) -> Optional["StoredQuery"]:
         id = sq_element.get("id")
         sq_type = StoredQuery.Type.Vector
         if id.endswith("grid"):  # type: ignore
             sq_type = StoredQuery.Type.Raster
+        elif any(
+            pattern in id for pattern in StoredQuery.FILE_QUERY_PATTERNS  # type: ignore
+        ):
+            sq_type = StoredQuery.Type.Files
         elif id.endswith("iwxxm") or id.endswith("GetFeatureById"):  # type: ignore
             # TODO: add support?
             return None
@@ -356,6 +439,52 @@ class WFSMetadata:
         return False
 
 
+class FileReference:
+    """
+    Url of a file in a wfs:member of a GetFeature response
+    """
+
+    def __init__(self, url: str, time: Optional[datetime.datetime]) -> None:
+        """
+        :param url: download url of the file
+        :param time: phenomenon time of the member
+        """
+        self.url = url
+        self.time = time
+
+    @staticmethod
+    def parse_all(content: Union[str, bytes]) -> List["FileReference"]:
+        """
+        :param content: GetFeature response of a grid stored query
+        :return: file references of the members in the order of the response
+        """
+        root = ET.ElementTree(ET.fromstring(content)).getroot()
+        references: List[FileReference] = []
+        for member in root.findall("{%s}member" % Namespace.WFS.value):
+            file_reference = member.find(".//{%s}fileReference" % Namespace.GML.value)
+            if file_reference is None or not file_reference.text:
+                continue
+            references.append(
+                FileReference(
+                    file_reference.text.strip(), FileReference._phenomenon_time(member)
+                )
+            )
+        return references
+
+    @staticmethod
+    def _phenomenon_time(member: ET.Element) -> Optional[datetime.datetime]:
+        phenomenon_time = member.find(".//{%s}phenomenonTime" % Namespace.OM.value)
+        if phenomenon_time is None:
+            return None
+        for tag in ("timePosition", "beginPosition"):
+            position = phenomenon_time.find(".//{%s}%s" % (Namespace.GML.value, tag))
+            if position is not None and position.text:
+                return datetime.datetime.strptime(
+                    position.text.strip(), Parameter.TIME_FORMAT
+                )
+        return None
+
+
 class StoredQueryFactory:
     def __init__(self, wfs_url: str, wfs_version: str) -> None:
         self.wfs_url = wfs_url
@@ -392,23 +521,66 @@ class StoredQueryFactory:
 
         return stored_queries
 
-    def expand(self, sq: StoredQuery) -> None:
+    def expand_all(self, sqs: List[StoredQuery]) -> None:
+        """
+        Gather extra information for multiple stored queries. The requests of
+        all queries are made concurrently on a single event loop.
+        :param sqs: StoredQuery objects
+        """
+        raster_sqs = [sq for sq in sqs if sq.type == StoredQuery.Type.Raster]
+        if not raster_sqs:
+            return
+        downloader = AsyncDownloader()
+        contents = [
+            content.decode("utf-8")
+            for content in downloader.fetch_all(
+                [self.__get_feature_url(sq, 10) for sq in raster_sqs]
+            )
+        ]
+        ob_urls = sorted(
+            {
+                self._observed_property_url(
+                    ET.ElementTree(ET.fromstring(content)).getroot()
+                )
+                for sq, content in zip(raster_sqs, contents)
+                if any(param.has_variables() for param in sq.parameters.values())
+            }
+        )
+        observed_properties = {
+            url: content.decode("utf-8")
+            for url, content in zip(ob_urls, downloader.fetch_all(ob_urls))
+        }
+        for sq, content in zip(raster_sqs, contents):
+            self.expand(sq, content, observed_properties)
+
+    def expand(
+        self,
+        sq: StoredQuery,
+        content: Optional[str] = None,
+        observed_properties: Optional[Dict[str, str]] = None,
+    ) -> None:
         """
         Gather extra information for the stored query
         :param sq: StoredQuery object
+        :param content: GetFeature response of the stored query if fetched already
+        :param observed_properties: observed property responses fetched already
+            by their urls
         """
         if sq.type == StoredQuery.Type.Raster:
-            content = fetch(self.__get_feature_url(sq, 10))
+            if content is None:
+                content = fetch(self.__get_feature_url(sq, 10))
             root = ET.ElementTree(ET.fromstring(content)).getroot()
+            sq.file_references = FileReference.parse_all(content)
+            sq.expanded_at = datetime.datetime.utcnow()
             grid_observation_first_elem = list(list(root)[0])[0]
 
             # Observed property url
-            ob_url = grid_observation_first_elem.find(  # type: ignore
-                "{%s}observedProperty" % Namespace.OM.value
-            ).items()[0][-1]
+            ob_url = self._observed_property_url(root)
             for param in sq.parameters.values():
                 if param.has_variables():
-                    param.populate_variables(ob_url)
+                    param.populate_variables(
+                        ob_url, (observed_properties or {}).get(ob_url)
+                    )
 
             process_url = grid_observation_first_elem.find(  # type: ignore
                 "{%s}procedure" % Namespace.OM.value
@@ -469,6 +641,55 @@ class StoredQueryFactory:
                                 ):
                                     param2.add_possible_value(param_value)
 
+    @staticmethod
+    def _observed_property_url(root: ET.Element) -> str:
+        grid_observation_first_elem = list(list(root)[0])[0]
+        return grid_observation_first_elem.find(  # type: ignore
+            "{%s}observedProperty" % Namespace.OM.value
+        ).items()[0][-1]
+
+    def get_feature_request(self, sqs: List[StoredQuery]) -> bytes:
+        """
+        :param sqs: StoredQuery objects with their parameter values
+        :return: body of a GetFeature POST request containing all stored queries
+        """
+        ET.register_namespace("wfs", Namespace.WFS.value)
+        request = ET.Element(
+            "{%s}GetFeature" % Namespace.WFS.value,
+            {"service": "WFS", "version": self.wfs_version},
+        )
+        for sq in sqs:
+            query = ET.SubElement(
+                request, "{%s}StoredQuery" % Namespace.WFS.value, {"id": sq.id}
+            )
+            for name, param in sq.parameters.items():
+                if param.value is not None:
+                    parameter = ET.SubElement(
+                        query, "{%s}Parameter" % Namespace.WFS.value, {"name": name}
+                    )
+                    parameter.text = str(param.value)
+        return ET.tostring(request, encoding="utf-8")
+
+    def get_features_in_batch(self, sqs: List[StoredQuery]) -> Optional[List[bytes]]:
+        """
+        Gets the features of multiple stored queries with a single GetFeature
+        request
+        :param sqs: StoredQuery objects with their parameter values
+        :return: feature collections in the order of the queries or None if the
+            response could not be split into collections of the queries
+        """
+        downloader = AsyncDownloader()
+        try:
+            content = downloader.run(
+                downloader.fetch(self.wfs_url, self.get_feature_request(sqs))
+            )
+        except QgsPluginNetworkException as e:
+            error_message = e.bar_msg["details"]  # type: ignore
+            if "<?xml" in error_message:
+                raise_based_on_response(error_message[error_message.index("<?xml") :])
+            raise
+        return split_feature_collection(content, len(sqs))
+
 
 def raise_based_on_response(xml_content: str) -> None:
     """
@@ -487,3 +708,38 @@ def raise_based_on_response(xml_content: str) -> None:
     raise WfsException(
         tr("Exception occurred: {}", exception_code), bar_msg=bar_msg(exception_texts)
     )
+
+
+def split_feature_collection(
+    content: Union[str, bytes], num_of_collections: int
+) -> Optional[List[bytes]]:
+    """
+    Splits the response of a GetFeature request with multiple stored queries.
+    The result of each query is a wfs:FeatureCollection nested in a wfs:member
+    of the response.
+    :param content: GetFeature response
+    :param num_of_collections: number of stored queries in the request
+    :return: feature collection documents in the order of the queries or None
+        if the response does not contain a collection for each query
+    """
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    # Keep the prefixes of the response, GML readers expect the usual ones
+    for _, (prefix, uri) in ET.iterparse(io.BytesIO(data), events=("start-ns",)):
+        if prefix and not re.fullmatch(r"ns\d+", prefix):
+            ET.register_namespace(prefix, uri)
+
+    root = ET.fromstring(data)
+    collection_tag = "{%s}FeatureCollection" % Namespace.WFS.value
+    collections = [
+        collection
+        for member in root.findall("{%s}member" % Namespace.WFS.value)
+        for collection in member.findall(collection_tag)
+    ]
+    if root.tag != collection_tag or len(collections) != num_of_collections:
+        return None
+
+    schema_location = "{%s}schemaLocation" % Namespace.XSI.value
+    for collection in collections:
+        if schema_location in root.attrib:
+            collection.attrib.setdefault(schema_location, root.attrib[schema_location])
+    return [ET.tostring(collection, encoding="utf-8") for collection in collections]
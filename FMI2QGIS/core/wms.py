@@ -135,7 +135,7 @@ class WMSLayerHandler:
         start_time: Optional[datetime.datetime] = None,
         end_time: Optional[datetime.datetime] = None,
         elevation: Optional[float] = None,
-    ) -> None:
+    ) -> QgsRasterLayer:
         """
         Add WMS layer to map
         :param wms_layer: layer to add
@@ -143,13 +143,14 @@ class WMSLayerHandler:
         :param end_time: if given, use this as end time of the layer
         :param elevation: if given, use this as elevation.
             Must be in wms_layer.elevations
-        :return:
+        :return: added layer
         """
-        url = self._construct_qgis_url(wms_layer, start_time, end_time, elevation)
+        url = self.construct_qgis_url(wms_layer, start_time, end_time, elevation)
         layer = QgsRasterLayer(url, wms_layer.name, "wms")
         if layer.isValid():
             # noinspection PyArgumentList
             QgsProject.instance().addMapLayer(layer)
+            return layer
         else:
             raise WMSException(
                 tr("Layer is not valid"),
@@ -162,7 +163,7 @@ class WMSLayerHandler:
         url = f"{self.wms_url}?request=GetCapabilities"
         return fetch(url)
 
-    def _construct_qgis_url(
+    def construct_qgis_url(
         self,
         wms_layer: WMSLayer,
         start_time: Optional[datetime.datetime] = None,
@@ -30,6 +30,20 @@ class Settings(enum.Enum):
     FMI_WFS_VERSION = "2.0.0"
     FMI_WMS_URL = "https://openwms.fmi.fi/geoserver/wms"
     MESH_PROVIDER_LIB = "mdal"
+    REFRESH_PUBLICATION_DELAY = 5  # minutes
+    MESH_CONVERSION_WORKERS = 4
+    FRAME_CACHE_FRAMES = 3  # frames rendered ahead of the animation
+    FRAME_CACHE_SIZE = 256  # MB
+    RASTER_OVERVIEW_LEVELS = "2,4,8,16"  # empty to disable overviews
+    RASTER_OVERVIEW_RESAMPLING = "AVERAGE"
+    ARCHIVE_GRIDS = False
+    GRID_ARCHIVE_DIR = "archive"  # relative to the download directory
+    DERIVED_VARIABLES = True
+    PARALLEL_DOWNLOADS = 6  # concurrent downloads of a split product request
+    ENFUSER_ARCHIVE_RETENTION = 48  # hours
+    MAX_CONCURRENT_REQUESTS = 16  # requests multiplexed on a single event loop
+    FILE_REFERENCE_MAX_AGE = 10  # minutes the file references of expand are reused
+    WFS_BATCH_SIZE = 20  # stored queries combined in a single GetFeature request
 
     def get(self, typehint: type = str) -> Any:
         """Gets the value of the setting"""
@@ -43,3 +57,4 @@ class Namespace(enum.Enum):
     OMOP = "http://inspire.ec.europa.eu/schemas/omop/2.9"
     WMS = "http://www.opengis.net/wms"
     GML = "http://www.opengis.net/gml/3.2"
+    XSI = "http://www.w3.org/2001/XMLSchema-instance"
@@ -17,15 +17,27 @@
 #  You should have received a copy of the GNU General Public License
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Callable, List, Optional, Set
-
-from qgis.core import QgsDateTimeRange, QgsMapLayer, QgsProject, QgsRasterLayer
+from typing import Callable, Dict, List, Optional
+
+from qgis.core import (
+    QgsApplication,
+    QgsDateTimeRange,
+    QgsMapLayer,
+    QgsProject,
+    QgsRasterLayer,
+)
 from qgis.PyQt.QtCore import QCoreApplication, QTranslator
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QDockWidget, QWidget
 from qgis.utils import iface
 
+from .core.frame_cache import FrameCache, FrameKey, FramePrerenderer, frame_key
+from .core.grid.time_index import TimeBandIndex, set_raster_band
 from .core.processing.provider import Fmi2QgisProcessingProvider
+from .core.processing.vector_loader import VectorLoader
+from .core.refresh_scheduler import RefreshScheduler
+from .core.wms import WMSLayerHandler
+from .definitions.configurable_settings import Settings
 from .qgis_plugin_tools.tools.custom_logging import (
     setup_logger,
     teardown_logger,
@@ -34,6 +46,7 @@ from .qgis_plugin_tools.tools.custom_logging import (
 from .qgis_plugin_tools.tools.i18n import setup_translation, tr
 from .qgis_plugin_tools.tools.raster_layers import set_band_based_on_range
 from .qgis_plugin_tools.tools.resources import plugin_name, resources_path
+from .ui.frame_overlay import CachedFrameItem
 from .ui.main_dialog import MainDialog
 from .ui.wms_dialog import WMSDialog
 
@@ -66,7 +79,15 @@ class Plugin:
 
         self.processing_provider = Fmi2QgisProcessingProvider()
 
-        self.manually_handled_temporal_layer_ids: Set[str] = set()
+        self.manually_handled_temporal_layers: Dict[str, Optional[TimeBandIndex]] = {}
+
+        self.refresh_scheduler = RefreshScheduler(
+            WMSLayerHandler(Settings.FMI_WMS_URL.get())
+        )
+
+        self.frame_cache = FrameCache(Settings.FRAME_CACHE_SIZE.get(int) * 1024 ** 2)
+        self.frame_prerenderer = FramePrerenderer(self.frame_cache)
+        self.cached_frame_item: Optional[CachedFrameItem] = None
 
     def add_action(
         self,
@@ -152,8 +173,13 @@ class Plugin:
             add_to_toolbar=False,
         )
 
+    def initProcessing(self) -> None:  # noqa N802
+        """
+        Registers the processing provider. QGIS calls this also without the
+        GUI, e.g. in qgis_process, since the plugin has a processing provider.
+        """
         # noinspection PyArgumentList
-        # QgsApplication.processingRegistry().addProvider(self.processing_provider)
+        QgsApplication.processingRegistry().addProvider(self.processing_provider)
 
     def onClosePlugin(self) -> None:  # noqa N802
         """Cleanup necessary items here when plugin dockwidget is closed"""
@@ -165,10 +191,17 @@ class Plugin:
             iface.removePluginMenu(tr(plugin_name()), action)
             iface.removeToolBarIcon(action)
 
+        self.refresh_scheduler.stop()
+        self.frame_prerenderer.cancel()
+        self.frame_cache.clear()
+        if self.cached_frame_item is not None:
+            self.cached_frame_item.remove()
+            self.cached_frame_item = None
+
         teardown_logger(plugin_name())
 
         # noinspection PyArgumentList
-        # QgsApplication.processingRegistry().removeProvider(self.processing_provider)
+        QgsApplication.processingRegistry().removeProvider(self.processing_provider)
 
     def run(self) -> None:
         """Run method that performs all the real work"""
@@ -176,16 +209,26 @@ class Plugin:
         dialog = MainDialog()
         use_custom_msg_bar_in_logger(plugin_name(), dialog.message_bar)
 
-        def update_layers(layer_ids: List[str]) -> None:
-            self.manually_handled_temporal_layer_ids.update(set(layer_ids))
+        def update_layers(
+            time_band_indices: Dict[str, Optional[TimeBandIndex]]
+        ) -> None:
+            self.manually_handled_temporal_layers.update(time_band_indices)
+
+        def register_refreshable_layers(loader: VectorLoader) -> None:
+            for layer_id in loader.layer_ids:
+                self.refresh_scheduler.register_vector_layer(loader, layer_id)
 
         dialog.temporal_layers_added.connect(update_layers)
+        dialog.refreshable_layers_added.connect(register_refreshable_layers)
         dialog.exec()
 
     def add_wms(self) -> None:
         self.__show_temporal_controller()
         dialog = WMSDialog()
         use_custom_msg_bar_in_logger(plugin_name(), dialog.message_bar)
+        dialog.refreshable_layer_added.connect(
+            self.refresh_scheduler.register_wms_layer
+        )
         dialog.exec()
 
     # Temporal common functionality
@@ -208,20 +251,63 @@ class Plugin:
     def __temporal_range_changed(self, t_range: QgsDateTimeRange) -> None:
         """Update manually handled temporal layers"""
         obsolete_layer_ids = set()
+        begin = t_range.begin().toPyDateTime()
+        end = t_range.end().toPyDateTime()
         layer: QgsMapLayer
-        for layer_id in self.manually_handled_temporal_layer_ids:
+        for layer_id, time_band_index in self.manually_handled_temporal_layers.items():
             # noinspection PyArgumentList
             layer = QgsProject.instance().mapLayer(layer_id)
             if layer is None:
                 # removed by user
                 obsolete_layer_ids.add(layer_id)
+            elif not isinstance(layer, QgsRasterLayer):
+                continue
+            elif time_band_index is None:
+                # The time coordinate of the layer could not be read
+                if layer.temporalProperties().isVisibleInTemporalRange(t_range):
+                    set_band_based_on_range(layer, t_range)
             else:
-                tprops = layer.temporalProperties()
-                if tprops.isVisibleInTemporalRange(t_range):
-                    if isinstance(layer, QgsRasterLayer):
-                        set_band_based_on_range(layer, t_range)
-                else:
-                    pass
-                    # TODO: what to do?
-
-        self.manually_handled_temporal_layer_ids.difference_update(obsolete_layer_ids)
+                band = time_band_index.band_for_range(begin, end)
+                if band is not None:
+                    set_raster_band(layer, band)
+
+        for layer_id in obsolete_layer_ids:
+            self.manually_handled_temporal_layers.pop(layer_id)
+
+        self.__show_cached_frame(t_range)
+        self.__prerender_next_frames()
+
+    def __show_cached_frame(self, t_range: QgsDateTimeRange) -> None:
+        """Shows the frame immediately if it is pre-rendered"""
+        canvas = iface.mapCanvas()
+        key = frame_key(canvas.mapSettings(), t_range, self.frame_cache.revisions)
+        image = self.frame_cache.get(key)
+        if image is not None:
+            if self.cached_frame_item is None:
+                self.cached_frame_item = CachedFrameItem(
+                    canvas, self.__current_frame_key
+                )
+            self.cached_frame_item.show_frame(image, key)
+
+    def __current_frame_key(self) -> FrameKey:
+        canvas = iface.mapCanvas()
+        return frame_key(
+            canvas.mapSettings(), canvas.temporalRange(), self.frame_cache.revisions
+        )
+
+    def __prerender_next_frames(self) -> None:
+        """Renders the next frames of the animation in the background"""
+        num_of_frames = Settings.FRAME_CACHE_FRAMES.get(int)
+        canvas = iface.mapCanvas()
+        navigation = canvas.temporalController()
+        if num_of_frames <= 0 or not hasattr(navigation, "currentFrameNumber"):
+            return
+        current = navigation.currentFrameNumber()
+        last = min(current + num_of_frames, navigation.totalFrameCount() - 1)
+        t_ranges = [
+            navigation.dateTimeRangeForFrameNumber(frame)
+            for frame in range(current + 1, last + 1)
+        ]
+        self.frame_prerenderer.prerender(
+            canvas.mapSettings(), t_ranges, self.manually_handled_temporal_layers
+        )
@@ -22,12 +22,18 @@ This class contains fixtures and common helper function to keep the test files s
 #  You should have received a copy of the GNU General Public License
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Callable, List
+from typing import Callable, List, Sequence
 
+import numpy as np
 import pytest
+from osgeo import gdal
 from qgis.core import QgsProcessingFeedback, QgsRasterLayer, QgsRectangle
+from qgis.PyQt.QtNetwork import QNetworkProxy
 
+from ..core import downloads
 from ..core.wfs import StoredQuery, StoredQueryFactory
 from ..core.wms import WMSLayer, WMSLayerHandler
 from ..definitions.configurable_settings import Settings
@@ -146,3 +152,114 @@ def extent_lg_1() -> QgsRectangle:
 @pytest.fixture
 def tmpdir_pth(tmpdir) -> Path:
     return Path(tmpdir)
+
+
+def _write_1d(root, dim, values, units=None):
+    array = root.CreateMDArray(
+        dim.GetName(), [dim], gdal.ExtendedDataType.Create(gdal.GDT_Float64)
+    )
+    array.Write(np.asarray(values, dtype=np.float64))
+    if units is not None:
+        attribute = array.CreateAttribute(
+            "units", [], gdal.ExtendedDataType.CreateString()
+        )
+        attribute.Write(units)
+    dim.SetIndexingVariable(array)
+
+
+@pytest.fixture
+def hybrid_file(tmpdir_pth) -> Path:
+    path = Path(tmpdir_pth, "hybrid.nc")
+    ds = gdal.GetDriverByName("netCDF").CreateMultiDimensional(str(path))
+    root = ds.GetRootGroup()
+    time = root.CreateDimension("time", "TEMPORAL", None, 2)
+    level = root.CreateDimension("level", "VERTICAL", None, 3)
+    lat = root.CreateDimension("lat", "HORIZONTAL_Y", None, 2)
+    lon = root.CreateDimension("lon", "HORIZONTAL_X", None, 2)
+    _write_1d(root, time, [0, 1], "hours since 2020-11-19 12:00:00")
+    _write_1d(root, level, [12, 13, 14])
+    _write_1d(root, lat, [60.0, 60.1])
+    _write_1d(root, lon, [24.0, 24.1])
+    array = root.CreateMDArray(
+        "air_temperature",
+        [time, level, lat, lon],
+        gdal.ExtendedDataType.Create(gdal.GDT_Float32),
+    )
+    values = np.zeros((2, 3, 2, 2), dtype=np.float32)
+    for t in range(2):
+        for lev in range(3):
+            # Values increase eastwards by one per column
+            values[t, lev] = 10 * lev + t + np.arange(2)
+    array.Write(values)
+    ds = None
+    return path
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa N802
+        self._respond(None)
+
+    def do_POST(self):  # noqa N802
+        self._respond(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def _respond(self, data):
+        self.server.requests.append((self.path, data))
+        status, headers, body = self.server.respond(self.path, data)
+        self.send_response(status)
+        for name, value in {"Content-Length": str(len(body)), **headers}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server. The response is set by replacing server.respond, which
+    is called with the path and the body of the request and returns a tuple
+    of the status, the headers and the body of the response.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    server.requests = []
+    server.respond = lambda path, data: (404, {}, b"")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _NetworkAccessManager:
+    def __init__(self, proxy: QNetworkProxy, excludes: List[str]) -> None:
+        self.proxy = proxy
+        self.excludes = excludes
+
+    def fallbackProxy(self) -> QNetworkProxy:  # noqa N802
+        return self.proxy
+
+    def excludeList(self) -> List[str]:  # noqa N802
+        return self.excludes
+
+
+@pytest.fixture
+def qgis_proxy(monkeypatch):
+    """
+    Sets the proxy of the QGIS network settings used by the downloads. Called
+    with the QNetworkProxy and the excluded url prefixes.
+    """
+
+    def set_proxy(proxy: QNetworkProxy, excludes: Sequence[str] = ()) -> None:
+        manager = _NetworkAccessManager(proxy, list(excludes))
+        monkeypatch.setattr(
+            downloads,
+            "QgsNetworkAccessManager",
+            type("QgsNetworkAccessManager", (), {"instance": lambda: manager}),
+        )
+
+    return set_proxy
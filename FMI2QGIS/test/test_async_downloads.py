@@ -0,0 +1,289 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import base64
+import re
+import socket
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from qgis.PyQt.QtNetwork import QNetworkProxy
+
+from ..core.async_downloads import MAX_REDIRECTS, AsyncDownloader
+from ..core.exceptions.loader_exceptions import DownloadCanceledException
+from ..qgis_plugin_tools.tools.exceptions import QgsPluginNetworkException
+
+
+@pytest.fixture
+def downloader():
+    return AsyncDownloader(max_connections=3, timeout=5, chunk_size=16)
+
+
+@pytest.fixture
+def raw_server():
+    """
+    Local TCP server answering each connection with the raw bytes returned by
+    server.respond, which is called with the head of the request
+    """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    listener.settimeout(0.1)
+    stopped = threading.Event()
+    server = SimpleNamespace(
+        port=listener.getsockname()[1], requests=[], respond=lambda head: b""
+    )
+    server.url = f"http://127.0.0.1:{server.port}"
+
+    def serve():
+        while not stopped.is_set():
+            try:
+                connection, _ = listener.accept()
+            except socket.timeout:
+                continue
+            with connection:
+                connection.settimeout(5)
+                head = b""
+                while b"\r\n\r\n" not in head:
+                    chunk = connection.recv(1024)
+                    if not chunk:
+                        break
+                    head += chunk
+                head, _, body = head.partition(b"\r\n\r\n")
+                length = re.search(rb"Content-Length: (\d+)", head)
+                while length and len(body) < int(length.group(1)):
+                    body += connection.recv(1024)
+                server.requests.append(head.decode("latin-1"))
+                connection.sendall(server.respond(head.decode("latin-1")))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server
+    stopped.set()
+    thread.join()
+    listener.close()
+
+
+def test_fetch_all_limits_connections(downloader, http_server):
+    lock = threading.Lock()
+    connections = {"open": 0, "max": 0}
+
+    def respond(path, data):
+        with lock:
+            connections["open"] += 1
+            connections["max"] = max(connections["max"], connections["open"])
+        time.sleep(0.02)
+        with lock:
+            connections["open"] -= 1
+        return 200, {}, path.encode()
+
+    http_server.respond = respond
+    urls = [f"{http_server.url}/query/{i}" for i in range(30)]
+
+    contents = downloader.fetch_all(urls)
+
+    assert contents == [f"/query/{i}".encode() for i in range(30)]
+    assert 1 < connections["max"] <= 3
+
+
+def test_fetch_follows_redirects(downloader, http_server):
+    def respond(path, data):
+        if path == "/old":
+            return 302, {"Location": "/new"}, b""
+        return 200, {}, b"new"
+
+    http_server.respond = respond
+
+    assert downloader.fetch_all([f"{http_server.url}/old"]) == [b"new"]
+
+
+def test_fetch_post(downloader, http_server):
+    http_server.respond = lambda path, data: (200, {}, data.upper())
+
+    content = downloader.run(downloader.fetch(f"{http_server.url}/wfs", b"<query/>"))
+
+    assert content == b"<QUERY/>"
+    assert http_server.requests == [("/wfs", b"<query/>")]
+
+
+def test_fetch_error(downloader, http_server):
+    http_server.respond = lambda path, data: (400, {}, b"Invalid parameter")
+
+    with pytest.raises(QgsPluginNetworkException) as excinfo:
+        downloader.fetch_all([f"{http_server.url}/wfs"])
+
+    assert "400 Bad Request: Invalid parameter" in excinfo.value.bar_msg["details"]
+
+
+def test_download_all(tmpdir_pth, downloader, http_server):
+    http_server.respond = lambda path, data: (200, {}, path.encode() * 10)
+    uris = {"a.nc": f"{http_server.url}/a", "b.nc": f"{http_server.url}/b"}
+    progress = {}
+
+    paths = downloader.download_all(
+        uris,
+        tmpdir_pth,
+        progress=lambda name, num_of_bytes, total: progress.update(
+            {name: (num_of_bytes, total)}
+        ),
+    )
+
+    assert paths == {name: Path(tmpdir_pth, name) for name in uris}
+    assert paths["a.nc"].read_bytes() == b"/a" * 10
+    assert progress == {"a.nc": (20, 20), "b.nc": (20, 20)}
+
+
+def test_download_all_removes_files_on_failure(tmpdir_pth, downloader, http_server):
+    def respond(path, data):
+        if path == "/b":
+            return 500, {}, b""
+        return 200, {}, b"content"
+
+    http_server.respond = respond
+    uris = {name: f"{http_server.url}/{name}" for name in ("a", "b", "c")}
+
+    with pytest.raises(QgsPluginNetworkException):
+        downloader.download_all(uris, tmpdir_pth)
+
+    assert not list(tmpdir_pth.iterdir())
+
+
+def test_download_all_cancel(tmpdir_pth, downloader, http_server):
+    http_server.respond = lambda path, data: (200, {}, b"x" * 100)
+
+    with pytest.raises(DownloadCanceledException):
+        downloader.download_all(
+            {"a.nc": f"{http_server.url}/a"}, tmpdir_pth, is_canceled=lambda: True
+        )
+
+    assert not list(tmpdir_pth.iterdir())
+
+
+def test_fetch_chunked_body(downloader, raw_server):
+    raw_server.respond = lambda head: (
+        b"HTTP/1.1 200 OK\r\n"
+        b"Transfer-Encoding: chunked\r\n"
+        b"\r\n"
+        b"4;name=value\r\nWiki\r\n"
+        b"14\r\n" + b"x" * 20 + b"\r\n"
+        b"0\r\n"
+        b"Expires: never\r\n"
+        b"\r\n"
+    )
+
+    content = downloader.run(downloader.fetch(f"{raw_server.url}/chunked"))
+
+    assert content == b"Wiki" + b"x" * 20
+
+
+def test_fetch_body_until_closed(downloader, raw_server):
+    raw_server.respond = lambda head: b"HTTP/1.0 200\r\n\r\n" + b"y" * 40
+
+    content = downloader.run(downloader.fetch(f"{raw_server.url}/stream"))
+
+    assert content == b"y" * 40
+
+
+def test_fetch_follows_absolute_redirect_with_get(downloader, raw_server):
+    def respond(head):
+        if head.startswith("POST /old "):
+            return (
+                f"HTTP/1.1 303 See Other\r\n"
+                f"Location: {raw_server.url}/new?a=1\r\n"
+                f"Content-Length: 0\r\n\r\n"
+            ).encode()
+        return b"HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nnew"
+
+    raw_server.respond = respond
+
+    content = downloader.run(downloader.fetch(f"{raw_server.url}/old", b"<query/>"))
+
+    assert content == b"new"
+    assert raw_server.requests[1].startswith("GET /new?a=1 HTTP/1.1")
+
+
+def test_fetch_too_many_redirects(downloader, raw_server):
+    raw_server.respond = lambda head: (
+        b"HTTP/1.1 302 Found\r\nLocation: /loop\r\nContent-Length: 0\r\n\r\n"
+    )
+
+    with pytest.raises(QgsPluginNetworkException) as excinfo:
+        downloader.fetch_all([f"{raw_server.url}/loop"])
+
+    assert len(raw_server.requests) == MAX_REDIRECTS + 1
+    assert f"{raw_server.url}/loop" in excinfo.value.bar_msg["details"]
+
+
+def test_fetch_error_with_chunked_body(downloader, raw_server):
+    raw_server.respond = lambda head: (
+        b"HTTP/1.1 404 Not Found\r\n"
+        b"Transfer-Encoding: chunked\r\n"
+        b"\r\n"
+        b"7\r\nMissing\r\n"
+        b"0\r\n\r\n"
+    )
+
+    with pytest.raises(QgsPluginNetworkException) as excinfo:
+        downloader.fetch_all([f"{raw_server.url}/missing"])
+
+    assert "404 Not Found: Missing" in excinfo.value.bar_msg["details"]
+
+
+def test_fetch_through_http_proxy(downloader, raw_server, qgis_proxy):
+    raw_server.respond = lambda head: b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+    qgis_proxy(
+        QNetworkProxy(
+            QNetworkProxy.HttpProxy, "127.0.0.1", raw_server.port, "user", "secret"
+        )
+    )
+
+    content = downloader.fetch_all(["http://example.invalid/wfs?a=1"])
+
+    token = base64.b64encode(b"user:secret").decode()
+    assert content == [b"ok"]
+    assert raw_server.requests[0].startswith(
+        "GET http://example.invalid/wfs?a=1 HTTP/1.1"
+    )
+    assert f"Proxy-Authorization: Basic {token}" in raw_server.requests[0]
+
+
+def test_fetch_https_through_proxy_tunnel(downloader, raw_server, qgis_proxy):
+    raw_server.respond = lambda head: (
+        b"HTTP/1.1 407 Proxy Authentication Required\r\n\r\n"
+    )
+    qgis_proxy(QNetworkProxy(QNetworkProxy.HttpProxy, "127.0.0.1", raw_server.port))
+
+    with pytest.raises(QgsPluginNetworkException) as excinfo:
+        downloader.fetch_all(["https://example.invalid/wfs"])
+
+    assert raw_server.requests[0].startswith("CONNECT example.invalid:443 HTTP/1.1")
+    assert "407" in excinfo.value.bar_msg["details"]
+
+
+def test_fetch_fails_for_unsupported_proxy(downloader, raw_server, qgis_proxy):
+    qgis_proxy(QNetworkProxy(QNetworkProxy.Socks5Proxy, "127.0.0.1", raw_server.port))
+
+    with pytest.raises(QgsPluginNetworkException):
+        downloader.fetch_all([f"{raw_server.url}/wfs"])
+
+    assert not raw_server.requests
@@ -0,0 +1,238 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import copy
+import shutil
+import xml.etree.ElementTree as ET  # noqa
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from osgeo import ogr
+
+from ..core.headless import HeadlessRunner, Job
+from ..core.processing.batch_vector_loader import BatchVectorLoader
+from ..core.processing.vector_loader import VectorLoader
+from ..core.wfs import Parameter, StoredQueryFactory, split_feature_collection
+from ..definitions.configurable_settings import Namespace
+from ..qgis_plugin_tools.tools import network
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+from .conftest import AIR_QUALITY_ID
+
+add_to_map = False
+
+
+def _feature_collection() -> bytes:
+    with open(plugin_test_data_path("airquality_small.xml"), "rb") as f:
+        return f.read()
+
+
+def _nested_feature_collection(num_of_collections: int) -> bytes:
+    collection = _feature_collection().split(b"?>", 1)[1]
+    members = b"".join(
+        b"<wfs:member>" + collection + b"</wfs:member>"
+        for _ in range(num_of_collections)
+    )
+    return (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b'<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0">'
+        + members
+        + b"</wfs:FeatureCollection>"
+    )
+
+
+def _feature_count(path: Path) -> int:
+    ds = ogr.Open(str(path))
+    try:
+        return ds.GetLayer(0).GetFeatureCount()
+    finally:
+        ds = None
+
+
+@pytest.fixture
+def air_quality_sqs(air_quality_sq, extent_sm_1):
+    sqs = []
+    for param in ("SO2_PT1H_avg", "NO2_PT1H_avg"):
+        sq = copy.deepcopy(air_quality_sq)
+        sq.parameters["starttime"].value = datetime.strptime(
+            "2020-11-05T19:00:00Z", Parameter.TIME_FORMAT
+        )
+        sq.parameters["bbox"].value = extent_sm_1
+        sq.parameters["parameters"].value = param
+        sqs.append(sq)
+    return sqs
+
+
+@pytest.fixture
+def batch_server(http_server):
+    def respond(path, data):
+        if data is None:
+            return 404, {}, b""
+        num_of_queries = len(
+            ET.fromstring(data).findall("{%s}StoredQuery" % Namespace.WFS.value)
+        )
+        return 200, {}, _nested_feature_collection(num_of_queries)
+
+    http_server.respond = respond
+    return http_server
+
+
+def test_get_feature_request(wfs_url, wfs_version, air_quality_sqs):
+    factory = StoredQueryFactory(wfs_url, wfs_version)
+
+    request = ET.fromstring(factory.get_feature_request(air_quality_sqs))
+
+    assert request.tag == "{%s}GetFeature" % Namespace.WFS.value
+    assert request.attrib["version"] == wfs_version
+    queries = request.findall("{%s}StoredQuery" % Namespace.WFS.value)
+    assert [query.attrib["id"] for query in queries] == [AIR_QUALITY_ID] * 2
+    parameters = [
+        {
+            param.attrib["name"]: param.text
+            for param in query.findall("{%s}Parameter" % Namespace.WFS.value)
+        }
+        for query in queries
+    ]
+    assert [params["parameters"] for params in parameters] == [
+        "SO2_PT1H_avg",
+        "NO2_PT1H_avg",
+    ]
+    assert parameters[0]["starttime"] == "2020-11-05T19:00:00Z"
+    assert "endtime" not in parameters[0]
+
+
+def test_split_feature_collection():
+    collections = split_feature_collection(_nested_feature_collection(2), 2)
+
+    assert len(collections) == 2
+    expected_members = ET.fromstring(_feature_collection()).findall(
+        "{%s}member" % Namespace.WFS.value
+    )
+    for collection in collections:
+        root = ET.fromstring(collection)
+        assert root.tag == "{%s}FeatureCollection" % Namespace.WFS.value
+        assert len(root.findall("{%s}member" % Namespace.WFS.value)) == len(
+            expected_members
+        )
+        assert b"<BsWfs:BsWfsElement" in collection
+
+
+def test_split_feature_collection_without_nested_collections():
+    assert split_feature_collection(_feature_collection(), 2) is None
+    assert split_feature_collection(_nested_feature_collection(1), 2) is None
+
+
+def test_batch_loader(tmpdir_pth, wfs_version, air_quality_sqs, batch_server):
+    wfs_url = f"{batch_server.url}/wfs"
+    loaders = [
+        VectorLoader("", tmpdir_pth, wfs_url, wfs_version, sq, add_to_map)
+        for sq in air_quality_sqs
+    ]
+    batch_loader = BatchVectorLoader("", loaders)
+
+    result = batch_loader.run()
+
+    assert result, [loader.exception for loader in loaders]
+    assert batch_loader.results == [True, True]
+    assert len(batch_server.requests) == 1
+    assert batch_server.requests[0][0] == "/wfs"
+    paths = {loader.path_to_file for loader in loaders}
+    assert len(paths) == 2
+    for path in paths:
+        assert path.suffix == ".sqlite"
+        assert _feature_count(path) > 0
+
+
+def test_batch_loader_splits_batches(
+    tmpdir_pth, wfs_version, air_quality_sqs, batch_server
+):
+    wfs_url = f"{batch_server.url}/wfs"
+    loaders = [
+        VectorLoader("", tmpdir_pth, wfs_url, wfs_version, sq, add_to_map)
+        for sq in air_quality_sqs * 3
+    ]
+    batch_loader = BatchVectorLoader("", loaders, batch_size=4)
+
+    assert batch_loader._batches() == [[0, 1, 2, 3], [4, 5]]
+    assert batch_loader.run()
+    assert len(batch_server.requests) == 2
+
+
+def test_batch_loader_falls_back_to_separate_requests(
+    tmpdir_pth, wfs_version, air_quality_sqs, http_server, monkeypatch
+):
+    # The server does not nest the results of the queries
+    http_server.respond = lambda path, data: (200, {}, _feature_collection())
+    downloaded = []
+
+    def mock_download_to_file(
+        uri, output_dir: Path, output_name: str, *args, **kwargs
+    ) -> Path:
+        downloaded.append(uri)
+        output = Path(output_dir, output_name)
+        shutil.copy2(Path(plugin_test_data_path("airquality_small.xml.gz")), output)
+        return output
+
+    # Mocking the download
+    monkeypatch.setattr(network, "download_to_file", mock_download_to_file)
+
+    wfs_url = f"{http_server.url}/wfs"
+    loaders = [
+        VectorLoader("", tmpdir_pth, wfs_url, wfs_version, sq, add_to_map)
+        for sq in air_quality_sqs
+    ]
+    batch_loader = BatchVectorLoader("", loaders)
+
+    assert batch_loader.run()
+    assert len(http_server.requests) == 1
+    assert len(downloaded) == 2
+    assert all(loader.path_to_file.suffix == ".sqlite" for loader in loaders)
+
+
+def test_loaders_with_max_features_are_not_batched(
+    tmpdir_pth, wfs_url, wfs_version, air_quality_sqs
+):
+    loaders = [
+        VectorLoader("", tmpdir_pth, wfs_url, wfs_version, sq, add_to_map, 100)
+        for sq in air_quality_sqs
+    ]
+    batch_loader = BatchVectorLoader("", loaders)
+
+    assert batch_loader._batches() == [[0], [1]]
+
+
+def test_headless_batch(
+    tmpdir_pth, wfs_version, air_quality_sq, batch_server, monkeypatch
+):
+    runner = HeadlessRunner(f"{batch_server.url}/wfs", wfs_version, "")
+    monkeypatch.setattr(runner.factory, "list_queries", lambda: [air_quality_sq])
+    monkeypatch.setattr(runner.factory, "expand", lambda sq: None)
+    monkeypatch.setattr(runner.factory, "expand_all", lambda sqs: None)
+    jobs = [
+        Job(AIR_QUALITY_ID, {"parameters": param}, tmpdir_pth)
+        for param in ("SO2_PT1H_avg", "NO2_PT1H_avg", "O3_PT1H_avg")
+    ]
+    jobs.insert(1, Job("unknown", {}, tmpdir_pth))
+
+    results = runner.run_all(jobs, batch=True)
+
+    assert [result.job for result in results] == jobs
+    assert [result.success for result in results] == [True, False, True, True]
+    assert len(batch_server.requests) == 1
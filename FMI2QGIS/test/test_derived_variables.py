@@ -0,0 +1,129 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from ..core.grid.derived import (
+    accumulation_difference,
+    add_derived_variables,
+    wind_direction,
+)
+from .conftest import _write_1d
+
+
+def _create_variable(root, name, dims, standard_name, units, values):
+    array = root.CreateMDArray(
+        name, dims, gdal.ExtendedDataType.Create(gdal.GDT_Float32)
+    )
+    for key, value in (("standard_name", standard_name), ("units", units)):
+        attribute = array.CreateAttribute(key, [], gdal.ExtendedDataType.CreateString())
+        attribute.Write(value)
+    array.Write(np.asarray(values, dtype=np.float32))
+
+
+@pytest.fixture
+def grid_file(tmpdir_pth) -> Path:
+    path = Path(tmpdir_pth, "grid.nc")
+    ds = gdal.GetDriverByName("netCDF").CreateMultiDimensional(str(path))
+    root = ds.GetRootGroup()
+    dims = [
+        root.CreateDimension("time", "TEMPORAL", None, 3),
+        root.CreateDimension("lat", "HORIZONTAL_Y", None, 2),
+        root.CreateDimension("lon", "HORIZONTAL_X", None, 2),
+    ]
+    _write_1d(root, dims[0], [0, 1, 2], "hours since 2020-11-19 12:00:00")
+    shape = (3, 2, 2)
+    _create_variable(root, "u_10", dims, "eastward_wind", "m s-1", np.full(shape, 3))
+    _create_variable(root, "v_10", dims, "northward_wind", "m s-1", np.full(shape, 4))
+    _create_variable(
+        root, "t_2", dims, "air_temperature", "K", np.full(shape, 273.15)
+    )
+    accumulation = np.stack([np.full((2, 2), v) for v in (1, 3, 6)])
+    _create_variable(
+        root, "rr", dims, "precipitation_amount", "kg m-2", accumulation
+    )
+    ds = None
+    return path
+
+
+def _read(path, name):
+    ds = gdal.OpenEx(str(path), gdal.OF_MULTIDIM_RASTER)
+    values = ds.GetRootGroup().OpenMDArray(name).ReadAsArray()
+    ds = None
+    return values
+
+
+def test_wind_direction():
+    np.testing.assert_allclose(
+        wind_direction(np.array([0.0, -1.0, 0.0]), np.array([-1.0, 0.0, 1.0])),
+        [0, 90, 180],
+    )
+
+
+def test_accumulation_difference():
+    np.testing.assert_array_equal(
+        accumulation_difference(np.array([1, 3, 6]), axis=0, starts_at_origin=True),
+        [1, 2, 3],
+    )
+
+
+def test_accumulation_difference_without_origin():
+    np.testing.assert_array_equal(
+        accumulation_difference(np.array([[1, 3, 6]]), axis=1), [[np.nan, 2, 3]]
+    )
+
+
+def test_add_derived_variables(grid_file):
+    derived = add_derived_variables(grid_file, max_bytes=1)
+
+    assert set(derived) == {
+        "wind_speed",
+        "wind_from_direction",
+        "air_temperature_celsius",
+        "precipitation_amount_per_step",
+    }
+    np.testing.assert_allclose(_read(grid_file, "wind_speed"), 5)
+    np.testing.assert_allclose(_read(grid_file, "air_temperature_celsius"), 0, atol=1e-5)
+    # The origin time is not known
+    np.testing.assert_allclose(
+        _read(grid_file, "precipitation_amount_per_step")[:, 0, 0], [np.nan, 2, 3]
+    )
+    # Existing variables are not computed again
+    assert add_derived_variables(grid_file) == {}
+
+
+@pytest.mark.parametrize(
+    "origin_time,expected",
+    [
+        (datetime(2020, 11, 19, 12), [1, 2, 3]),
+        (datetime(2020, 11, 19, 6), [np.nan, 2, 3]),
+    ],
+)
+def test_add_derived_variables_with_origin_time(grid_file, origin_time, expected):
+    add_derived_variables(grid_file, origin_time=origin_time)
+
+    np.testing.assert_allclose(
+        _read(grid_file, "precipitation_amount_per_step")[:, 0, 0], expected
+    )
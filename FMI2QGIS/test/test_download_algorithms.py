@@ -0,0 +1,118 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from email.message import Message
+from pathlib import Path
+from urllib.response import addinfourl
+
+from qgis.core import QgsProcessingContext, QgsRectangle
+from qgis.PyQt.QtCore import QDateTime, Qt
+
+from ..core import downloads
+from ..core.headless import LoaderType
+from ..core.processing.algorithms.enfuser_download import EnfuserDownloadAlgorithm
+from ..core.processing.algorithms.stored_query_download import (
+    GridDownloadAlgorithm,
+    VectorDownloadAlgorithm,
+)
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+from .conftest import ENFUSER_ID
+
+
+def _utc(text: str) -> QDateTime:
+    return QDateTime.fromString(text, Qt.ISODate)
+
+
+def test_create_grid_job(tmpdir_pth):
+    alg = GridDownloadAlgorithm()
+    alg.initAlgorithm()
+
+    job = alg.create_job(
+        {
+            alg.STORED_QUERY: ENFUSER_ID,
+            alg.EXTENT: QgsRectangle(24.97, 60.2, 24.99, 60.21),
+            alg.START_TIME: _utc("2020-11-02T15:00:00Z"),
+            alg.END_TIME: _utc("2020-11-03T10:00:00Z"),
+            alg.PARAMETERS: "AQIndex",
+            alg.OTHER_PARAMETERS: "timestep=60; levels=0",
+            alg.OUTPUT_DIR: str(tmpdir_pth),
+        },
+        QgsProcessingContext(),
+    )
+
+    assert job.stored_query_id == ENFUSER_ID
+    assert job.loader_type == LoaderType.RASTER
+    assert job.output_dir == tmpdir_pth
+    assert job.parameters["bbox"] == QgsRectangle(24.97, 60.2, 24.99, 60.21)
+    assert job.parameters["starttime"] == datetime(2020, 11, 2, 15)
+    assert job.parameters["endtime"] == datetime(2020, 11, 3, 10)
+    assert job.parameters["param"] == "AQIndex"
+    assert job.parameters["timestep"] == "60"
+    assert job.parameters["levels"] == "0"
+
+
+def test_create_vector_job_with_max_features(tmpdir_pth):
+    alg = VectorDownloadAlgorithm()
+    alg.initAlgorithm()
+
+    job = alg.create_job(
+        {
+            alg.STORED_QUERY: "fmi::observations::airquality::hourly::simple",
+            alg.MAX_FEATURES: 100,
+            alg.OUTPUT_DIR: str(tmpdir_pth),
+        },
+        QgsProcessingContext(),
+    )
+
+    assert job.loader_type == LoaderType.VECTOR
+    assert job.max_features == 100
+    assert "bbox" not in job.parameters
+    assert "starttime" not in job.parameters
+
+
+def test_download_enfuser(tmpdir_pth, feedback, monkeypatch):
+    test_file = Path(plugin_test_data_path("aq_small.nc"))
+
+    def open_url(request, timeout=None):
+        headers = Message()
+        headers["Content-Disposition"] = 'attachment; filename="test_aq_small.nc"'
+        return addinfourl(open(test_file, "rb"), headers, request.full_url, 200)
+
+    # Mocking the download
+    monkeypatch.setattr(downloads, "open_url", open_url)
+
+    alg = EnfuserDownloadAlgorithm()
+    alg.initAlgorithm()
+    results = alg.processAlgorithm(
+        {
+            alg.PRODUCTS: [0],
+            alg.EXTENT: QgsRectangle(24.97, 60.2, 24.99, 60.21),
+            alg.START_TIME: _utc("2020-11-02T15:00:00Z"),
+            alg.END_TIME: _utc("2020-11-03T10:00:00Z"),
+            alg.PARALLEL: False,
+            alg.OUTPUT_DIR: str(tmpdir_pth),
+        },
+        QgsProcessingContext(),
+        feedback,
+    )
+
+    assert Path(results[alg.OUTPUT]) == Path(tmpdir_pth, "test_aq_small.nc")
+    assert Path(results[alg.OUTPUT]).is_file()
@@ -0,0 +1,128 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from osgeo import gdal
+from qgis.core import QgsProcessingContext
+
+from ..core.grid.time_index import TimeBandIndex
+from ..core.processing.algorithms.enfuser_archive import EnfuserArchiveAlgorithm
+from ..core.products.enfuser import EnfuserNetcdfLoader
+from ..core.products.enfuser_archive import EnfuserArchive
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+AQ_INDEX = EnfuserNetcdfLoader.Products.AirQualityIndex
+FIRST_HOUR = datetime(2020, 11, 2, 15)
+
+
+@pytest.fixture
+def archive(tmpdir_pth, fmi_download_url, feedback, extent_sm_1, monkeypatch):
+    archive = EnfuserArchive(
+        tmpdir_pth,
+        fmi_download_url,
+        [AQ_INDEX],
+        extent_sm_1,
+        feedback,
+        timedelta(hours=2),
+    )
+    archive.requests = []
+
+    def mock_download(products, extent, start_time, end_time, parallel=False):
+        archive.requests.append((products, start_time, end_time))
+        output = Path(archive.download_dir, "enfuser.nc")
+        shutil.copy2(plugin_test_data_path("aq_small.nc"), output)
+        return output
+
+    # Mocking the download
+    monkeypatch.setattr(archive.loader, "download", mock_download)
+    return archive
+
+
+def _hours(*offsets):
+    return [FIRST_HOUR + timedelta(hours=offset) for offset in offsets]
+
+
+def test_update_fetches_the_retention_window(archive):
+    added = archive.update(FIRST_HOUR + timedelta(hours=2, minutes=10))
+
+    assert archive.requests == [({AQ_INDEX}, *_hours(0, 2))]
+    assert added == {AQ_INDEX: _hours(0, 1, 2)}
+    assert archive.hours(AQ_INDEX) == _hours(0, 1, 2)
+    assert not list(archive.download_dir.iterdir())
+
+    _, path = archive.files(AQ_INDEX)[1]
+    ds = gdal.Open(f'NETCDF:"{path}":index_of_airquality_194')
+    assert ds.RasterCount == 1
+    assert TimeBandIndex.from_gdal_dataset(ds).times == _hours(1)
+    ds = None
+
+
+def test_hourly_update_fetches_only_the_new_hour(archive):
+    archive.update(FIRST_HOUR + timedelta(hours=2))
+    old_file = archive.files(AQ_INDEX)[0][1]
+
+    added = archive.update(FIRST_HOUR + timedelta(hours=3))
+
+    assert archive.requests[1:] == [({AQ_INDEX}, *_hours(3, 3))]
+    assert added == {AQ_INDEX: _hours(3)}
+    assert archive.hours(AQ_INDEX) == _hours(1, 2, 3)
+    assert not old_file.exists()
+
+    assert archive.update(FIRST_HOUR + timedelta(hours=3, minutes=30)) == {}
+    assert len(archive.requests) == 2
+
+
+def test_update_archive_algorithm(tmpdir_pth, feedback, extent_sm_1, monkeypatch):
+    requests = []
+
+    def mock_download(self, products, extent, start_time, end_time, parallel=False):
+        requests.append((products, start_time, end_time))
+        output = Path(self.download_dir, "enfuser.nc")
+        shutil.copy2(plugin_test_data_path("aq_small.nc"), output)
+        return output
+
+    # Mocking the download
+    monkeypatch.setattr(EnfuserNetcdfLoader, "download", mock_download)
+    archive_dir = Path(tmpdir_pth, "new", "archives")
+    alg = EnfuserArchiveAlgorithm()
+    alg.initAlgorithm()
+
+    results = alg.processAlgorithm(
+        {
+            alg.PRODUCTS: [list(EnfuserNetcdfLoader.Products).index(AQ_INDEX)],
+            alg.EXTENT: extent_sm_1,
+            alg.RETENTION: 2,
+            alg.ARCHIVE_DIR: str(archive_dir),
+        },
+        QgsProcessingContext(),
+        feedback,
+    )
+
+    assert Path(results[alg.OUTPUT]).parent == archive_dir
+    assert Path(results[alg.OUTPUT], "downloads").is_dir()
+    assert [(products, end - start) for products, start, end in requests] == [
+        ({AQ_INDEX}, timedelta(hours=2))
+    ]
+    # The hours of the test file are older than the retention window
+    assert results[alg.ADDED_HOURS] == 0
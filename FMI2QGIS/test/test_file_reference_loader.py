@@ -0,0 +1,141 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pytest
+from osgeo import gdal, osr
+from qgis.PyQt.QtCore import QVariant
+
+from ..core.processing.file_reference_loader import FileReferenceLoader
+from ..core.wfs import FileReference, Parameter, StoredQuery
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+TIMES = [
+    datetime(2021, 3, 1, 12, 0),
+    datetime(2021, 3, 1, 12, 5),
+    datetime(2021, 3, 1, 12, 10),
+]
+
+
+@pytest.fixture
+def radar_sq() -> StoredQuery:
+    parameters = {
+        name: Parameter(name, "", "", QVariant.DateTime)
+        for name in ("starttime", "endtime")
+    }
+    parameters["starttime"].value = TIMES[0]
+    parameters["endtime"].value = TIMES[-1]
+    return StoredQuery(
+        "fmi::radar::composite::dbz", "Radar", "", StoredQuery.Type.Files, parameters
+    )
+
+
+def _geotiff(path: Path, value: float) -> bytes:
+    ds = gdal.GetDriverByName("GTiff").Create(str(path), 3, 2, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform((100000.0, 1000.0, 0.0, 7000000.0, 0.0, -1000.0))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3067)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(np.full((2, 3), value, dtype=np.float32))
+    ds = None
+    return path.read_bytes()
+
+
+@pytest.fixture
+def radar_server(http_server, tmpdir_pth):
+    content = (
+        Path(plugin_test_data_path("radar_file_references.xml"))
+        .read_text()
+        .replace("https://opendata.fmi.fi", http_server.url)
+        .encode("utf-8")
+    )
+    images = {
+        time: _geotiff(Path(tmpdir_pth, f"{time:%H%M}.tif"), time.minute)
+        for time in TIMES
+    }
+
+    def respond(path, data):
+        if path.startswith("/wfs"):
+            return 200, {}, content
+        start_time = parse_qs(urlsplit(path).query)["starttime"][0]
+        return 200, {}, images[datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%SZ")]
+
+    http_server.respond = respond
+    return http_server
+
+
+def _loader(download_dir, server, sq) -> FileReferenceLoader:
+    return FileReferenceLoader("", download_dir, f"{server.url}/wfs", "2.0.0", sq, False)
+
+
+def test_parse_file_references():
+    content = Path(plugin_test_data_path("radar_file_references.xml")).read_bytes()
+
+    references = FileReference.parse_all(content)
+
+    assert [reference.time for reference in references] == [
+        TIMES[2],
+        TIMES[0],
+        TIMES[1],
+    ]
+    assert references[0].url.startswith("https://opendata.fmi.fi/download?")
+    assert "format=image/geotiff" in references[0].url
+
+
+def test_supports(radar_sq):
+    assert FileReferenceLoader.supports(radar_sq)
+
+
+def test_run_stacks_files_in_time_order(tmpdir_pth, radar_server, radar_sq):
+    download_dir = Path(tmpdir_pth, "downloads")
+    loader = _loader(download_dir, radar_server, radar_sq)
+
+    result = loader.run()
+
+    assert result, loader.exception
+    assert loader.path_to_file.suffix == ".vrt"
+    assert loader.time_band_index.times == TIMES
+    ds = gdal.Open(str(loader.path_to_file))
+    assert ds.RasterCount == 3
+    assert [ds.GetRasterBand(b).ReadAsArray()[0, 0] for b in range(1, 4)] == [0, 5, 10]
+    assert ds.GetRasterBand(1).GetDescription() == "2021-03-01T12:00:00"
+    ds = None
+    assert len([p for p in download_dir.iterdir() if p.suffix == ".tif"]) == 3
+    wfs_request = radar_server.requests[0][0]
+    assert "storedquery_id=fmi::radar::composite::dbz" in wfs_request
+    assert "starttime=2021-03-01T12:00:00Z" in wfs_request
+
+
+def test_downloaded_files_are_reused(tmpdir_pth, radar_server, radar_sq):
+    download_dir = Path(tmpdir_pth, "downloads")
+    assert _loader(download_dir, radar_server, radar_sq).run()
+    radar_server.requests.clear()
+
+    loader = _loader(download_dir, radar_server, radar_sq)
+    result = loader.run()
+
+    assert result, loader.exception
+    # Only the GetFeature request is made
+    assert len(radar_server.requests) == 1
+    assert radar_server.requests[0][0].startswith("/wfs")
@@ -0,0 +1,91 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+
+from PyQt5.QtCore import QDateTime
+from PyQt5.QtGui import QImage
+from qgis.core import QgsDateTimeRange, QgsMapSettings
+
+from ..core.frame_cache import FrameCache, FramePrerenderer, LayerRevisions, frame_key
+from ..core.grid.time_index import TimeBandIndex
+
+
+def _image() -> QImage:
+    # 100 * 100 * 4 bytes
+    return QImage(100, 100, QImage.Format_ARGB32)
+
+
+def test_frame_cache_evicts_least_recently_used():
+    cache = FrameCache(100000)
+    cache.put(("frame", 1), _image())
+    cache.put(("frame", 2), _image())
+    assert cache.get(("frame", 1)) is not None
+
+    cache.put(("frame", 3), _image())
+
+    assert len(cache) == 2
+    assert cache.num_of_bytes == 80000
+    assert ("frame", 1) in cache
+    assert ("frame", 2) not in cache
+    assert ("frame", 3) in cache
+
+
+def test_frame_cache_ignores_too_large_frames():
+    cache = FrameCache(1000)
+    cache.put(("frame", 1), _image())
+
+    assert len(cache) == 0
+    assert cache.get(("frame", 1)) is None
+
+
+def test_frame_key_changes_with_layer_revision(enfuser_layer_sm):
+    revisions = LayerRevisions()
+    settings = QgsMapSettings()
+    settings.setLayers([enfuser_layer_sm])
+    t_range = QgsDateTimeRange(
+        QDateTime(2020, 11, 5, 19, 0, 0), QDateTime(2020, 11, 5, 20, 0, 0)
+    )
+    key = frame_key(settings, t_range, revisions)
+    assert frame_key(settings, t_range, revisions) == key
+
+    enfuser_layer_sm.setRenderer(enfuser_layer_sm.renderer().clone())
+
+    assert revisions.revision(enfuser_layer_sm) == 1
+    assert frame_key(settings, t_range, revisions) != key
+
+
+def test_frame_layers(enfuser_layer_sm):
+    t_range = QgsDateTimeRange(
+        QDateTime(2020, 11, 5, 19, 0, 0), QDateTime(2020, 11, 5, 20, 0, 0)
+    )
+    index = TimeBandIndex([datetime(2020, 11, 5, 18), datetime(2020, 11, 5, 19)])
+
+    # Not manually temporal
+    assert FramePrerenderer._frame_layers([enfuser_layer_sm], t_range, {}) == [
+        enfuser_layer_sm
+    ]
+    # With and without time band index the band is set in a clone
+    for time_band_index in (None, index):
+        frame_layers = FramePrerenderer._frame_layers(
+            [enfuser_layer_sm], t_range, {enfuser_layer_sm.id(): time_band_index}
+        )
+        assert frame_layers[0] is not enfuser_layer_sm
+        assert frame_layers[0].source() == enfuser_layer_sm.source()
@@ -0,0 +1,105 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from ..core.grid.archive import GridArchive, read_point_series
+from ..core.grid.cache import GridCache, GridCacheEntry
+from ..core.processing.algorithms.utils import archived_grid
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+NO2 = "mass_concentration_of_nitrogen_dioxide_in_air_4902"
+
+
+@pytest.fixture
+def downloaded_grid(tmpdir_pth) -> GridCacheEntry:
+    test_file = Path(tmpdir_pth, "enfuser_no2_o3.nc")
+    shutil.copy2(Path(plugin_test_data_path("enfuser_no2_o3.nc")), test_file)
+    return GridCacheEntry(
+        test_file,
+        "enfuser_helsinki_metropolitan",
+        ["NO2"],
+        (24.0, 60.0, 25.0, 61.0),
+        datetime(2020, 11, 19, 17),
+        datetime(2020, 11, 19, 18),
+        "2020-11-19T17:00:00Z",
+        {"format": "netcdf"},
+        {"NO2": NO2},
+    )
+
+
+@pytest.fixture
+def archive(tmpdir_pth) -> GridArchive:
+    return GridArchive(Path(tmpdir_pth, "archive"))
+
+
+def test_archive_is_chunked_over_time(archive, downloaded_grid):
+    archived = archive.archive(downloaded_grid)
+
+    ds = gdal.OpenEx(str(archived.path), gdal.OF_MULTIDIM_RASTER)
+    array = ds.GetRootGroup().OpenMDArray(NO2)
+    block_size = array.GetBlockSize()
+    dims = array.GetDimensions()
+    ds = None
+    assert block_size[0] == dims[0].GetSize() == 2
+    assert block_size[-1] <= 32
+    assert archive.runs("enfuser_helsinki_metropolitan")[0].path == archived.path
+
+
+def test_read_point_series(archive, downloaded_grid):
+    archived = archive.archive(downloaded_grid)
+    ds = gdal.Open(f'NETCDF:"{downloaded_grid.path}":{NO2}')
+    x_min, x_res, _, y_max, _, y_res = ds.GetGeoTransform()
+    col, row = 3, 2
+    expected = [
+        ds.GetRasterBand(b).ReadAsArray(col, row, 1, 1)[0, 0]
+        for b in range(1, ds.RasterCount + 1)
+    ]
+    ds = None
+
+    times, values = read_point_series(
+        archived,
+        "NO2",
+        x_min + (col + 0.5) * x_res,
+        y_max + (row + 0.5) * y_res,
+    )
+
+    assert times == [datetime(2020, 11, 19, 17), datetime(2020, 11, 19, 18)]
+    np.testing.assert_allclose(values, expected)
+
+
+def test_archived_grid_of_downloaded_variable(tmpdir_pth, archive, downloaded_grid):
+    assert archived_grid(f'NETCDF:"{downloaded_grid.path}":{NO2}') is None
+
+    GridCache(Path(tmpdir_pth)).add(downloaded_grid)
+    archived = archive.archive(downloaded_grid)
+
+    entry, variable = archived_grid(f'NETCDF:"{downloaded_grid.path}":{NO2}')
+    assert entry.path == archived.path
+    assert variable == NO2
+    entry, variable = archived_grid(str(downloaded_grid.path))
+    assert variable == NO2
+    assert archived_grid(str(Path(tmpdir_pth, "other.nc"))) is None
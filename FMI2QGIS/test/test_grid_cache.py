@@ -0,0 +1,152 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from ..core.grid.cache import GridCache, GridCacheEntry, read_origin_time
+from ..core.grid.time_index import TimeBandIndex
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+NO2 = "mass_concentration_of_nitrogen_dioxide_in_air_4902"
+O3 = "mass_concentration_of_ozone_in_air_4903"
+
+
+def _entry(path=None, bbox=(24.0, 60.0, 25.0, 61.0), params=("NO2", "O3"), **kwargs):
+    values = {
+        "start_time": datetime(2020, 11, 19, 17),
+        "end_time": datetime(2020, 11, 19, 18),
+        "origin_time": "2020-11-19T12:00:00Z",
+        "parameters": {"format": "netcdf"},
+    }
+    values.update(kwargs)
+    return GridCacheEntry(
+        path,
+        "enfuser_helsinki_metropolitan",
+        params,
+        bbox,
+        values["start_time"],
+        values["end_time"],
+        values["origin_time"],
+        values["parameters"],
+    )
+
+
+@pytest.fixture
+def cached_grid(tmpdir_pth) -> GridCacheEntry:
+    test_file = Path(tmpdir_pth, "enfuser_no2_o3.nc")
+    shutil.copy2(Path(plugin_test_data_path("enfuser_no2_o3.nc")), test_file)
+    ds = gdal.Open(f'NETCDF:"{test_file}":{NO2}')
+    x_min, x_res, _, y_max, _, y_res = ds.GetGeoTransform()
+    bbox = (
+        x_min,
+        y_max + ds.RasterYSize * y_res,
+        x_min + ds.RasterXSize * x_res,
+        y_max,
+    )
+    ds = None
+    entry = _entry(test_file, bbox)
+    entry.variables = {"NO2": NO2, "O3": O3}
+    return entry
+
+
+def test_entry_covers_subset():
+    entry = _entry()
+
+    assert entry.covers(_entry(bbox=(24.2, 60.2, 24.8, 60.8), params=["O3"]))
+    assert entry.covers(_entry(end_time=datetime(2020, 11, 19, 17)))
+    assert not entry.covers(_entry(bbox=(23.9, 60.2, 24.8, 60.8)))
+    assert not entry.covers(_entry(end_time=datetime(2020, 11, 19, 19)))
+    assert not entry.covers(_entry(params=["NO2", "PM10"]))
+    assert not entry.covers(_entry(origin_time="2020-11-19T17:00:00Z"))
+    assert not entry.covers(_entry(parameters={"format": "grib2"}))
+
+
+def test_newer_run_is_not_served_from_cache():
+    entry = _entry(origin_time="2020-11-19T06:00:00Z")
+
+    assert not entry.covers(_entry(origin_time="2020-11-19T12:00:00Z"))
+
+
+def test_latest_run_is_not_served_from_cache():
+    # Latest run requested without an origin time
+    request = _entry(origin_time=None)
+
+    assert not _entry().covers(request)
+    assert not _entry(origin_time=None).covers(request)
+
+
+def test_read_origin_time(tmpdir_pth):
+    path = Path(tmpdir_pth, "run.nc")
+    ds = gdal.GetDriverByName("netCDF").CreateMultiDimensional(str(path))
+    array = ds.GetRootGroup().CreateMDArray(
+        "forecast_reference_time", [], gdal.ExtendedDataType.Create(gdal.GDT_Float64)
+    )
+    array.Write(np.array(6.0))
+    for key, value in (
+        ("standard_name", "forecast_reference_time"),
+        ("units", "hours since 2020-11-19 06:00:00"),
+    ):
+        attribute = array.CreateAttribute(key, [], gdal.ExtendedDataType.CreateString())
+        attribute.Write(value)
+    ds = None
+
+    assert read_origin_time(path) == "2020-11-19T12:00:00Z"
+    assert read_origin_time(Path(tmpdir_pth, "missing.nc")) is None
+
+
+def test_cache_index_is_persisted(tmpdir_pth, cached_grid):
+    GridCache(tmpdir_pth).add(cached_grid)
+    GridCache(tmpdir_pth).add(cached_grid)
+
+    entries = GridCache(tmpdir_pth).entries
+    assert len(entries) == 1
+    assert entries[0].to_dict() == cached_grid.to_dict()
+
+
+def test_find_ignores_removed_files(tmpdir_pth, cached_grid):
+    cache = GridCache(tmpdir_pth)
+    cache.add(cached_grid)
+    request = _entry(bbox=cached_grid.bbox, params=["NO2"])
+
+    assert cache.find(request).path == cached_grid.path
+    cached_grid.path.unlink()
+    assert cache.find(request) is None
+
+
+def test_subset(tmpdir_pth, cached_grid):
+    cache = GridCache(tmpdir_pth)
+    request = _entry(
+        bbox=cached_grid.bbox, params=["O3"], end_time=datetime(2020, 11, 19, 17)
+    )
+
+    output = cache.subset(cached_grid, request)
+
+    ds = gdal.Open(str(output))
+    assert not ds.GetSubDatasets()
+    assert ds.RasterCount == 1
+    index = TimeBandIndex.from_gdal_dataset(ds)
+    ds = None
+    assert index.times == [datetime(2020, 11, 19, 17)]
@@ -0,0 +1,168 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from qgis.core import QgsRectangle
+from qgis.PyQt.QtCore import QVariant
+
+from .. import cli
+from ..core.exceptions.loader_exceptions import InvalidParameterException
+from ..core.headless import (
+    HeadlessRunner,
+    Job,
+    LoaderType,
+    read_job_file,
+    set_parameter_value,
+)
+from ..core.wfs import Parameter, ParameterVariable
+from ..qgis_plugin_tools.tools import network
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+from .conftest import ENFUSER_ID
+
+
+@pytest.fixture
+def runner(wfs_url, wfs_version, fmi_download_url, enfuser_sq, monkeypatch):
+    runner = HeadlessRunner(wfs_url, wfs_version, fmi_download_url)
+    runner.expanded = []
+    monkeypatch.setattr(runner.factory, "list_queries", lambda: [enfuser_sq])
+    monkeypatch.setattr(runner.factory, "expand", runner.expanded.append)
+    monkeypatch.setattr(runner.factory, "expand_all", runner.expanded.extend)
+
+    def mock_download_to_file(uri, output_dir, *args, **kwargs) -> Path:
+        return Path(
+            shutil.copy2(
+                plugin_test_data_path("aq_small.nc"), Path(output_dir, "aq_small.nc")
+            )
+        )
+
+    # Mocking the download
+    monkeypatch.setattr(network, "download_to_file", mock_download_to_file)
+    return runner
+
+
+def _enfuser_job(output_dir: Path) -> Job:
+    return Job(
+        ENFUSER_ID,
+        {
+            "starttime": "2020-11-02T15:00:00Z",
+            "endtime": "2020-11-03T10:00:00Z",
+            "bbox": "24.97,60.2,24.99,60.21",
+            "param": "AQIndex",
+        },
+        output_dir,
+    )
+
+
+def test_set_parameter_value():
+    time = Parameter("starttime", "", "", QVariant.DateTime)
+    bbox = Parameter("bbox", "", "", QVariant.Rect)
+    param = Parameter("param", "", "", QVariant.StringList)
+
+    set_parameter_value(time, "2020-11-02T15:00:00")
+    set_parameter_value(bbox, [24.97, 60.2, 24.99, 60.21])
+    set_parameter_value(param, "AQIndex, NO2Concentration")
+
+    assert time.value == "2020-11-02T15:00:00Z"
+    assert bbox.value == "24.97,60.2,24.99,60.21"
+    assert param.value == "AQIndex,NO2Concentration"
+    with pytest.raises(InvalidParameterException):
+        set_parameter_value(bbox, "24.97,60.2")
+
+
+def test_set_parameter_value_checks_types():
+    timestep = Parameter("timestep", "", "", QVariant.Int)
+    flag = Parameter("timeseries", "", "", QVariant.Bool)
+    param = Parameter("param", "", "", QVariant.StringList)
+    param.variables = [ParameterVariable("aqindex", "AQIndex", "Air quality index")]
+
+    set_parameter_value(timestep, " 60")
+    set_parameter_value(flag, "True")
+    set_parameter_value(param, "aqindex")
+
+    assert timestep.value == "60"
+    assert flag.value == "true"
+    assert param.value == "aqindex"
+    for parameter, value in ((timestep, "hourly"), (flag, "yes"), (param, "NO2")):
+        with pytest.raises(InvalidParameterException):
+            set_parameter_value(parameter, value)
+
+
+def test_read_job_file(tmpdir_pth):
+    job_file = Path(tmpdir_pth, "jobs.json")
+    with open(job_file, "w") as f:
+        json.dump(
+            {
+                "jobs": [
+                    {"stored_query_id": ENFUSER_ID, "loader": "mesh"},
+                    {"stored_query_id": "other", "output_dir": "/tmp/other"},
+                ]
+            },
+            f,
+        )
+
+    jobs = read_job_file(job_file, tmpdir_pth)
+
+    assert [job.stored_query_id for job in jobs] == [ENFUSER_ID, "other"]
+    assert jobs[0].loader_type == LoaderType.MESH
+    assert jobs[0].output_dir == tmpdir_pth
+    assert jobs[1].output_dir == Path("/tmp/other")
+
+
+def test_run_jobs_in_parallel(tmpdir_pth, runner, enfuser_sq):
+    jobs = [_enfuser_job(Path(tmpdir_pth, f"job_{i}")) for i in range(3)]
+    jobs.append(Job("unknown", {}, tmpdir_pth))
+
+    results = runner.run_all(jobs, 2)
+
+    assert [result.success for result in results] == [True, True, True, False]
+    assert results[0].outputs == [Path(tmpdir_pth, "job_0", "aq_small.nc")]
+    assert "unknown" in results[3].error
+    assert runner.expanded == [enfuser_sq]
+
+
+def test_cli_arguments(tmpdir_pth):
+    args = cli.parse_args(
+        [
+            ENFUSER_ID,
+            "-p",
+            "param=AQIndex",
+            "-p",
+            "bbox=24.97,60.2,24.99,60.21",
+            "-o",
+            str(tmpdir_pth),
+            "--jobs",
+            "4",
+        ]
+    )
+
+    jobs = cli.jobs_from_args(args)
+
+    assert args.jobs == 4
+    assert len(jobs) == 1
+    assert jobs[0].parameters == {
+        "param": "AQIndex",
+        "bbox": "24.97,60.2,24.99,60.21",
+    }
+    assert jobs[0].output_dir == tmpdir_pth
@@ -0,0 +1,143 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from osgeo import ogr
+
+from ..core.processing.incremental_vector_loader import IncrementalVectorLoader
+from ..core.processing.vector_loader import VectorLoader
+from ..qgis_plugin_tools.tools import network
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+add_to_map = False
+
+
+def _to_spatialite(vector_loader: VectorLoader, gml_file: Path) -> Path:
+    vector_loader.path_to_file = gml_file
+    vector_loader.metadata.fields = [
+        "gml_id",
+        "Time",
+        "ParameterName",
+        "ParameterValue",
+    ]
+    vector_loader.metadata.time_field_idx = 1
+    vector_loader.metadata.layer_name = "BsWfsElement"
+    assert vector_loader._convert_to_spatialite()
+    return vector_loader.path_to_file
+
+
+def _feature_count(path: Path) -> int:
+    ds = ogr.Open(str(path))
+    try:
+        return ds.GetLayer(0).GetFeatureCount()
+    finally:
+        ds = None
+
+
+@pytest.fixture
+def existing_file(tmpdir_pth, wfs_url, wfs_version) -> Path:
+    test_file = Path(tmpdir_pth, "existing.gml")
+    shutil.copy2(Path(plugin_test_data_path("airquality_small.xml")), test_file)
+    loader = VectorLoader("", tmpdir_pth, wfs_url, wfs_version, None, add_to_map)
+    return _to_spatialite(loader, test_file)
+
+
+@pytest.fixture
+def incremental_loader(
+    tmpdir_pth, wfs_url, wfs_version, air_quality_sq, existing_file
+) -> IncrementalVectorLoader:
+    return IncrementalVectorLoader(
+        "", tmpdir_pth, wfs_url, wfs_version, air_quality_sq, existing_file
+    )
+
+
+def test_latest_time(incremental_loader):
+    assert incremental_loader._latest_time() == datetime(2020, 11, 6, 0, 0)
+
+
+def test_time_parameters_are_updated(incremental_loader, air_quality_sq):
+    incremental_loader._update_time_parameters(datetime(2020, 11, 6, 0, 0))
+
+    assert (
+        incremental_loader.sq.parameters["starttime"].value == "2020-11-06T00:00:00Z"
+    )
+    assert incremental_loader.sq is not air_quality_sq
+
+
+def test_merge_deduplicates(tmpdir_pth, incremental_loader, existing_file):
+    original_count = _feature_count(existing_file)
+    test_file = Path(tmpdir_pth, "new.gml")
+    shutil.copy2(Path(plugin_test_data_path("airquality_small.xml")), test_file)
+    incremental_loader.path_to_file = _to_spatialite(incremental_loader, test_file)
+
+    result = incremental_loader._merge_into_existing_file()
+
+    assert result, incremental_loader.exception
+    assert incremental_loader.num_of_added_features == 0
+    assert incremental_loader.num_of_updated_features == original_count
+    assert _feature_count(existing_file) == original_count
+
+
+def test_run_with_overlapping_observations(
+    tmpdir_pth, incremental_loader, existing_file, monkeypatch
+):
+    original_count = _feature_count(existing_file)
+    original_files = sorted(tmpdir_pth.iterdir())
+
+    def mock_download_to_file(
+        uri, output_dir: Path, output_name: str, *args, **kwargs
+    ) -> Path:
+        output = Path(output_dir, output_name)
+        shutil.copy2(Path(plugin_test_data_path("airquality_small.xml.gz")), output)
+        return output
+
+    # Mocking the download
+    monkeypatch.setattr(network, "download_to_file", mock_download_to_file)
+
+    result = incremental_loader.run()
+
+    assert result, incremental_loader.exception
+    assert incremental_loader.path_to_file == existing_file
+    assert incremental_loader.num_of_added_features == 0
+    assert _feature_count(existing_file) == original_count
+    # The intermediate files are removed after the merge
+    assert sorted(tmpdir_pth.iterdir()) == original_files
+
+
+def test_request_is_prepared_for_batch(tmpdir_pth, incremental_loader, existing_file):
+    original_files = sorted(tmpdir_pth.iterdir())
+    assert incremental_loader.batch_key is not None
+
+    incremental_loader._prepare_request()
+
+    assert incremental_loader.download_dir.parent == tmpdir_pth
+    assert (
+        incremental_loader.sq.parameters["starttime"].value == "2020-11-05T23:55:00Z"
+    )
+
+    incremental_loader._clean_up()
+
+    assert incremental_loader.download_dir == tmpdir_pth
+    assert incremental_loader.path_to_file == existing_file
+    assert sorted(tmpdir_pth.iterdir()) == original_files
@@ -0,0 +1,89 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from osgeo import gdal
+from qgis.core import QgsLayerTreeGroup, QgsProject
+
+from ..core.grid.levels import LevelBands, create_level_vrt
+from ..core.level_group import LazyLevelGroup
+
+
+@pytest.fixture
+def level_bands(hybrid_file) -> LevelBands:
+    uri = f'NETCDF:"{hybrid_file}":air_temperature'
+    ds = gdal.Open(uri)
+    bands = LevelBands.from_gdal_dataset(ds, uri)
+    ds = None
+    return bands
+
+
+def test_level_bands(level_bands):
+    assert level_bands.levels == [12, 13, 14]
+    assert all(len(bands) == 2 for bands in level_bands.bands.values())
+    index = level_bands.time_indices[13]
+    assert index.times == [datetime(2020, 11, 19, 12), datetime(2020, 11, 19, 13)]
+    assert index.bands == [1, 2]
+
+
+def test_create_level_vrt(tmpdir_pth, level_bands):
+    vrt = create_level_vrt(
+        level_bands.uri, level_bands.bands[13], Path(tmpdir_pth), "level"
+    )
+
+    ds = gdal.Open(str(vrt))
+    assert ds.RasterCount == 2
+    assert ds.GetRasterBand(2).ReadAsArray()[0, 0] == 11
+    ds = None
+
+
+def test_create_level_vrt_does_not_reuse_other_levels(tmpdir_pth, level_bands):
+    first = create_level_vrt(
+        level_bands.uri, level_bands.bands[12], Path(tmpdir_pth), "level"
+    )
+    second = create_level_vrt(
+        level_bands.uri, level_bands.bands[13], Path(tmpdir_pth), "level"
+    )
+
+    assert first != second
+    ds = gdal.Open(str(second))
+    assert ds.GetRasterBand(2).ReadAsArray()[0, 0] == 11
+    ds = None
+
+
+def test_level_layers_are_created_lazily(tmpdir_pth, level_bands, new_project):
+    root = QgsProject.instance().layerTreeRoot()
+    group = LazyLevelGroup("Temperature", level_bands, tmpdir_pth, root)
+
+    level_groups = group.group.children()
+    assert len(level_groups) == 3
+    assert not QgsProject.instance().mapLayers()
+
+    level_group: QgsLayerTreeGroup = level_groups[1]
+    level_group.setItemVisibilityChecked(True)
+
+    assert len(level_group.findLayers()) == 1
+    layer = level_group.findLayers()[0].layer()
+    assert layer.bandCount() == 2
+    assert list(group.time_band_indices) == [layer.id()]
+    assert len(QgsProject.instance().mapLayers()) == 1
@@ -22,11 +22,15 @@ from datetime import datetime
 from pathlib import Path
 
 import pytest
+from osgeo import gdal
+from PyQt5.QtCore import Qt
 from qgis.core import (
     QgsMeshDataProvider,
     QgsMeshDataProviderTemporalCapabilities,
     QgsMeshLayerTemporalProperties,
+    QgsProject,
     QgsUnitTypes,
+    QgsVectorLayer,
 )
 
 from ..core.processing.mesh_loader import MeshLoader
@@ -171,13 +175,15 @@ def test_files_to_mesh_layers2(
     conversion_succeeded = mesh_loader._convert_to_mesh_compatible_files()
     assert conversion_succeeded
     assert {path.name for path in mesh_loader.paths_to_files.values()} == {
-        f"{f_name}_index_of_airquality_194.nc",
-        f"{f_name}_mass_concentration_of_nitrogen_dioxide_in_air_4902.nc",
-        f"{f_name}_mass_concentration_of_ozone_in_air_4903.nc",
-        f"{f_name}_mass_concentration_of_pm10_ambient_aerosol_in_air_4904.nc",
-        f"{f_name}_mass_concentration_of_pm2p5_ambient_aerosol_in_air_4905.nc",
+        f"{f_name}_index_of_airquality_194.vrt",
+        f"{f_name}_mass_concentration_of_nitrogen_dioxide_in_air_4902.vrt",
+        f"{f_name}_mass_concentration_of_ozone_in_air_4903.vrt",
+        f"{f_name}_mass_concentration_of_pm10_ambient_aerosol_in_air_4904.vrt",
+        f"{f_name}_mass_concentration_of_pm2p5_ambient_aerosol_in_air_4905.vrt",
     }
     assert all(path.exists() for path in mesh_loader.paths_to_files.values())
+    # Metadata is fixed on virtual copies, source is left untouched
+    assert not Path(f"{test_file}.aux.xml").exists()
 
     layers = mesh_loader._files_to_mesh_layers()
 
@@ -211,6 +217,68 @@ def test_files_to_mesh_layers2(
         assert temp_capabilities.temporalUnit() == QgsUnitTypes.TemporalHours
 
 
+def test_single_variable_with_time_h_is_fixed(mesh_loader, enfuser_sq, tmpdir_pth):
+    test_file = Path(tmpdir_pth, "aq_small.nc")
+    shutil.copy2(Path(plugin_test_data_path("aq_small.nc")), test_file)
+    mesh_loader.sq = enfuser_sq
+    mesh_loader.path_to_file = test_file
+    metadata = {"NETCDF_DIM_EXTRA": "{time_h}", "time_h#units": "hours"}
+    mesh_loader._sub_dataset_metadata = lambda sub_ds: (metadata, [{}])
+
+    conversion_succeeded = mesh_loader._convert_to_mesh_compatible_files()
+
+    assert conversion_succeeded
+    assert mesh_loader.paths_to_files == {
+        enfuser_sq.title: Path(tmpdir_pth, "aq_small.vrt")
+    }
+    ds = gdal.Open(str(mesh_loader.paths_to_files[enfuser_sq.title]))
+    assert ds.GetMetadata() == {"NETCDF_DIM_EXTRA": "{time}", "time#units": "hours"}
+    ds = None
+
+
+def test_converted_files_are_emitted(mesh_loader, enfuser_sq, tmpdir_pth):
+    test_file = Path(tmpdir_pth, "enfuser_all_variables.nc")
+    shutil.copy2(Path(plugin_test_data_path("enfuser_all_variables.nc")), test_file)
+    mesh_loader.sq = enfuser_sq
+    mesh_loader.path_to_file = test_file
+    emitted = {}
+    mesh_loader.file_converted.connect(
+        lambda name, path: emitted.update({name: Path(path)}), Qt.DirectConnection
+    )
+
+    conversion_succeeded = mesh_loader._convert_to_mesh_compatible_files()
+
+    assert conversion_succeeded
+    assert len(emitted) == 5
+    assert emitted == mesh_loader.paths_to_files
+
+
+def test_canceled_conversion_fails(mesh_loader, enfuser_sq, tmpdir_pth, monkeypatch):
+    test_file = Path(tmpdir_pth, "enfuser_all_variables.nc")
+    shutil.copy2(Path(plugin_test_data_path("enfuser_all_variables.nc")), test_file)
+    mesh_loader.sq = enfuser_sq
+    mesh_loader.path_to_file = test_file
+    monkeypatch.setattr(mesh_loader, "isCanceled", lambda: True)
+
+    conversion_succeeded = mesh_loader._convert_to_mesh_compatible_files()
+
+    assert not conversion_succeeded
+    assert mesh_loader.paths_to_files == {}
+
+
+def test_failed_conversion_removes_added_layers(mesh_loader):
+    layer = QgsVectorLayer("Point?crs=EPSG:4326", "converted", "memory")
+    QgsProject.instance().addMapLayer(layer)
+    mesh_loader.layer_ids.add(layer.id())
+    mesh_loader.added_layer_names.add("converted")
+
+    mesh_loader._remove_added_layers()
+
+    assert QgsProject.instance().mapLayer(layer.id()) is None
+    assert mesh_loader.layer_ids == set()
+    assert mesh_loader.added_layer_names == set()
+
+
 def test_files_to_mesh_layers3(mesh_loader, enfuser_sq, tmpdir_pth):
     f_name = "hilatar"
     test_file = Path(tmpdir_pth, f"{f_name}.nc")
@@ -220,12 +288,12 @@ def test_files_to_mesh_layers3(mesh_loader, enfuser_sq, tmpdir_pth):
     conversion_succeeded = mesh_loader._convert_to_mesh_compatible_files()
     assert conversion_succeeded
     assert {path.name for path in mesh_loader.paths_to_files.values()} == {
-        f"{f_name}_nhx_accumulated_6h_dry_deposition_1182.nc",
-        f"{f_name}_nhx_accumulated_6h_wet_deposition_1183.nc",
-        f"{f_name}_nox_accumulated_6h_dry_deposition_1180.nc",
-        f"{f_name}_nox_accumulated_6h_wet_deposition_1181.nc",
-        f"{f_name}_sulfur_accumulated_6h_dry_deposition_1184.nc",
-        f"{f_name}_sulfur_accumulated_6h_wet_deposition_1185.nc",
+        f"{f_name}_nhx_accumulated_6h_dry_deposition_1182.vrt",
+        f"{f_name}_nhx_accumulated_6h_wet_deposition_1183.vrt",
+        f"{f_name}_nox_accumulated_6h_dry_deposition_1180.vrt",
+        f"{f_name}_nox_accumulated_6h_wet_deposition_1181.vrt",
+        f"{f_name}_sulfur_accumulated_6h_dry_deposition_1184.vrt",
+        f"{f_name}_sulfur_accumulated_6h_wet_deposition_1185.vrt",
     }
     assert all(path.exists() for path in mesh_loader.paths_to_files.values())
 
@@ -0,0 +1,90 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from ..core.processing.overview_builder import OverviewBuilder, overview_levels
+
+
+@pytest.fixture
+def large_raster(tmpdir_pth) -> Path:
+    path = Path(tmpdir_pth, "large.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(str(path), 512, 256, 2, gdal.GDT_Float32)
+    for b in range(1, 3):
+        ds.GetRasterBand(b).WriteArray(np.ones((256, 512), dtype=np.float32) * b)
+    ds = None
+    return path
+
+
+def test_overview_levels():
+    assert overview_levels("2,4, 8,16") == [2, 4, 8, 16]
+    assert overview_levels("") == []
+
+
+def test_build_overviews(large_raster):
+    builder = OverviewBuilder("", {"layer": str(large_raster)}, [2, 4, 8])
+
+    assert builder.run()
+
+    assert builder.built_layer_ids == ["layer"]
+    assert Path(f"{large_raster}.ovr").exists()
+    ds = gdal.Open(str(large_raster))
+    # The smallest level would be under the minimum overview size
+    assert ds.GetRasterBand(1).GetOverviewCount() == 2
+    ds = None
+
+
+def test_existing_overviews_are_not_rebuilt(large_raster):
+    OverviewBuilder("", {"layer": str(large_raster)}, [2]).run()
+    builder = OverviewBuilder("", {"layer": str(large_raster)}, [2])
+
+    assert builder.run()
+
+    assert builder.built_layer_ids == []
+
+
+def test_build_overviews_for_netcdf_subdataset(large_raster, tmpdir_pth):
+    netcdf_file = Path(tmpdir_pth, "large.nc")
+    gdal.Translate(str(netcdf_file), str(large_raster), format="netCDF")
+    uri = f'NETCDF:"{netcdf_file}":Band1'
+    builder = OverviewBuilder("", {"layer": uri}, [2, 4, 8])
+
+    assert builder.run()
+
+    assert builder.built_layer_ids == ["layer"]
+    vrt_file = Path(tmpdir_pth, "large_Band1.vrt")
+    assert builder.overview_uris == {"layer": str(vrt_file)}
+    assert Path(f"{vrt_file}.ovr").exists()
+    ds = gdal.Open(str(vrt_file))
+    assert ds.GetRasterBand(1).GetOverviewCount() == 2
+    ds = None
+
+
+def test_unreadable_raster(tmpdir_pth):
+    builder = OverviewBuilder("", {"layer": str(Path(tmpdir_pth, "missing.tif"))}, [2])
+
+    assert builder.run()
+
+    assert builder.built_layer_ids == []
+    assert isinstance(builder.exception, RuntimeError)
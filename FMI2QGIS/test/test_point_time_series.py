@@ -0,0 +1,128 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+from qgis.core import (
+    QgsFeature,
+    QgsGeometry,
+    QgsMapLayer,
+    QgsPointXY,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsVectorLayer,
+)
+
+from ..core.grid.sampling import pixel_indices, sample_points
+from ..core.processing.algorithms.point_time_series import PointTimeSeriesAlgorithm
+from ..core.processing.algorithms.utils import grid_uri
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+
+@pytest.fixture
+def mem_ds():
+    ds = gdal.GetDriverByName("MEM").Create("", 4, 3, 2, gdal.GDT_Float32)
+    ds.SetGeoTransform((20.0, 1.0, 0.0, 63.0, 0.0, -1.0))
+    for b in range(1, 3):
+        ds.GetRasterBand(b).WriteArray(
+            np.arange(12, dtype=np.float32).reshape(3, 4) + 100 * b
+        )
+    return ds
+
+
+def _point_layer(points) -> QgsVectorLayer:
+    layer = QgsVectorLayer("Point?crs=EPSG:4326&field=name:string", "points", "memory")
+    features = []
+    for name, (x, y) in points.items():
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        feature.setAttributes([name])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def test_pixel_indices(mem_ds):
+    cols, rows = pixel_indices(
+        mem_ds.GetGeoTransform(), np.array([20.5, 23.9]), np.array([62.5, 60.1])
+    )
+    assert cols.tolist() == [0, 3]
+    assert rows.tolist() == [0, 2]
+
+
+def test_sample_points(mem_ds):
+    values = sample_points(
+        mem_ds, np.array([1, 3, 10]), np.array([0, 2, 0]), max_bytes=1
+    )
+
+    np.testing.assert_array_equal(values[:2], [[101, 201], [111, 211]])
+    assert np.isnan(values[2]).all()
+
+
+def test_point_time_series_algorithm(enfuser_layer_sm, feedback):
+    center = enfuser_layer_sm.extent().center()
+    points = _point_layer({"center": (center.x(), center.y()), "far": (0, 0)})
+    alg = PointTimeSeriesAlgorithm()
+    alg.initAlgorithm()
+    context = QgsProcessingContext()
+
+    results, ok = alg.run(
+        {"INPUT": points, "GRID": enfuser_layer_sm, "OUTPUT": "memory:"},
+        context,
+        feedback,
+    )
+
+    assert ok
+    output = context.takeResultLayer(results["OUTPUT"])
+    features = list(output.getFeatures())
+    assert len(features) == 2 * enfuser_layer_sm.bandCount()
+    center_features = [f for f in features if f["name"] == "center"]
+    assert center_features[0]["time"].toPyDateTime() == datetime(2020, 11, 2, 15)
+    assert all(f["value"] is not None for f in center_features)
+    assert all(not f["value"] for f in features if f["name"] == "far")
+
+
+class _MeshLayer:
+    def __init__(self, source):
+        self._source = source
+
+    def source(self):
+        return self._source
+
+    def type(self):
+        return QgsMapLayer.MeshLayer
+
+
+def test_grid_uri_of_mesh_layer():
+    path = Path(plugin_test_data_path("enfuser_all_variables.nc"))
+    ds = gdal.Open(str(path))
+    sub_datasets = [name for name, _ in ds.GetSubDatasets()]
+    ds = None
+    variable = sub_datasets[1].rsplit(":", 1)[-1]
+
+    assert grid_uri(_MeshLayer(f'netcdf:"{path}":{variable}')) == sub_datasets[1]
+    with pytest.raises(QgsProcessingException):
+        grid_uri(_MeshLayer(f'netcdf:"{path}"'))
+    with pytest.raises(QgsProcessingException):
+        grid_uri(_MeshLayer(f'netcdf:"{path}":missing'))
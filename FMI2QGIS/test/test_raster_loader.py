@@ -18,6 +18,8 @@
 #  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
 # type: ignore
 
+import copy
+import shutil
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -25,8 +27,9 @@ import pytest
 from PyQt5.QtCore import QDateTime, Qt
 from qgis.core import QgsDateTimeRange, QgsProject, QgsRasterLayer
 
+from ..core.processing.base_loader import BaseLoader
 from ..core.processing.raster_loader import RasterLoader
-from ..core.wfs import Parameter
+from ..core.wfs import FileReference, Parameter
 from ..qgis_plugin_tools.testing.utilities import qgis_supports_temporal
 from ..qgis_plugin_tools.tools import network
 from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
@@ -62,7 +65,8 @@ def test_download_enfuser(
     test_file_name = "test_aq_small.nc"
 
     def mock_download_to_file(*args, **kwargs) -> Path:
-        return test_file
+        # Statistics are persisted next to the file, keep the test data intact
+        return Path(shutil.copy2(test_file, Path(tmpdir_pth, test_file_name)))
 
     # Mocking the download
     monkeypatch.setattr(network, "download_to_file", mock_download_to_file)
@@ -70,7 +74,7 @@ def test_download_enfuser(
     result = loader.run()
 
     assert result, loader.exception
-    assert loader.path_to_file == test_file
+    assert loader.path_to_file == Path(tmpdir_pth, test_file_name)
     assert loader.path_to_file.exists()
     assert loader.path_to_file.stat().st_size == test_file.stat().st_size
 
@@ -99,6 +103,116 @@ def test_construct_uri_enfuser(tmpdir_pth, fmi_download_url, enfuser_sq, extent_
     )
 
 
+@pytest.fixture
+def sq_with_file_reference(enfuser_sq, extent_sm_1):
+    sq = copy.deepcopy(enfuser_sq)
+    for param in sq.parameters.values():
+        param._value = None
+    sq.parameters["starttime"].value = datetime(2020, 11, 5, 19)
+    sq.parameters["endtime"].value = datetime(2020, 11, 6, 11)
+    sq.parameters["bbox"].value = extent_sm_1
+    sq.parameters["param"].value = ["NO2Concentration", "AQIndex"]
+    sq.parameters["levels"].value = "0"
+    sq.parameters["projection"].value = "EPSG:4326"
+    sq.file_references = [
+        FileReference(
+            "https://opendata.fmi.fi/download?producer=enfuser_helsinki_metropolitan"
+            "&param=AQIndex,NO2Concentration&bbox=24.97,60.2,24.99,60.21&levels=0"
+            "&origintime=2020-11-05T19:00:00Z&starttime=2020-11-05T19:00:00Z"
+            "&endtime=2020-11-06T11:00:00Z&format=netcdf&projection=EPSG:4326",
+            datetime(2020, 11, 5, 19),
+        )
+    ]
+    sq.expanded_at = datetime.utcnow()
+    return sq
+
+
+def test_construct_uri_uses_file_reference(
+    tmpdir_pth, fmi_download_url, sq_with_file_reference
+):
+    loader = RasterLoader(
+        "", tmpdir_pth, fmi_download_url, sq_with_file_reference, add_to_map
+    )
+
+    uri = loader._construct_uri()
+
+    assert uri == sq_with_file_reference.file_references[0].url
+
+
+def test_construct_uri_ignores_expired_file_reference(
+    tmpdir_pth, fmi_download_url, sq_with_file_reference
+):
+    sq_with_file_reference.expanded_at = datetime.utcnow() - timedelta(hours=1)
+    loader = RasterLoader(
+        "", tmpdir_pth, fmi_download_url, sq_with_file_reference, add_to_map
+    )
+
+    uri = loader._construct_uri()
+
+    assert uri != sq_with_file_reference.file_references[0].url
+    assert uri.startswith(
+        "https://opendata.fmi.fi/download?producer=enfuser_helsinki_metropolitan"
+    )
+
+
+def test_construct_uri_ignores_other_file_reference(
+    tmpdir_pth, fmi_download_url, sq_with_file_reference
+):
+    sq_with_file_reference.parameters["endtime"].value = datetime(2020, 11, 6, 12)
+    loader = RasterLoader(
+        "", tmpdir_pth, fmi_download_url, sq_with_file_reference, add_to_map
+    )
+
+    uri = loader._construct_uri()
+
+    assert "&endtime=2020-11-06T12:00:00Z" in uri
+
+
+def test_construct_uri_ignores_file_reference_with_other_parameters(
+    tmpdir_pth, fmi_download_url, sq_with_file_reference
+):
+    # The reference has levels=0 that the constructed query does not have
+    sq_with_file_reference.parameters["levels"]._value = None
+    loader = RasterLoader(
+        "", tmpdir_pth, fmi_download_url, sq_with_file_reference, add_to_map
+    )
+
+    uri = loader._construct_uri()
+
+    assert uri != sq_with_file_reference.file_references[0].url
+    assert "levels=" not in uri
+
+
+def test_latest_origin_time_from_file_references(sq_with_file_reference):
+    max_age = timedelta(minutes=10)
+
+    assert sq_with_file_reference.latest_origin_time(max_age) == "2020-11-05T19:00:00Z"
+    sq_with_file_reference.expanded_at = datetime.utcnow() - timedelta(hours=1)
+    assert sq_with_file_reference.latest_origin_time(max_age) is None
+
+
+def test_latest_run_is_looked_up_with_resolved_run(
+    tmpdir_pth, fmi_download_url, sq_with_file_reference, monkeypatch
+):
+    # Without levels the request has no origin time
+    sq_with_file_reference.parameters["levels"]._value = None
+    loader = RasterLoader(
+        "", tmpdir_pth, fmi_download_url, sq_with_file_reference, add_to_map
+    )
+    requests = []
+
+    def find(request):
+        requests.append(request)
+        return None
+
+    monkeypatch.setattr(loader.grid_cache, "find", find)
+    monkeypatch.setattr(BaseLoader, "_download", lambda self: (Path(), False))
+
+    loader._download()
+
+    assert [request.origin_time for request in requests] == ["2020-11-05T19:00:00Z"]
+
+
 def test_raster_layer_metadata(raster_loader):
     # TODO: add more tests with different rasters
     test_file = Path(plugin_test_data_path("aq_small.nc"))
@@ -112,6 +226,8 @@ def test_raster_layer_metadata(raster_loader):
     assert metadata.is_temporal
     assert metadata.time_range.begin().toPyDateTime() == datetime(2020, 11, 2, 15, 0)
     assert metadata.time_range.end().toPyDateTime() == datetime(2020, 11, 3, 10, 0, 1)
+    assert len(raster_loader.time_band_index) == 20
+    assert raster_loader.time_band_index.band_for(datetime(2020, 11, 2, 17, 30)) == 3
 
 
 def test_raster_layer_metadata2(raster_loader, enfuser_sq):
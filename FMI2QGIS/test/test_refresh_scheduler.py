@@ -0,0 +1,99 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime, timedelta
+
+from ..core.processing.batch_vector_loader import BatchVectorLoader
+from ..core.processing.incremental_vector_loader import IncrementalVectorLoader
+from ..core.processing.vector_loader import VectorLoader
+from ..core.refresh_scheduler import (
+    RefreshEntry,
+    RefreshScheduler,
+    VectorRefreshEntry,
+    WMSRefreshEntry,
+)
+
+
+def test_refresh_entry_is_aligned_to_cadence():
+    entry = RefreshEntry("layer_id", timedelta(hours=1), timedelta(minutes=5))
+
+    assert entry.next_refresh_after(datetime(2020, 11, 5, 10, 3)) == datetime(
+        2020, 11, 5, 10, 5
+    )
+    assert entry.next_refresh_after(datetime(2020, 11, 5, 10, 5)) == datetime(
+        2020, 11, 5, 11, 5
+    )
+    assert entry.next_refresh_after(datetime(2020, 11, 5, 23, 30)) == datetime(
+        2020, 11, 6, 0, 5
+    )
+
+
+def test_refresh_entry_is_due():
+    entry = RefreshEntry("layer_id", timedelta(minutes=5), timedelta(minutes=1))
+    entry.schedule_next(datetime(2020, 11, 5, 10, 2))
+
+    assert entry.next_refresh == datetime(2020, 11, 5, 10, 6)
+    assert not entry.is_due(datetime(2020, 11, 5, 10, 5))
+    assert entry.is_due(datetime(2020, 11, 5, 10, 6))
+
+
+def test_refresh_entry_without_cadence_uses_minimum_interval():
+    entry = RefreshEntry("layer_id", timedelta(0), timedelta(minutes=1))
+
+    assert entry.interval == RefreshEntry.MIN_INTERVAL
+    assert entry.next_refresh_after(datetime(2020, 11, 5, 10, 2)) == datetime(
+        2020, 11, 5, 10, 3
+    )
+
+
+def test_wms_refresh_entry_moves_time_window(test_wms_1):
+    entry = WMSRefreshEntry(test_wms_1, "layer_id", None, None, None)
+    start_time, end_time = entry.start_time, entry.end_time
+
+    assert entry.interval == timedelta(minutes=5)
+    assert not entry.update_time_window(test_wms_1)
+
+    test_wms_1.end_time = end_time + timedelta(minutes=10)
+    assert entry.update_time_window(test_wms_1)
+    assert entry.start_time == start_time + timedelta(minutes=10)
+    assert entry.end_time == end_time + timedelta(minutes=10)
+
+
+def test_due_vector_layers_are_refreshed_in_batch(
+    tmpdir_pth, wfs_url, wfs_version, air_quality_sq, monkeypatch
+):
+    scheduler = RefreshScheduler(None)
+    added_tasks = []
+    monkeypatch.setattr(
+        scheduler,
+        "_add_task",
+        lambda layer_ids, task: added_tasks.append((layer_ids, task)),
+    )
+    loader = VectorLoader("", tmpdir_pth, wfs_url, wfs_version, air_quality_sq, False)
+    entries = [VectorRefreshEntry(loader, layer_id) for layer_id in ("l1", "l2")]
+
+    scheduler._refresh_vector_layers(entries)
+
+    assert len(added_tasks) == 1
+    layer_ids, task = added_tasks[0]
+    assert layer_ids == ["l1", "l2"]
+    assert isinstance(task, BatchVectorLoader)
+    assert all(isinstance(loader, IncrementalVectorLoader) for loader in task.loaders)
+    assert task._batches() == [[0, 1]]
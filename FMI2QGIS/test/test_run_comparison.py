@@ -0,0 +1,171 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import copy
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+from qgis.core import QgsProcessingContext, QgsProcessingException
+
+from ..core.grid.run_comparison import ComparisonMode, common_times, compare_runs
+from ..core.grid.time_index import TimeBandIndex
+from ..core.headless import HeadlessRunner
+from ..core.processing.algorithms.run_comparison import RunComparisonAlgorithm
+from ..core.processing.run_comparison_loader import RunComparisonLoader
+from ..core.wfs import Parameter
+from .conftest import ENFUSER_ID
+
+T0 = datetime(2020, 11, 19, 12)
+
+
+def _run(path: Path, values) -> str:
+    ds = gdal.GetDriverByName("GTiff").Create(
+        str(path), 3, 2, len(values), gdal.GDT_Float32
+    )
+    ds.SetGeoTransform((24.0, 0.1, 0.0, 60.3, 0.0, -0.1))
+    for b, value in enumerate(values, start=1):
+        ds.GetRasterBand(b).WriteArray(np.full((2, 3), value, dtype=np.float32))
+    ds = None
+    return str(path)
+
+
+@pytest.fixture
+def runs(tmpdir_pth):
+    # The later run starts an hour later
+    uris = [
+        _run(Path(tmpdir_pth, "run1.tif"), [1, 2, 3]),
+        _run(Path(tmpdir_pth, "run2.tif"), [5, 7, 9]),
+    ]
+    indices = [
+        TimeBandIndex([T0 + timedelta(hours=h) for h in range(3)]),
+        TimeBandIndex([T0 + timedelta(hours=h) for h in range(1, 4)]),
+    ]
+    return uris, indices
+
+
+def test_common_times(runs):
+    _, indices = runs
+    assert common_times(indices) == [T0 + timedelta(hours=1), T0 + timedelta(hours=2)]
+
+
+@pytest.mark.parametrize(
+    "mode,expected",
+    [(ComparisonMode.DIFFERENCE, [3, 4]), (ComparisonMode.SPREAD, [1.5, 2])],
+)
+def test_compare_runs(tmpdir_pth, runs, mode, expected):
+    uris, indices = runs
+    output = Path(tmpdir_pth, "out.tif")
+
+    index = compare_runs(uris, indices, output, mode, max_bytes=1)
+
+    assert index.times == common_times(indices)
+    ds = gdal.Open(str(output))
+    assert ds.RasterCount == 2
+    assert ds.GetRasterBand(1).GetDescription() == "2020-11-19T13:00:00"
+    values = [ds.GetRasterBand(b).ReadAsArray() for b in (1, 2)]
+    ds = None
+    for value, expected_value in zip(values, expected):
+        np.testing.assert_allclose(value, expected_value)
+
+
+def test_origin_time_is_set_to_uri(tmpdir_pth, fmi_download_url, enfuser_sq):
+    enfuser_sq.parameters["starttime"].value = datetime.strptime(
+        "2020-11-05T19:00:00Z", Parameter.TIME_FORMAT
+    )
+    loader = RunComparisonLoader(
+        "",
+        tmpdir_pth,
+        fmi_download_url,
+        enfuser_sq,
+        [datetime(2020, 11, 5, 18), datetime(2020, 11, 5, 12)],
+    )
+
+    loader._set_origin_time(loader.origin_times[0])
+    uri = loader._construct_uri()
+
+    assert loader.sq is not enfuser_sq
+    assert uri.count("&origintime=") == 1
+    assert "&origintime=2020-11-05T12:00:00Z" in uri
+
+
+def test_runs_of_different_requests_have_own_files(
+    tmpdir_pth, fmi_download_url, enfuser_sq, monkeypatch
+):
+    origin_times = [datetime(2020, 11, 5, 12), datetime(2020, 11, 5, 18)]
+    names = []
+    for bbox in ("24.97,60.2,24.99,60.21", "24.5,60.0,25.5,60.5"):
+        enfuser_sq.parameters["bbox"].value = bbox
+        loader = RunComparisonLoader(
+            "", tmpdir_pth, fmi_download_url, enfuser_sq, origin_times
+        )
+        monkeypatch.setattr(loader, "_download", lambda: (Path(), False))
+        loader._download_run(origin_times[0])
+        names.append(loader.file_name)
+
+    assert names[0] != names[1]
+    assert all(name.startswith(f"{enfuser_sq.producer}_20201105T1200_") for name in names)
+
+
+def test_compare_runs_algorithm(tmpdir_pth, runs, enfuser_sq, feedback, monkeypatch):
+    uris, indices = runs
+    downloaded = iter(({"AQIndex": uri}, index) for uri, index in zip(uris, indices))
+    monkeypatch.setattr(
+        HeadlessRunner, "stored_query", lambda self, _: copy.deepcopy(enfuser_sq)
+    )
+    monkeypatch.setattr(
+        RunComparisonLoader, "_download_run", lambda self, _: next(downloaded)
+    )
+    alg = RunComparisonAlgorithm()
+    alg.initAlgorithm()
+    parameters = {
+        alg.STORED_QUERY: enfuser_sq.id,
+        alg.ORIGIN_TIMES: "2020-11-19T13:00:00Z, 2020-11-19T12:00:00Z",
+        alg.MODE: 0,
+        alg.OUTPUT_DIR: str(tmpdir_pth),
+    }
+
+    loader = alg.create_loader(parameters, QgsProcessingContext())
+    results = alg.processAlgorithm(parameters, QgsProcessingContext(), feedback)
+
+    assert loader.origin_times == [T0, T0 + timedelta(hours=1)]
+    assert loader.mode == ComparisonMode.DIFFERENCE
+    assert len(results[alg.OUTPUTS]) == 1
+    ds = gdal.Open(results[alg.OUTPUT])
+    assert ds.RasterCount == 2
+    np.testing.assert_allclose(ds.GetRasterBand(1).ReadAsArray(), 3)
+    ds = None
+
+
+def test_compare_runs_algorithm_needs_valid_origin_times(tmpdir_pth):
+    alg = RunComparisonAlgorithm()
+    alg.initAlgorithm()
+
+    with pytest.raises(QgsProcessingException):
+        alg.create_loader(
+            {
+                alg.STORED_QUERY: ENFUSER_ID,
+                alg.ORIGIN_TIMES: "yesterday",
+                alg.OUTPUT_DIR: str(tmpdir_pth),
+            },
+            QgsProcessingContext(),
+        )
@@ -0,0 +1,98 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from ..core.grid.statistics import (
+    BandStatistics,
+    compute_statistics,
+    statistics_for_file,
+)
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+
+@pytest.fixture
+def multi_band_file(tmpdir_pth) -> Path:
+    path = Path(tmpdir_pth, "bands.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(str(path), 10, 10, 3, gdal.GDT_Float32)
+    for b in range(1, 4):
+        band = ds.GetRasterBand(b)
+        band.SetNoDataValue(-999)
+        data = np.full((10, 10), b * 10, dtype=np.float32)
+        data[0, 0] = -999
+        band.WriteArray(data)
+    ds = None
+    return path
+
+
+def test_compute_statistics_covers_all_bands(multi_band_file):
+    ds = gdal.Open(str(multi_band_file))
+    stats = compute_statistics(ds, (0, 100))
+    ds = None
+
+    assert stats.minimum == 10
+    assert stats.maximum == 30
+    assert stats.mean == pytest.approx(20)
+    assert stats.percentiles == {0: 10, 100: 30}
+    assert stats.stretch_range == (10, 30)
+
+
+def test_compute_statistics_of_packed_values():
+    ds = gdal.GetDriverByName("MEM").Create("", 10, 10, 1, gdal.GDT_Int16)
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(-1)
+    band.SetScale(0.5)
+    band.SetOffset(100)
+    data = np.arange(100, dtype=np.int16).reshape(10, 10)
+    data[0, 0] = -1
+    band.WriteArray(data)
+
+    stats = compute_statistics(ds, ())
+
+    assert stats.minimum == 100.5
+    assert stats.maximum == 149.5
+    assert stats.mean == pytest.approx(125)
+
+
+def test_statistics_are_persisted(multi_band_file):
+    stats = statistics_for_file(str(multi_band_file))
+
+    assert Path(f"{multi_band_file}.aux.xml").exists()
+    ds = gdal.Open(str(multi_band_file))
+    persisted = BandStatistics.read_from_dataset(ds)
+    assert ds.GetRasterBand(3).GetMetadataItem("STATISTICS_MINIMUM") == "10"
+    ds = None
+    assert persisted.minimum == stats.minimum
+    assert persisted.percentiles == pytest.approx(stats.percentiles)
+
+
+def test_statistics_of_netcdf(tmpdir_pth):
+    test_file = Path(tmpdir_pth, "aq_small.nc")
+    shutil.copy2(Path(plugin_test_data_path("aq_small.nc")), test_file)
+
+    stats = statistics_for_file(str(test_file))
+
+    assert stats.minimum <= stats.percentiles[2] <= stats.percentiles[98]
+    assert stats.percentiles[98] <= stats.maximum
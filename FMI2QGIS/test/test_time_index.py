@@ -0,0 +1,99 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from osgeo import gdal
+
+from ..core.grid.time_index import (
+    TimeBandIndex,
+    times_from_values,
+    values_from_times,
+)
+from ..qgis_plugin_tools.tools.resources import plugin_test_data_path
+
+
+def test_band_for_irregular_times():
+    times = [
+        datetime(2020, 11, 2, 18),
+        datetime(2020, 11, 2, 15),
+        datetime(2020, 11, 2, 16),
+    ]
+    index = TimeBandIndex(times)
+
+    assert index.times == sorted(times)
+    assert index.bands == [2, 3, 1]
+    assert index.band_for(datetime(2020, 11, 2, 15)) == 2
+    assert index.band_for(datetime(2020, 11, 2, 17, 59)) == 3
+    assert index.band_for(datetime(2020, 11, 2, 18)) == 1
+    assert index.band_for(datetime(2020, 11, 2, 14, 59)) is None
+    assert index.band_for(datetime(2020, 11, 2, 18, 1)) is None
+
+
+def test_band_for_range():
+    index = TimeBandIndex([datetime(2020, 11, 2, 15), datetime(2020, 11, 2, 16)])
+
+    assert (
+        index.band_for_range(datetime(2020, 11, 2, 14), datetime(2020, 11, 2, 15, 30))
+        == 1
+    )
+    assert (
+        index.band_for_range(datetime(2020, 11, 2, 16), datetime(2020, 11, 2, 17)) == 2
+    )
+    assert (
+        index.band_for_range(datetime(2020, 11, 2, 12), datetime(2020, 11, 2, 13))
+        is None
+    )
+
+
+def test_times_from_values():
+    times = times_from_values(
+        np.array([0, 1.5, 3]), "hours since 2020-10-05 18:00:00"
+    )
+    assert times == [
+        datetime(2020, 10, 5, 18),
+        datetime(2020, 10, 5, 19, 30),
+        datetime(2020, 10, 5, 21),
+    ]
+
+
+def test_values_from_times():
+    values = values_from_times(
+        [datetime(2020, 10, 5, 18), datetime(2020, 10, 5, 19, 30)],
+        "hours since 2020-10-05 18:00:00",
+    )
+    assert values == [0, 1.5]
+
+
+def test_index_from_netcdf():
+    test_file = Path(plugin_test_data_path("enfuser_no2_o3.nc"))
+    ds = gdal.Open(
+        f'NETCDF:"{test_file}":mass_concentration_of_nitrogen_dioxide_in_air_4902'
+    )
+    index = TimeBandIndex.from_gdal_dataset(ds)
+    ds = None
+
+    assert index.times == [
+        datetime(2020, 11, 19, 17),
+        datetime(2020, 11, 19, 17) + timedelta(hours=1),
+    ]
+    assert index.bands == [1, 2]
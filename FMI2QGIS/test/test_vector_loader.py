@@ -209,6 +209,8 @@ def test_convert_to_spatialite(tmpdir_pth, vector_loader):
     ]
     vector_loader.metadata.time_field_idx = 1
     vector_loader.metadata.layer_name = "BsWfsElement"
+    assert not vector_loader.is_refreshable
+
     result = vector_loader._convert_to_spatialite()
 
     expected_spatialite_file = Path(tmpdir_pth, "airquality.sqlite")
@@ -216,6 +218,7 @@ def test_convert_to_spatialite(tmpdir_pth, vector_loader):
     assert result
     assert expected_spatialite_file.exists()
     assert vector_loader.path_to_file == expected_spatialite_file
+    assert vector_loader.is_refreshable
 
 
 @pytest.mark.skipif(
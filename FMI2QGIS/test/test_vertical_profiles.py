@@ -0,0 +1,166 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from osgeo import gdal
+from qgis.core import (
+    QgsFeature,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessingContext,
+    QgsVectorLayer,
+)
+
+from ..core.grid.levels import (
+    CROSS_SECTION_LEVELS,
+    find_level_variable,
+    sample_levels,
+)
+from ..core.grid.sampling import bilinear_sample
+from ..core.processing.algorithms.cross_section import CrossSectionAlgorithm
+from ..core.processing.algorithms.sounding_profile import SoundingProfileAlgorithm
+
+
+@pytest.fixture
+def mem_ds():
+    ds = gdal.GetDriverByName("MEM").Create("", 4, 3, 2, gdal.GDT_Float32)
+    ds.SetGeoTransform((20.0, 1.0, 0.0, 63.0, 0.0, -1.0))
+    for b in range(1, 3):
+        ds.GetRasterBand(b).WriteArray(
+            np.arange(12, dtype=np.float32).reshape(3, 4) + 100 * b
+        )
+    return ds
+
+
+def test_bilinear_sample(mem_ds):
+    values = bilinear_sample(
+        mem_ds,
+        np.array([20.5, 21.0, 20.1, 30.0]),
+        np.array([62.5, 62.0, 62.9, 62.0]),
+        max_bytes=1,
+    )
+
+    np.testing.assert_allclose(values[:3], [[100, 200], [102.5, 202.5], [100, 200]])
+    assert np.isnan(values[3]).all()
+
+
+def test_bilinear_sample_skips_nodata(mem_ds):
+    mem_ds.GetRasterBand(1).SetNoDataValue(101)
+
+    values = bilinear_sample(mem_ds, np.array([21.0]), np.array([62.5]), [1])
+
+    np.testing.assert_allclose(values, [[100]])
+
+
+def test_sample_levels(hybrid_file):
+    level_bands = find_level_variable(hybrid_file)
+    ds = gdal.Open(level_bands.uri)
+
+    profiles = sample_levels(
+        ds, level_bands, np.array([24.0, 24.05]), np.array([60.05, 60.05])
+    )
+    ds = None
+
+    assert profiles.shape == (2, 3, 2)
+    np.testing.assert_allclose(profiles[1, :, 0], [1, 11, 21])
+    np.testing.assert_allclose(profiles[0, :, 1], [0.5, 10.5, 20.5])
+
+
+def _layer(definition: str, geometries) -> QgsVectorLayer:
+    layer = QgsVectorLayer(
+        f"{definition}?crs=EPSG:4326&field=name:string", "input", "memory"
+    )
+    features = []
+    for i, geometry in enumerate(geometries):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(geometry)
+        feature.setAttributes([str(i)])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def test_cross_section_algorithm(tmpdir_pth, hybrid_file, feedback):
+    line = _layer(
+        "LineString",
+        [
+            QgsGeometry.fromPolylineXY(
+                [QgsPointXY(24.0, 60.05), QgsPointXY(24.1, 60.05)]
+            )
+        ],
+    )
+    output = Path(tmpdir_pth, "cross_section.tif")
+    alg = CrossSectionAlgorithm()
+    alg.initAlgorithm()
+
+    results, ok = alg.run(
+        {
+            "INPUT": line,
+            "GRID": str(hybrid_file),
+            "VARIABLE": "air_temperature",
+            "NUM_OF_POINTS": 3,
+            "OUTPUT": str(output),
+        },
+        QgsProcessingContext(),
+        feedback,
+    )
+
+    assert ok
+    ds = gdal.Open(results["OUTPUT"])
+    assert (ds.RasterXSize, ds.RasterYSize, ds.RasterCount) == (3, 3, 2)
+    assert ds.GetMetadataItem(CROSS_SECTION_LEVELS) == "12,13,14"
+    assert ds.GetRasterBand(2).GetDescription() == "2020-11-19T13:00:00"
+    np.testing.assert_allclose(
+        ds.GetRasterBand(2).ReadAsArray(), [[1, 1.5, 2], [11, 11.5, 12], [21, 21.5, 22]]
+    )
+    ds = None
+
+
+def test_sounding_profile_algorithm(hybrid_file, feedback):
+    points = _layer(
+        "Point",
+        [
+            QgsGeometry.fromPointXY(QgsPointXY(24.05, 60.05)),
+            QgsGeometry.fromPointXY(QgsPointXY(0, 0)),
+        ],
+    )
+    alg = SoundingProfileAlgorithm()
+    alg.initAlgorithm()
+    context = QgsProcessingContext()
+
+    results, ok = alg.run(
+        {"INPUT": points, "GRID": str(hybrid_file), "OUTPUT": "memory:"},
+        context,
+        feedback,
+    )
+
+    assert ok
+    output = context.takeResultLayer(results["OUTPUT"])
+    features = list(output.getFeatures())
+    assert len(features) == 2 * 2 * 3
+    first = [f for f in features if f["name"] == "0"]
+    assert first[0]["time"].toPyDateTime() == datetime(2020, 11, 19, 12)
+    assert [f["level"] for f in first[:3]] == [12, 13, 14]
+    assert [f["value"] for f in first[:3]] == pytest.approx([0.5, 10.5, 20.5])
+    assert all(f["value"] is None for f in features if f["name"] == "1")
@@ -112,6 +112,9 @@ def test_sq_raster_expanding(wfs_url, wfs_version):
     }
     assert len(enfuser_sq.parameters["starttime"]._possible_values) > 3
     assert enfuser_sq.parameters["format"]._possible_values == ["netcdf"]
+    assert enfuser_sq.file_references
+    assert enfuser_sq.file_references[0].url.startswith("https://opendata.fmi.fi/")
+    assert enfuser_sq.expanded_at is not None
 
 
 def test_sq_raster_expanding2(wfs_url, wfs_version):
@@ -42,7 +42,7 @@ def test_wms_layer_handler(wms_url):
 
 
 def test_wms_layer_handler_url1(wms_layer_handler, test_wms_1):
-    url = wms_layer_handler._construct_qgis_url(test_wms_1)
+    url = wms_layer_handler.construct_qgis_url(test_wms_1)
     assert url == (
         "url=https://openwms.fmi.fi/geoserver/wms?request%3DGetCapabilities"
         "&layers=Radar:anjalankoski_dbzh&dpiMode=7&format=image/png"
@@ -53,7 +53,7 @@ def test_wms_layer_handler_url1(wms_layer_handler, test_wms_1):
 
 
 def test_wms_layer_handler_url_with_elevation(wms_layer_handler, test_wms_1):
-    url = wms_layer_handler._construct_qgis_url(test_wms_1, elevation=5.0)
+    url = wms_layer_handler.construct_qgis_url(test_wms_1, elevation=5.0)
     assert url == (
         "url=https://openwms.fmi.fi/geoserver/wms?request%3DGetCapabilities"
         "&layers=Radar:anjalankoski_dbzh&dpiMode=7&format=image/png"
@@ -65,7 +65,7 @@ def test_wms_layer_handler_url_with_elevation(wms_layer_handler, test_wms_1):
 
 
 def test_wms_layer_handler_url_with_invalid_elevation(wms_layer_handler, test_wms_1):
-    url = wms_layer_handler._construct_qgis_url(test_wms_1, elevation=6.0)
+    url = wms_layer_handler.construct_qgis_url(test_wms_1, elevation=6.0)
     assert url == (
         "url=https://openwms.fmi.fi/geoserver/wms?request%3DGetCapabilities"
         "&layers=Radar:anjalankoski_dbzh&dpiMode=7&format=image/png"
@@ -76,7 +76,7 @@ def test_wms_layer_handler_url_with_invalid_elevation(wms_layer_handler, test_wm
 
 
 def test_wms_layer_handler_url_2(wms_layer_handler, test_wms_1):
-    url = wms_layer_handler._construct_qgis_url(
+    url = wms_layer_handler.construct_qgis_url(
         test_wms_1,
         start_time=datetime.strptime("2020-10-04T09:40:00.00Z", test_wms_1.TIME_FORMAT),
     )
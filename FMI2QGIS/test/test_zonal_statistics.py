@@ -0,0 +1,103 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+# type: ignore
+import numpy as np
+import pytest
+from osgeo import gdal, ogr, osr
+
+from ..core.grid.zonal import HISTOGRAM_BINS, rasterize_zones, zonal_statistics
+
+
+@pytest.fixture
+def mem_ds():
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds = gdal.GetDriverByName("MEM").Create("", 4, 2, 2, gdal.GDT_Float32)
+    ds.SetGeoTransform((20.0, 1.0, 0.0, 62.0, 0.0, -1.0))
+    ds.SetProjection(srs.ExportToWkt())
+    data = np.array([[1, 2, 3, 4], [5, 6, 7, 8]], dtype=np.float32)
+    ds.GetRasterBand(1).WriteArray(data)
+    ds.GetRasterBand(2).WriteArray(data * 10)
+    ds.GetRasterBand(2).SetNoDataValue(80)
+    return ds
+
+
+def test_rasterize_zones(mem_ds):
+    left = ogr.CreateGeometryFromWkt(
+        "POLYGON ((20 60, 22 60, 22 62, 20 62, 20 60))"
+    ).ExportToWkb()
+    right = ogr.CreateGeometryFromWkt(
+        "POLYGON ((22 61, 24 61, 24 62, 22 62, 22 61))"
+    ).ExportToWkb()
+
+    labels = rasterize_zones(mem_ds, [left, right])
+
+    np.testing.assert_array_equal(labels, [[1, 1, 2, 2], [1, 1, 0, 0]])
+
+
+def test_rasterize_overlapping_zones(mem_ds):
+    left = ogr.CreateGeometryFromWkt(
+        "POLYGON ((20 60, 23 60, 23 62, 20 62, 20 60))"
+    ).ExportToWkb()
+    right = ogr.CreateGeometryFromWkt(
+        "POLYGON ((22 60, 24 60, 24 62, 22 62, 22 60))"
+    ).ExportToWkb()
+
+    labels = rasterize_zones(mem_ds, [left, right])
+
+    np.testing.assert_array_equal(labels, [[1, 1, 2, 2], [1, 1, 2, 2]])
+
+
+def test_zonal_statistics(mem_ds):
+    labels = np.array([[1, 1, 2, 2], [1, 1, 0, 2]])
+
+    stats = zonal_statistics(mem_ds, labels, 3, [50], max_bytes=1)
+
+    np.testing.assert_array_equal(stats["count"], [[4, 3, 0], [4, 2, 0]])
+    np.testing.assert_allclose(stats["mean"][:, :2], [[3.5, 5], [35, 35]])
+    np.testing.assert_allclose(stats["max"][:, :2], [[6, 8], [60, 40]])
+    np.testing.assert_allclose(
+        stats["p50"][:, :2], [[3.5, 4], [35, 35]], atol=50 / HISTOGRAM_BINS
+    )
+    assert np.isnan(stats["mean"][:, 2]).all()
+    assert np.isnan(stats["p50"][:, 2]).all()
+
+
+@pytest.mark.parametrize("percentile", [0, 10, 50, 90, 100])
+def test_zonal_percentiles_match_numpy(percentile):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3, 40, 50)).astype(np.float32)
+    data[:, :5, :5] = 1
+    ds = gdal.GetDriverByName("MEM").Create("", 50, 40, 3, gdal.GDT_Float32)
+    for b in range(3):
+        ds.GetRasterBand(b + 1).WriteArray(data[b])
+    labels = np.zeros((40, 50), dtype=np.int32)
+    labels[:20] = 1
+    labels[20:, :25] = 2
+    labels[:5, :5] = 3
+
+    stats = zonal_statistics(ds, labels, 3, [percentile], max_bytes=1000)
+
+    for zone in range(1, 4):
+        values = data[:, labels == zone]
+        expected = np.percentile(values, percentile, axis=1)
+        bin_width = (values.max(axis=1) - values.min(axis=1)) / HISTOGRAM_BINS
+        actual = stats[f"p{percentile}"][:, zone - 1]
+        assert (np.abs(actual - expected) <= bin_width + 1e-6).all()
@@ -0,0 +1,85 @@
+#  Gispo Ltd., hereby disclaims all copyright interest in the program FMI2QGIS
+#  Copyright (C) 2020-2021 Gispo Ltd (https://www.gispo.fi/).
+#
+#
+#  This file is part of FMI2QGIS.
+#
+#  FMI2QGIS is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FMI2QGIS is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with FMI2QGIS.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import Callable, Hashable, Optional
+
+from qgis.gui import QgsMapCanvas, QgsMapCanvasItem
+from qgis.PyQt.QtCore import QTimer
+from qgis.PyQt.QtGui import QImage, QPainter
+
+
+class CachedFrameItem(QgsMapCanvasItem):
+    """
+    Shows a pre-rendered frame on top of the canvas. The canvas does not render
+    the frame shown by the item, it renders only frames that are not cached.
+    """
+
+    def __init__(
+        self, canvas: QgsMapCanvas, current_key: Callable[[], Hashable]
+    ) -> None:
+        """
+        :param canvas: map canvas
+        :param current_key: returns the key of the frame the canvas renders next
+        """
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.current_key = current_key
+        self.image: Optional[QImage] = None
+        self.key: Optional[Hashable] = None
+        self.setZValue(-1)
+        self.hide()
+        # noinspection PyUnresolvedReferences
+        canvas.mapCanvasRefreshed.connect(self.clear)
+        # noinspection PyUnresolvedReferences
+        canvas.renderStarting.connect(self._skip_cached_render)
+
+    def show_frame(self, image: QImage, key: Hashable) -> None:
+        self.image = image
+        self.key = key
+        self.setRect(self.canvas.extent())
+        self.show()
+        self.update()
+
+    def clear(self) -> None:
+        if self.image is not None:
+            self.image = None
+            self.key = None
+            self.hide()
+
+    def remove(self) -> None:
+        # noinspection PyUnresolvedReferences
+        self.canvas.mapCanvasRefreshed.disconnect(self.clear)
+        # noinspection PyUnresolvedReferences
+        self.canvas.renderStarting.disconnect(self._skip_cached_render)
+        self.canvas.scene().removeItem(self)
+
+    def paint(self, painter: QPainter, option=None, widget=None) -> None:  # type: ignore # noqa ANN001
+        if self.image is not None:
+            painter.drawImage(self.boundingRect(), self.image)
+
+    def _skip_cached_render(self) -> None:
+        """
+        Cancels the render of the canvas if the item already shows the frame.
+        The canvas is refreshed only when a frame that is not cached is rendered,
+        e.g. after panning, and the item is cleared then.
+        """
+        if self.image is None or self.key != self.current_key():
+            return
+        # The render job is started after renderStarting has been emitted
+        QTimer.singleShot(0, self.canvas.stopRendering)
@@ -56,6 +56,7 @@ from qgis.PyQt.QtWidgets import (
 from qgis.utils import iface
 
 from ..core.processing.base_loader import BaseLoader
+from ..core.processing.file_reference_loader import FileReferenceLoader
 from ..core.processing.mesh_loader import MeshLoader
 from ..core.processing.raster_loader import RasterLoader
 from ..core.processing.vector_loader import VectorLoader
@@ -72,7 +73,8 @@ LOGGER = logging.getLogger(plugin_name())
 
 
 class MainDialog(QDialog, FORM_CLASS):  # type: ignore
-    temporal_layers_added = pyqtSignal(set)
+    temporal_layers_added = pyqtSignal(dict)
+    refreshable_layers_added = pyqtSignal(object)
 
     def __init__(self, parent: QWidget = None) -> None:
         QDialog.__init__(self, parent)
@@ -109,6 +111,7 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
             self.extent_group_box_bbox.setMapCanvas(iface.mapCanvas())
         self.extent_group_box_bbox.setOutputExtentFromCurrent()
         self.chk_box_add_to_map: QCheckBox
+        self.chk_box_auto_refresh: QCheckBox
         self.btn_output_dir_select: QgsFileWidget
         self.btn_output_dir_select.setFilePath(
             str(Path(QgsProject.absoluteFilePath(QgsProject.instance())).parent)
@@ -124,6 +127,7 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
             self.btn_load,
             self.btn_select,
             self.chk_box_add_to_map,
+            self.chk_box_auto_refresh,
             self.btn_clear_search,
         }
 
@@ -356,7 +360,16 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
             # output_path = Path(self.btn_output_dir_select.filePath())
             add_to_map: bool = self.chk_box_add_to_map.isChecked()
 
-            if self.selected_stored_query.type == StoredQuery.Type.Raster:
+            if self.selected_stored_query.type == StoredQuery.Type.Files:
+                self.task = FileReferenceLoader(
+                    "",
+                    output_path,
+                    Settings.FMI_WFS_URL.get(),
+                    Settings.FMI_WFS_VERSION.get(),
+                    self.selected_stored_query,
+                    add_to_map,
+                )
+            elif self.selected_stored_query.type == StoredQuery.Type.Raster:
                 self.task = MeshLoader(
                     "",
                     output_path,
@@ -407,7 +420,10 @@ class MainDialog(QDialog, FORM_CLASS):  # type: ignore
         self._enable_ui()
         if result and isinstance(self.task, RasterLoader):
             if self.task.is_manually_temporal:
-                self.temporal_layers_added.emit(self.task.layer_ids)
+                self.temporal_layers_added.emit(self.task.time_band_indices)
+        elif result and isinstance(self.task, VectorLoader):
+            if self.chk_box_auto_refresh.isChecked() and self.task.layer_ids:
+                self.refreshable_layers_added.emit(self.task)
 
     def _disable_ui(self) -> None:
         for item in self.responsive_items:
@@ -22,7 +22,9 @@ import re
 from typing import List, Optional
 
 from qgis.gui import QgsCollapsibleGroupBox, QgsDateTimeEdit, QgsFilterLineEdit
+from qgis.PyQt.QtCore import pyqtSignal
 from qgis.PyQt.QtWidgets import (
+    QCheckBox,
     QComboBox,
     QDialog,
     QDockWidget,
@@ -47,6 +49,8 @@ LOGGER = logging.getLogger(plugin_name())
 
 class WMSDialog(QDialog, FORM_CLASS):  # type: ignore
     # TODO: merge this class and dialog with main_dialog
+    # WMSLayer, layer id, start time, end time, elevation
+    refreshable_layer_added = pyqtSignal(object, str, object, object, object)
 
     def __init__(self, parent: QWidget = None) -> None:
         QDialog.__init__(self, parent)
@@ -68,6 +72,7 @@ class WMSDialog(QDialog, FORM_CLASS):  # type: ignore
         self.selected_wms_layer: Optional[WMSLayer] = None
 
         self.tbl_wms_layers: QTableWidget
+        self.chk_box_auto_refresh: QCheckBox
 
         self.__refresh_wms_layers()
 
@@ -183,9 +188,16 @@ class WMSDialog(QDialog, FORM_CLASS):  # type: ignore
             if self.selected_wms_layer.is_temporal:
                 self.__show_temporal_controller()
 
-            self.wms_layer_handler.add_to_map(
+            layer = self.wms_layer_handler.add_to_map(
                 self.selected_wms_layer, start_time, end_time, elevation
             )
+            if (
+                self.chk_box_auto_refresh.isChecked()
+                and self.selected_wms_layer.is_temporal
+            ):
+                self.refreshable_layer_added.emit(
+                    self.selected_wms_layer, layer.id(), start_time, end_time, elevation
+                )
         else:
             LOGGER.warning(
                 tr("Could not add to map"),